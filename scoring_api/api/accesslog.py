@@ -0,0 +1,110 @@
+import json
+import queue
+import random
+import logging
+
+from http import HTTPStatus
+from logging.handlers import QueueHandler, QueueListener
+
+from scoring_api.api.metrics import Counter
+
+QUEUE_SIZE = 10000
+SAMPLE_RATE = 1.0
+LOG_BODY = False
+REDACTED_FIELDS = frozenset({'phone', 'email', 'first_name', 'last_name', 'birthday'})
+REDACTED = '***'
+CONTEXT_FIELDS = ('request_id', 'method', 'code', 'has', 'nclients', 'nitems', 'error')
+
+access_logger = logging.getLogger('scoring_api.access')
+LOG_DROPPED = Counter('scoring_log_records_dropped_total', 'Log records dropped because the log queue was full.')
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if k in REDACTED_FIELDS and v not in (None, '') else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+class AccessRecord:
+    """
+    Message of an access log record, serialized to a JSON line only when the record is formatted,
+    i.e. in the log writer thread.
+    """
+    __slots__ = ('path', 'context', 'duration', 'body')
+
+    def __init__(self, path, context, duration, body=None):
+        self.path = path
+        self.context = context
+        self.duration = duration
+        self.body = body
+
+    def as_dict(self):
+        data = {'path': self.path}
+        data.update((k, self.context[k]) for k in CONTEXT_FIELDS if k in self.context)
+        data['duration_ms'] = round(self.duration * 1000, 3)
+        if self.body is not None:
+            data['body'] = redact(self.body)
+        return data
+
+    def __str__(self):
+        return json.dumps(self.as_dict(), ensure_ascii=False, default=str)
+
+
+def log_request(path, context, duration, body=None):
+    """
+    Log one request as a structured record. Successful requests are sampled with SAMPLE_RATE,
+    failed ones are always logged. Request body is attached, with personal data redacted, only if LOG_BODY is set.
+    """
+    if SAMPLE_RATE < 1 and context.get('code', 0) < HTTPStatus.BAD_REQUEST and random.random() >= SAMPLE_RATE:
+        return
+    if access_logger.isEnabledFor(logging.INFO):
+        access_logger.info(AccessRecord(path, context, duration, body if LOG_BODY else None))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Puts records to a bounded queue without blocking, records not fitting the queue are dropped and counted."""
+
+    def prepare(self, record):
+        # formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class LogPipeline:
+    """
+    Moves the root logger handlers behind a bounded queue served by a background writer thread,
+    so request threads never format records or wait for the log file.
+    Call `start` again in every forked worker, threads do not survive fork.
+    """
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.handlers = None
+        self.queue_handler = None
+        self.listener = None
+
+    def start(self):
+        root = logging.getLogger()
+        if self.handlers is None:
+            self.handlers = list(root.handlers)
+            for handler in self.handlers:
+                root.removeHandler(handler)
+        if self.queue_handler is not None:
+            root.removeHandler(self.queue_handler)
+        log_queue = queue.Queue(self.maxsize)
+        self.queue_handler = DroppingQueueHandler(log_queue)
+        root.addHandler(self.queue_handler)
+        self.listener = QueueListener(log_queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
@@ -0,0 +1,258 @@
+import signal
+import asyncio
+import logging
+
+from time import perf_counter
+
+from io import BytesIO
+from http import HTTPStatus
+from http.client import parse_headers
+
+from scoring_api.api import metrics, accesslog, codec, health, warmup, scoring
+from scoring_api.api.api import MainHTTPHandler, MethodRequest, OnlineScoreRequest, ClientsInterestsRequest, \
+    OnlineScoreBatchRequest, check_auth, check_content_length, make_response, make_batch_response, OK, BAD_REQUEST, \
+    FORBIDDEN, NOT_FOUND, PAYLOAD_TOO_LARGE, INVALID_REQUEST, INTERNAL_ERROR, KEEPALIVE_TIMEOUT, \
+    KEEPALIVE_MAX_REQUESTS, MAX_BODY_SIZE, MAX_JSON_DEPTH
+from scoring_api.api.exceptions import ValidationError, PayloadTooLargeError
+from scoring_api.api.scoring import get_score_async, get_scores_async, get_interests_many_async
+from scoring_api.api.store import AsyncRedisStore
+from scoring_api.api.server import DRAIN_TIMEOUT
+
+
+async def online_score_handler(request, ctx, store):
+    score = 42
+    if check_auth(request):
+        score_request = OnlineScoreRequest.load(request.arguments)
+        ctx.update(score_request.context)
+        if not request.is_admin:
+            score = await get_score_async(store=store, phone=score_request.phone, email=score_request.email,
+                                          birthday=score_request.birthday, gender=score_request.gender,
+                                          first_name=score_request.first_name, last_name=score_request.last_name)
+        return {'score': score}, OK
+    return None, FORBIDDEN
+
+
+async def online_score_batch_handler(request, ctx, store):
+    if check_auth(request):
+        batch_request = OnlineScoreBatchRequest.load(request.arguments)
+        ctx.update(batch_request.context)
+        items = batch_request.validate_items()
+        valid = [i.as_dict() for i in items if not isinstance(i, ValidationError)]
+        scores = [42] * len(valid) if request.is_admin else await get_scores_async(store, valid)
+        return make_batch_response(items, scores), OK
+    return None, FORBIDDEN
+
+
+async def clients_interests_handler(request, ctx, store):
+    if check_auth(request):
+        interests_request = ClientsInterestsRequest.load(request.arguments)
+        ctx.update(interests_request.context)
+        client_ids = interests_request.client_ids
+        return dict(zip(map(str, client_ids), await get_interests_many_async(store, client_ids))), OK
+    return None, FORBIDDEN
+
+
+async def method_handler(request, ctx, store):
+    response, code = None, INVALID_REQUEST
+    handlers = {
+        'online_score': online_score_handler,
+        'online_score_batch': online_score_batch_handler,
+        'clients_interests': clients_interests_handler
+    }
+    if body := request.get('body'):
+        try:
+            request = MethodRequest.load(body)
+            if handler := handlers.get(request.method):
+                ctx['method'] = request.method
+                response, code = await handler(store=store, ctx=ctx, request=request)
+            return response, code
+        except PayloadTooLargeError as err:
+            logging.debug(err)
+            return str(err), PAYLOAD_TOO_LARGE
+        except ValidationError as err:
+            logging.debug(err)
+            return str(err), code
+    return response, code
+
+
+class AsyncHTTPServer:
+    """
+    Minimal HTTP/1.1 server on asyncio streams serving the same routes as `MainHTTPHandler`.
+    Every connection is a task on one event loop, store calls never block the loop.
+    Connections are kept alive the same way as by `MainHTTPHandler`: until the client asks to close,
+    stays idle for `timeout` seconds or sends `max_requests` requests.
+    Request bodies over `max_body_size` bytes or `max_json_depth` levels of nesting are rejected with 413.
+    Open connections are tracked, so they can be drained on shutdown, see `drain`.
+    """
+    router = {
+        "method": method_handler
+    }
+
+    def __init__(self, store, timeout=KEEPALIVE_TIMEOUT, max_requests=KEEPALIVE_MAX_REQUESTS,
+                 max_body_size=MAX_BODY_SIZE, max_json_depth=MAX_JSON_DEPTH):
+        self.store = store
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.max_body_size = max_body_size
+        self.max_json_depth = max_json_depth
+        self.draining = False
+        # connection writer -> whether it waits for the next request
+        self.connections = {}
+        self._drained = asyncio.Event()
+
+    @staticmethod
+    async def write_response(writer, code, body=b'', content_type="application/json", close=True):
+        head = (f"HTTP/1.1 {code} {HTTPStatus(code).phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            requests_handled = 0
+            keep_alive = True
+            while keep_alive and not self.draining:
+                requests_handled += 1
+                last = bool(self.max_requests) and requests_handled >= self.max_requests
+                self.connections[writer] = True
+                keep_alive = await self.handle_request(reader, writer, last)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            if self.draining and not self.connections:
+                self._drained.set()
+            writer.close()
+
+    async def drain(self, timeout):
+        """
+        Closes idle persistent connections and waits no longer than `timeout` seconds for the requests in progress,
+        connections still open after the timeout are closed. Call when the server stopped accepting connections.
+        """
+        self.draining = True
+        for writer, idle in list(self.connections.items()):
+            if idle:
+                writer.transport.abort()
+        if not self.connections:
+            return
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("%s connections are not drained in %s s" % (len(self.connections), timeout))
+            for writer in list(self.connections):
+                writer.transport.abort()
+
+    async def handle_request(self, reader, writer, last=False):
+        """Serves one request of the connection, returns whether the connection is kept open."""
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.timeout)
+        self.connections[writer] = False
+        request_line, _, header_block = head.partition(b'\r\n')
+        try:
+            command, path, version = request_line.decode('latin-1').split()
+        except ValueError:
+            await self.write_response(writer, BAD_REQUEST)
+            return False
+        headers = parse_headers(BytesIO(header_block))
+        connection = headers.get('Connection', '').lower()
+        close = last or connection == 'close' or (version != 'HTTP/1.1' and connection != 'keep-alive')
+        if command == 'GET':
+            close = close or self.draining
+            await self.handle_get(writer, path, close)
+            return not close
+        if command != 'POST':
+            await self.write_response(writer, HTTPStatus.NOT_IMPLEMENTED.value)
+            return False
+
+        started = perf_counter()
+        response, code = {}, OK
+        context = {"request_id": MainHTTPHandler.get_request_id(headers)}
+        request, data_string = None, None
+        error = check_content_length(headers.get('Content-Length'), self.max_body_size)
+        if error is not None:
+            code = error
+            # the unread body can not be told apart from the next request
+            close = True
+        else:
+            if headers.get('Expect', '').lower() == '100-continue':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            try:
+                data_string = await reader.readexactly(int(headers['Content-Length']))
+                request = codec.loads(data_string)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                raise
+            except Exception as e:
+                logging.exception(e)
+                code = BAD_REQUEST
+            if request and codec.exceeds_depth(request, self.max_json_depth):
+                request, code = None, PAYLOAD_TOO_LARGE
+
+        if request:
+            route = path.strip("/")
+            if route in self.router:
+                try:
+                    response, code = await self.router[route]({"body": request, "headers": headers}, context,
+                                                              self.store)
+                except Exception as e:
+                    logging.exception("Unexpected error: %s" % e)
+                    code = INTERNAL_ERROR
+            else:
+                code = NOT_FOUND
+        r = make_response(response, code)
+        context.update(r)
+        close = close or self.draining
+        await self.write_response(writer, code, codec.dumps(r), close=close)
+        duration = perf_counter() - started
+        metrics.observe_request(context.get('method', 'unknown'), code, duration)
+        accesslog.log_request(path, context, duration, request)
+        return not close
+
+    async def handle_get(self, writer, path, close=True):
+        route = path.strip("/")
+        if route in MainHTTPHandler.get_router:
+            code, content_type, body = MainHTTPHandler.get_router[route](self.store)
+        else:
+            code, content_type = NOT_FOUND, "application/json"
+            body = codec.dumps(make_response(None, NOT_FOUND))
+        await self.write_response(writer, code, body, content_type, close)
+
+
+async def run_server(host, port, store=None, warmup_file=None, pool_size=0, drain_timeout=DRAIN_TIMEOUT,
+                     **server_kwargs):
+    """
+    Serves until SIGTERM or SIGINT, then stops accepting connections,
+    drains the open ones no longer than `drain_timeout` seconds and closes the store.
+    """
+    store = store or AsyncRedisStore(socket_connect_timeout=3)
+    await store.set_connection()
+    await store.start_invalidation()
+    if scoring.vocabulary.key is not None:
+        await scoring.vocabulary.load_async(store)
+    if warmup_file:
+        await warmup.warm_up_async(store, warmup_file)
+    await store.warm_pool(pool_size or AsyncRedisStore.max_connections)
+    health.READY.set()
+    http_server = AsyncHTTPServer(store, **server_kwargs)
+    server = await asyncio.start_server(http_server.handle_connection, host, port)
+    logging.info("Starting asyncio server at %s" % port)
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        async with server:
+            await stopped.wait()
+            health.READY.clear()
+            server.close()
+            logging.info("Draining connections")
+            await http_server.drain(drain_timeout)
+    finally:
+        await store.close()
+
+
+def serve(host, port, store=None, **server_kwargs):
+    try:
+        asyncio.run(run_server(host, port, store, **server_kwargs))
+    except KeyboardInterrupt:
+        pass
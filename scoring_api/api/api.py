@@ -1,66 +1,122 @@
-import json
+import hmac
 import logging
 import hashlib
 import uuid
+import socket
+import signal
+import threading
 
-from datetime import datetime
+from time import time, perf_counter
+from datetime import datetime, timedelta
 from optparse import OptionParser
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from scoring_api.api.scoring import get_interests, get_score
-from scoring_api.api.exceptions import ValidationError
-from scoring_api.api.store import RedisStore
+from http.server import BaseHTTPRequestHandler
+from scoring_api.api.scoring import get_interests_many, get_score, get_scores
+from scoring_api.api.exceptions import ValidationError, PayloadTooLargeError
+from scoring_api.api.store import RedisStore, AsyncRedisStore, CircuitBreaker, FAILURE_THRESHOLD, RECOVERY_TIMEOUT
+from scoring_api.api.sharding import ShardedStore, AsyncShardedStore
+from scoring_api.api.cache import LRUCache, CachePolicy, SCORE_CACHE_TTL, SCORE_CACHE_STALE_TTL
+from scoring_api.api import metrics, accesslog, codec, engine, health, warmup, scoring, invalidation
+from scoring_api.api.vocabulary import Vocabulary, VOCABULARY_KEY
+from scoring_api.api.sharedcache import SharedCache, SLOT_SIZE as SHARED_CACHE_SLOT_SIZE
+from scoring_api.api.server import ThreadPoolHTTPServer, serve_prefork, DRAIN_TIMEOUT
 from scoring_api.api.fields import BaseField, CharField, DateField, ClientIDsField, EmailField, PhoneField, \
-    BirthDayField, GenderField, ArgumentsField, GENDERS
+    BirthDayField, GenderField, ArgumentsField, ArgumentsListField, GENDERS
 
 SALT, ADMIN_LOGIN, ADMIN_SALT = 'Otus', 'admin', '42'
+AUTH_CACHE_SIZE = 10000
+KEEPALIVE_TIMEOUT = 5
+KEEPALIVE_MAX_REQUESTS = 1000
+MAX_BODY_SIZE = 1024 * 1024
+MAX_CLIENT_IDS = 1000
+MAX_JSON_DEPTH = 16
 
 OK = 200
 BAD_REQUEST = 400
 FORBIDDEN = 403
 NOT_FOUND = 404
+PAYLOAD_TOO_LARGE = 413
 INVALID_REQUEST = 422
 INTERNAL_ERROR = 500
+SERVICE_UNAVAILABLE = 503
 
 ERRORS = {
     BAD_REQUEST: "Bad Request",
     FORBIDDEN: "Forbidden",
     NOT_FOUND: "Not Found",
+    PAYLOAD_TOO_LARGE: "Payload Too Large",
     INVALID_REQUEST: "Invalid Request",
     INTERNAL_ERROR: "Internal Server Error",
 }
 
 
 class RequestMeta(type):
+    """
+    Compiles every Request subclass into a schema:
+    declared fields are moved from class attributes to `schema`, values are kept in `__slots__`
+    and every field is turned into a precompiled cleaning function applied in one pass by `load`.
+    """
     def __new__(mcs, name, bases, attrs):
-        fields = []
-        for k, v in attrs.items():
-            if isinstance(v, BaseField):
-                fields.append(k)
-        attrs['fields'] = fields
+        declared = {k: v for k, v in attrs.items() if isinstance(v, BaseField)}
+        schema = {}
+        for base in reversed(bases):
+            schema.update(getattr(base, 'schema', {}))
+        for k, v in declared.items():
+            del attrs[k]
+            v.__set_name__(None, k)
+            schema[k] = v
+        attrs['__slots__'] = tuple(attrs.get('__slots__', ())) + tuple(declared)
+        attrs['schema'] = schema
+        attrs['fields'] = list(schema)
+        attrs['cleaners'] = tuple((k, v.default, v.compile()) for k, v in schema.items())
+        attrs['validation_duration'] = metrics.VALIDATION_DURATION.labels(name)
         cls = super(RequestMeta, mcs).__new__(mcs, name, bases, attrs)
         return cls
 
 
 class Request(metaclass=RequestMeta):
+    __slots__ = ('context',)
+
     def __init__(self, **kwargs):
-        for name in self.fields:
-            setattr(self, name, kwargs.get(name))
+        for name, default, _ in self.cleaners:
+            value = kwargs.get(name)
+            setattr(self, name, default if value is None else value)
         self.context = {}
+        self.update_context()
+
+    @classmethod
+    def load(cls, data):
+        """Build request from dict cleaning every field in one pass, same as `cls(**data).validate_fields()`."""
+        started = perf_counter()
+        try:
+            request = cls.__new__(cls)
+            for name, _, clean in cls.cleaners:
+                setattr(request, name, clean(data.get(name)))
+            request.context = {}
+            request.update_context()
+            request.validate()
+            return request
+        finally:
+            cls.validation_duration.observe(perf_counter() - started)
 
     def validate_fields(self):
-        for name in self.fields:
-            obj = self.__class__.__dict__[name]
-            obj.validate(getattr(self, name))
+        for name, _, clean in self.cleaners:
+            setattr(self, name, clean(getattr(self, name)))
+        self.validate()
+
+    def validate(self):
+        """Cross-field checks, called after all fields are cleaned."""
+
+    def update_context(self):
+        pass
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.fields}
 
 
 class ClientsInterestsRequest(Request):
-    client_ids = ClientIDsField(required=True)
+    client_ids = ClientIDsField(required=True, max_length=MAX_CLIENT_IDS)
     date = DateField(required=False, nullable=True)
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.update_context()
-
     def update_context(self):
         nclients = len(self.client_ids) if self.client_ids else 0
         self.context.update({'nclients': nclients})
@@ -74,12 +130,7 @@ class OnlineScoreRequest(Request):
     birthday = BirthDayField(required=False, nullable=True)
     gender = GenderField(required=False, nullable=True)
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.update_context()
-
-    def validate_fields(self):
-        super().validate_fields()
+    def validate(self):
         if not any(
                 [
                     bool((self.gender in GENDERS.keys() and self.birthday)),
@@ -94,6 +145,32 @@ class OnlineScoreRequest(Request):
         self.context.update({'has': fields})
 
 
+class OnlineScoreBatchRequest(Request):
+    items = ArgumentsListField(required=True)
+
+    def update_context(self):
+        nitems = len(self.items) if self.items else 0
+        self.context.update({'nitems': nitems})
+
+    def validate_items(self):
+        """
+        Validate every item independently.
+        Returns list ordered as items with validated `OnlineScoreRequest` or `ValidationError` for each item.
+        """
+        result = []
+        for arguments in self.items:
+            try:
+                result.append(OnlineScoreRequest.load(arguments))
+            except ValidationError as err:
+                result.append(err)
+        return result
+
+
+def make_batch_response(items, scores):
+    scores = iter(scores)
+    return [{'error': str(i)} if isinstance(i, ValidationError) else {'score': next(scores)} for i in items]
+
+
 class MethodRequest(Request):
     account = CharField(required=False, nullable=True)
     login = CharField(required=True, nullable=True)
@@ -106,12 +183,50 @@ class MethodRequest(Request):
         return self.login == ADMIN_LOGIN
 
 
+# digests of verified (account, login) pairs, never expire as SALT is constant.
+# Plain dict keeps the lookup cheaper than the hashing it replaces, the oldest pair is dropped when full.
+auth_cache = {}
+auth_cache_lock = threading.Lock()
+# (starts_at, expires_at, digest) of the admin token for the current hour
+_admin_digest = (0.0, 0.0, b'')
+
+
+def get_admin_digest():
+    global _admin_digest
+    starts_at, expires_at, digest = _admin_digest
+    now = time()
+    # the hour is checked from both ends, so a clock stepped back does not get the digest of a later hour
+    if not starts_at <= now < expires_at:
+        hour = datetime.fromtimestamp(now).replace(minute=0, second=0, microsecond=0)
+        digest = hashlib.sha512((hour.strftime("%Y%m%d%H") + ADMIN_SALT).encode('utf-8')).hexdigest().encode()
+        _admin_digest = (hour.timestamp(), (hour + timedelta(hours=1)).timestamp(), digest)
+    return digest
+
+
+def reset_auth_cache():
+    """Forget the verified user digests and the admin digest."""
+    global _admin_digest
+    with auth_cache_lock:
+        auth_cache.clear()
+    _admin_digest = (0.0, 0.0, b'')
+
+
+@metrics.AUTH_DURATION.time()
 def check_auth(request):
+    token = request.token.encode('utf-8')
     if request.is_admin:
-        digest = hashlib.sha512((datetime.now().strftime("%Y%m%d%H") + ADMIN_SALT).encode('utf-8')).hexdigest()
-    else:
-        digest = hashlib.sha512((request.account + request.login + SALT).encode('utf-8')).hexdigest()
-    if digest == request.token:
+        return hmac.compare_digest(get_admin_digest(), token)
+    key = (request.account, request.login)
+    digest = auth_cache.get(key)
+    if digest is not None:
+        return hmac.compare_digest(digest, token)
+    digest = hashlib.sha512((request.account + request.login + SALT).encode('utf-8')).hexdigest().encode()
+    if hmac.compare_digest(digest, token):
+        # only verified pairs are remembered, so invalid tokens can not flush the cache
+        with auth_cache_lock:
+            if len(auth_cache) >= AUTH_CACHE_SIZE:
+                del auth_cache[next(iter(auth_cache))]
+            auth_cache[key] = digest
         return True
     return False
 
@@ -119,8 +234,7 @@ def check_auth(request):
 def online_score_handler(request, ctx, store):
     score = 42
     if check_auth(request):
-        score_request = OnlineScoreRequest(**request.arguments)
-        score_request.validate_fields()
+        score_request = OnlineScoreRequest.load(request.arguments)
         ctx.update(score_request.context)
         if not request.is_admin:
             score = get_score(store=store, phone=score_request.phone, email=score_request.email,
@@ -131,12 +245,23 @@ def online_score_handler(request, ctx, store):
     return None, FORBIDDEN
 
 
+def online_score_batch_handler(request, ctx, store):
+    if check_auth(request):
+        batch_request = OnlineScoreBatchRequest.load(request.arguments)
+        ctx.update(batch_request.context)
+        items = batch_request.validate_items()
+        valid = [i.as_dict() for i in items if not isinstance(i, ValidationError)]
+        scores = [42] * len(valid) if request.is_admin else get_scores(store, valid)
+        return make_batch_response(items, scores), OK
+    return None, FORBIDDEN
+
+
 def clients_interests_handler(request, ctx, store):
     if check_auth(request):
-        interests_request = ClientsInterestsRequest(**request.arguments)
-        interests_request.validate_fields()
+        interests_request = ClientsInterestsRequest.load(request.arguments)
         ctx.update(interests_request.context)
-        return {str(i): get_interests(store, i) for i in interests_request.client_ids}, OK
+        client_ids = interests_request.client_ids
+        return dict(zip(map(str, client_ids), get_interests_many(store, client_ids))), OK
     return None, FORBIDDEN
 
 
@@ -144,45 +269,172 @@ def method_handler(request, ctx, store):
     response, code = None, INVALID_REQUEST
     handlers = {
         'online_score': online_score_handler,
+        'online_score_batch': online_score_batch_handler,
         'clients_interests': clients_interests_handler
     }
     if body := request.get('body'):
         try:
-            request = MethodRequest(**body)
-            request.validate_fields()
+            request = MethodRequest.load(body)
             if handler := handlers.get(request.method):
+                ctx['method'] = request.method
                 response, code = handler(store=store, ctx=ctx, request=request)
             return response, code
+        except PayloadTooLargeError as err:
+            logging.debug(err)
+            return str(err), PAYLOAD_TOO_LARGE
         except ValidationError as err:
             logging.debug(err)
             return str(err), code
     return response, code
 
 
+def check_content_length(value, max_size):
+    """
+    Error code for a request body of `Content-Length: value` known before the body is read,
+    None if the body can be read.
+    """
+    if value is None or not (value.isascii() and value.isdigit()):
+        return BAD_REQUEST
+    # huge numbers are not converted to int at all
+    if len(value.lstrip('0')) > len(str(max_size)) or int(value) > max_size:
+        return PAYLOAD_TOO_LARGE
+    return None
+
+
+def make_response(response, code):
+    if code not in ERRORS:
+        return {"response": response, "code": code}
+    return {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+
+
+def metrics_handler(store):
+    return OK, metrics.CONTENT_TYPE, metrics.REGISTRY.render().encode('utf-8')
+
+
+def healthz_handler(store):
+    """Liveness: the process serves requests."""
+    return OK, "application/json", codec.dumps({"status": "ok"})
+
+
+def readyz_handler(store):
+    """
+    Readiness: warmed up, not shutting down, the store is connected and not failing fast.
+    Probes are answered from the process state, no store call is made.
+    """
+    if not health.READY.is_set():
+        status = "not ready"
+    elif not store.healthy:
+        status = "store unavailable"
+    else:
+        return OK, "application/json", codec.dumps({"status": "ready"})
+    return SERVICE_UNAVAILABLE, "application/json", codec.dumps({"status": status})
+
+
 class MainHTTPHandler(BaseHTTPRequestHandler):
     router = {
         "method": method_handler
     }
+    get_router = {
+        "metrics": metrics_handler,
+        "healthz": healthz_handler,
+        "readyz": readyz_handler,
+    }
     store = RedisStore(socket_connect_timeout=3)
+    # persistent connections: idle connection is closed after `timeout` seconds
+    # and after `max_requests` requests (0 - unlimited)
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    max_requests = KEEPALIVE_MAX_REQUESTS
+    # responses are written as headers and body, without Nagle's delay before the body
+    disable_nagle_algorithm = True
+    # larger and deeper request bodies are rejected with 413
+    max_body_size = MAX_BODY_SIZE
+    max_json_depth = MAX_JSON_DEPTH
+
+    def handle(self):
+        self.requests_handled = 0
+        super().handle()
+
+    def handle_one_request(self):
+        # a draining server closes persistent connections instead of waiting for their next request
+        if not self.server.set_idle(self.connection, True, kept_alive=self.requests_handled > 0):
+            self.close_connection = True
+            return
+        try:
+            super().handle_one_request()
+        except ConnectionError:
+            self.close_connection = True
+
+    def parse_request(self):
+        self.server.set_idle(self.connection, False)
+        return super().parse_request()
+
+    def handle_expect_100(self):
+        # a body going to be rejected is not asked for, do_POST responds without reading it
+        if check_content_length(self.headers.get('Content-Length'), self.max_body_size) is not None:
+            return True
+        return super().handle_expect_100()
+
+    def send_body(self, code, content_type, body, close=False):
+        self.requests_handled += 1
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if close or self.server.draining or (self.max_requests and self.requests_handled >= self.max_requests):
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_request(self, code='-', size='-'):
+        # every request is written to the access log by `accesslog.log_request`
+        pass
+
+    def log_error(self, format, *args):
+        if args and isinstance(args[0], socket.timeout):
+            # idle persistent connections time out routinely
+            return
+        self.log_message(format, *args)
+
+    def log_message(self, format, *args):
+        logging.warning("%s - " + format, self.address_string(), *args)
 
     @staticmethod
     def get_request_id(headers):
         return headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)
 
+    def do_GET(self):
+        path = self.path.strip("/")
+        if path in self.get_router:
+            code, content_type, body = self.get_router[path](self.store)
+        else:
+            code, content_type = NOT_FOUND, "application/json"
+            body = codec.dumps(make_response(None, NOT_FOUND))
+        self.send_body(code, content_type, body)
+
     def do_POST(self):
+        started = perf_counter()
         response, code = {}, OK
         context = {"request_id": self.get_request_id(self.headers)}
         request, data_string = None, None
-        try:
-            data_string = self.rfile.read(int(self.headers['Content-Length']))
-            request = json.loads(data_string)
-        except Exception as e:
-            logging.exception(e)
-            code = BAD_REQUEST
+        error = check_content_length(self.headers.get('Content-Length'), self.max_body_size)
+        if error is not None:
+            code = error
+            # the unread body can not be told apart from the next request
+            self.close_connection = True
+        else:
+            try:
+                data_string = self.rfile.read(int(self.headers['Content-Length']))
+                request = codec.loads(data_string)
+            except Exception as e:
+                logging.exception(e)
+                code = BAD_REQUEST
+                # the rest of the stream can not be trusted to start with the next request
+                self.close_connection = True
+            if request and codec.exceeds_depth(request, self.max_json_depth):
+                request, code = None, PAYLOAD_TOO_LARGE
 
         if request:
             path = self.path.strip("/")
-            logging.info("%s: %s %s" % (self.path, data_string, context["request_id"]))
             if path in self.router:
                 try:
                     response, code = self.router[path]({"body": request, "headers": self.headers}, context, self.store)
@@ -191,15 +443,12 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
                     code = INTERNAL_ERROR
             else:
                 code = NOT_FOUND
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        if code not in ERRORS:
-            r = {"response": response, "code": code}
-        else:
-            r = {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+        r = make_response(response, code)
         context.update(r)
-        self.wfile.write(json.dumps(r).encode('utf-8'))
+        self.send_body(code, "application/json", codec.dumps(r), close=self.close_connection)
+        duration = perf_counter() - started
+        metrics.observe_request(context.get('method', 'unknown'), code, duration)
+        accesslog.log_request(self.path, context, duration, request)
         return
 
 
@@ -208,14 +457,176 @@ def main():
     op.add_option("-p", "--port", action="store", type=int, default=8080)
     op.add_option("-l", "--log", action="store", default=None)
     op.add_option("--host", action="store", type=str, default="localhost")
+    op.add_option("-w", "--workers", action="store", type=int, default=1,
+                  help="number of pre-forked worker processes sharing the listening socket")
+    op.add_option("-t", "--threads", action="store", type=int, default=1,
+                  help="number of request handling threads per worker process")
+    op.add_option("--asyncio", action="store_true", default=False,
+                  help="serve requests from a single asyncio event loop")
+    op.add_option("--keepalive-timeout", action="store", type=float, default=KEEPALIVE_TIMEOUT,
+                  help="seconds an idle persistent connection is kept open")
+    op.add_option("--keepalive-max-requests", action="store", type=int, default=KEEPALIVE_MAX_REQUESTS,
+                  help="requests served over one persistent connection before it is closed, 0 - unlimited")
+    op.add_option("--max-body-size", action="store", type=int, default=MAX_BODY_SIZE,
+                  help="max request body size in bytes, larger requests get 413 without the body read")
+    op.add_option("--max-client-ids", action="store", type=int, default=MAX_CLIENT_IDS,
+                  help="max number of client_ids of clients_interests request")
+    op.add_option("--max-json-depth", action="store", type=int, default=MAX_JSON_DEPTH,
+                  help="max nesting depth of request body JSON")
+    op.add_option("--drain-timeout", action="store", type=float, default=DRAIN_TIMEOUT,
+                  help="seconds requests in progress are waited for on SIGTERM before their connections are closed")
+    op.add_option("--redis", action="append", default=None, metavar="PRIMARY[,REPLICA...]",
+                  help="Redis shard as host:port of the primary and optional replicas separated by commas, "
+                       "repeat for every shard, localhost:6379 by default")
+    op.add_option("--store-failure-threshold", action="store", type=int, default=FAILURE_THRESHOLD,
+                  help="failed Redis calls in a row after which store calls fail fast")
+    op.add_option("--store-recovery-timeout", action="store", type=float, default=RECOVERY_TIMEOUT,
+                  help="seconds before a probe call to Redis is made after calls started to fail fast")
+    op.add_option("--scoring-weights", action="store", default=None,
+                  help="JSON file with scoring weights, reloaded on SIGHUP")
+    op.add_option("--json-backend", action="store", choices=codec.BACKENDS, default=None,
+                  help="JSON library for request and response bodies, the fastest installed one by default")
+    op.add_option("--log-queue-size", action="store", type=int, default=accesslog.QUEUE_SIZE,
+                  help="max number of log records waiting for the writer thread, newer records are dropped")
+    op.add_option("--access-log-sample", action="store", type=float, default=accesslog.SAMPLE_RATE,
+                  help="share of successful requests written to the access log")
+    op.add_option("--access-log-body", action="store_true", default=False,
+                  help="add request body with redacted personal data to the access log")
+    op.add_option("--local-cache-size", action="store", type=int, default=0,
+                  help="max number of score cache entries kept in process memory, 0 disables the local tier")
+    op.add_option("--local-cache-ttl", action="store", type=float, default=60.0,
+                  help="max lifetime of a local score cache entry in seconds")
+    op.add_option("--score-cache-ttl", action="store", type=float, default=SCORE_CACHE_TTL,
+                  help="seconds a cached score is served as is")
+    op.add_option("--score-cache-stale-ttl", action="store", type=float, default=SCORE_CACHE_STALE_TTL,
+                  help="seconds an expired cached score is still served while it is recalculated in background, "
+                       "0 disables")
+    op.add_option("--score-key-migration", action="store_true", default=False,
+                  help="read scores missed under the canonical cache keys from the legacy keys, "
+                       "keep on for --score-cache-ttl after upgrade")
+    op.add_option("--interest-cache-size", action="store", type=int, default=0,
+                  help="max number of client interest sets kept in process memory, 0 disables the local tier")
+    op.add_option("--interest-cache-ttl", action="store", type=float, default=60.0,
+                  help="max lifetime of a local interest set in seconds")
+    op.add_option("--shared-cache", action="store_true", default=False,
+                  help="keep the local score and interest caches in memory shared by all the --workers, "
+                       "%s bytes per entry" % SHARED_CACHE_SLOT_SIZE)
+    op.add_option("--interest-vocabulary", action="store_true", default=False,
+                  help="decode interest ids of the compact interest sets with the Redis vocabulary")
+    op.add_option("--interest-cache-invalidation", action="store", choices=invalidation.MODES + ('off',),
+                  default=invalidation.AUTO,
+                  help="how changed interest sets are dropped from the local tier: Redis client tracking, "
+                       "keyspace notifications, auto - tracking if supported, off - by ttl only")
+    op.add_option("--redis-pool-size", action="store", type=int, default=0,
+                  help="Redis connections opened before serving, threads per worker by default")
+    op.add_option("--warmup-file", action="store", default=None,
+                  help="hot client ids and score keys loaded to the local cache tiers before serving")
+    op.add_option("--warmup-snapshot-interval", action="store", type=float, default=60.0,
+                  help="seconds between dumps of recently requested keys to --warmup-file, 0 disables")
+    op.add_option("--hot-keys-size", action="store", type=int, default=warmup.HOT_KEYS_SIZE,
+                  help="max number of recently requested keys in a --warmup-file snapshot")
     opts, args = op.parse_args()
     logging.basicConfig(filename=opts.log, level=logging.INFO,
                         format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
-    MainHTTPHandler.store.set_connection()
-    server = HTTPServer((opts.host, opts.port), MainHTTPHandler)
-    logging.info("Starting server at %s" % opts.port)
+    accesslog.SAMPLE_RATE, accesslog.LOG_BODY = opts.access_log_sample, opts.access_log_body
+    codec.use(opts.json_backend)
+    scoring.cache_policy = CachePolicy(opts.score_cache_ttl, opts.score_cache_stale_ttl)
+    scoring.key_migration = opts.score_key_migration
+    if opts.interest_vocabulary:
+        scoring.vocabulary = Vocabulary(VOCABULARY_KEY)
+    if opts.scoring_weights:
+        engine.set_engine(engine.load_engine(opts.scoring_weights))
+        signal.signal(signal.SIGHUP, lambda signum, frame: engine.reload(opts.scoring_weights))
+    log_pipeline = accesslog.LogPipeline(opts.log_queue_size)
+    log_pipeline.start()
     try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        pass
-    server.server_close()
+        run(opts, log_pipeline)
+    finally:
+        log_pipeline.stop()
+
+
+def parse_endpoint(endpoint):
+    host, _, port = endpoint.strip().rpartition(':')
+    return {'host': host or 'localhost', 'port': int(port)}
+
+
+def make_store(opts, asynchronous=False, threads=1):
+    """
+    Store of the `--redis` shards. Every shard gets its own circuit breaker,
+    the local score and interest caches are shared by all of them, and by all the workers with `--shared-cache`.
+    `threads` - number of threads using the synchronous store at once.
+    """
+    cache_class = SharedCache if opts.shared_cache else LRUCache
+    local_cache = cache_class(opts.local_cache_size, opts.local_cache_ttl) if opts.local_cache_size > 0 else None
+    interest_cache = (cache_class(opts.interest_cache_size, opts.interest_cache_ttl)
+                      if opts.interest_cache_size > 0 else None)
+    interest_invalidation = None
+    if interest_cache is not None and opts.interest_cache_invalidation != 'off':
+        interest_invalidation = opts.interest_cache_invalidation
+    store_class = AsyncRedisStore if asynchronous else RedisStore
+    specs = opts.redis or ['localhost:6379']
+    shards = []
+    for spec in specs:
+        primary, *replicas = [parse_endpoint(endpoint) for endpoint in spec.split(',')]
+        breaker = CircuitBreaker(opts.store_failure_threshold, opts.store_recovery_timeout)
+        shards.append(store_class(local_cache=local_cache, interest_cache=interest_cache, breaker=breaker,
+                                  interest_invalidation=interest_invalidation, replicas=replicas,
+                                  socket_connect_timeout=3, **primary))
+    if len(shards) == 1:
+        return shards[0]
+    names = [spec.split(',')[0].strip() for spec in specs]
+    if asynchronous:
+        return AsyncShardedStore(shards, names=names)
+    return ShardedStore(shards, names=names, threads=threads)
+
+
+def run(opts, log_pipeline):
+    ClientsInterestsRequest.schema['client_ids'].max_length = opts.max_client_ids
+    snapshot = None
+    if opts.warmup_file and opts.warmup_snapshot_interval > 0:
+        snapshot = warmup.SnapshotWriter(warmup.track(opts.hot_keys_size), opts.warmup_file,
+                                         opts.warmup_snapshot_interval)
+    if opts.asyncio:
+        from scoring_api.api.aioapi import serve
+        if snapshot is not None:
+            snapshot.start()
+        return serve(opts.host, opts.port, make_store(opts, asynchronous=True), warmup_file=opts.warmup_file,
+                     pool_size=opts.redis_pool_size, drain_timeout=opts.drain_timeout,
+                     timeout=opts.keepalive_timeout, max_requests=opts.keepalive_max_requests,
+                     max_body_size=opts.max_body_size, max_json_depth=opts.max_json_depth)
+    store = MainHTTPHandler.store = make_store(opts, threads=opts.threads)
+    MainHTTPHandler.timeout = opts.keepalive_timeout
+    MainHTTPHandler.max_requests = opts.keepalive_max_requests
+    MainHTTPHandler.max_body_size = opts.max_body_size
+    MainHTTPHandler.max_json_depth = opts.max_json_depth
+    store.set_connection()
+    if opts.workers <= 1:
+        store.start_invalidation()
+    if scoring.vocabulary.key is not None:
+        scoring.vocabulary.load(store)
+    if opts.warmup_file:
+        # local tiers filled before fork are shared by all the workers
+        warmup.warm_up(store, opts.warmup_file)
+    server = ThreadPoolHTTPServer((opts.host, opts.port), MainHTTPHandler, threads=opts.threads)
+    server.drain_timeout = opts.drain_timeout
+    logging.info("Starting server at %s, workers: %s, threads: %s, json: %s" % (opts.port, opts.workers, opts.threads,
+                                                                                codec.BACKEND))
+
+    def start_serving():
+        store.warm_pool(opts.redis_pool_size or opts.threads)
+        if snapshot is not None:
+            snapshot.start()
+        health.READY.set()
+
+    if opts.workers > 1:
+        def init_worker():
+            log_pipeline.start()
+            store.set_connection()
+            store.start_invalidation()
+            start_serving()
+
+        serve_prefork(server, opts.workers, init_worker=init_worker, on_terminate=health.READY.clear,
+                      on_stop=store.close)
+        return
+    start_serving()
+    server.serve(on_terminate=health.READY.clear, on_stop=store.close)
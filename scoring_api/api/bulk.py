@@ -0,0 +1,206 @@
+"""
+Offline bulk scoring of partner files with the `online_score` semantics.
+
+    $ python -m scoring_api.api.bulk --input partner.csv --output scores.csv --errors errors.csv --workers 8
+    $ cat partner.jsonl | python -m scoring_api.api.bulk --warm-cache --redis localhost:6379 > scores.jsonl
+
+Rows are read as a stream and validated and scored in chunks by a pool of processes, no more than
+`2 * workers` chunks are in flight, so memory use does not depend on the input size.
+Results are written in the input order, one row per valid input row, errors go to a separate file.
+With `--warm-cache` scores are read from and written to the Redis score cache exactly like by `online_score`,
+missed scores are written with pipelined SETs.
+"""
+import os
+import csv
+import sys
+import logging
+
+from collections import deque
+from itertools import islice
+from time import perf_counter
+from optparse import OptionParser
+from concurrent.futures import ProcessPoolExecutor
+
+from scoring_api.api import codec, engine, scoring
+from scoring_api.api.api import OnlineScoreRequest, make_store
+from scoring_api.api.exceptions import ValidationError
+from scoring_api.api.cache import CachePolicy, SCORE_CACHE_TTL, SCORE_CACHE_STALE_TTL
+from scoring_api.api.scoring import get_scores
+from scoring_api.api.store import FAILURE_THRESHOLD, RECOVERY_TIMEOUT
+
+CHUNK_SIZE = 1000
+FORMATS = ('jsonl', 'csv')
+
+_store = None
+
+
+def read_jsonl(stream):
+    """`(line number, row)` pairs, rows failed to parse are `ValidationError`."""
+    for line, data in enumerate(stream, 1):
+        data = data.strip()
+        if not data:
+            continue
+        try:
+            row = codec.loads(data)
+        except ValueError as e:
+            yield line, ValidationError(f'invalid JSON: {e}')
+            continue
+        yield line, row if isinstance(row, dict) else ValidationError('row must be JSON object')
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # CSV has only strings, empty cells are missing values and gender is a number as in JSON requests
+        row = {k: v for k, v in row.items() if v not in ('', None)}
+        if row.get('gender', '').isdigit():
+            row['gender'] = int(row['gender'])
+        yield reader.line_num, row
+
+
+def score_chunk(chunk, id_field=None):
+    """
+    Validates and scores a chunk of `(line, row)` pairs.
+    Returns `(line, id, score)` for valid rows and `(line, id, error)` for invalid ones, in the chunk order.
+    """
+    items = []
+    for line, row in chunk:
+        if isinstance(row, ValidationError):
+            items.append((line, None, row))
+            continue
+        try:
+            items.append((line, row.get(id_field), OnlineScoreRequest.load(row).as_dict()))
+        except ValidationError as e:
+            items.append((line, row.get(id_field), e))
+    records = [record for _, _, record in items if not isinstance(record, ValidationError)]
+    scores = iter(get_scores(_store, records) if _store is not None else engine.get_engine().score_many(records))
+    return [(line, row_id, str(record) if isinstance(record, ValidationError) else next(scores))
+            for line, row_id, record in items]
+
+
+def _init_worker(opts):
+    global _store
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname).1s %(message)s',
+                        datefmt='%Y.%m.%d %H:%M:%S')
+    if opts.scoring_weights:
+        engine.set_engine(engine.load_engine(opts.scoring_weights))
+    if opts.warm_cache:
+        scoring.cache_policy = CachePolicy(opts.score_cache_ttl, opts.score_cache_stale_ttl)
+        scoring.key_migration = opts.score_key_migration
+        _store = make_store(opts)
+        _store.set_connection()
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def score_stream(rows, opts):
+    """Scored chunks of `(line, row)` pairs in the input order, see `score_chunk`."""
+    if opts.workers <= 1:
+        _init_worker(opts)
+        for chunk in _chunks(rows, opts.chunk_size):
+            yield score_chunk(chunk, opts.id_field)
+        return
+    with ProcessPoolExecutor(opts.workers, initializer=_init_worker, initargs=(opts,)) as executor:
+        pending = deque()
+        for chunk in _chunks(rows, opts.chunk_size):
+            if len(pending) >= 2 * opts.workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(score_chunk, chunk, opts.id_field))
+        while pending:
+            yield pending.popleft().result()
+
+
+class JSONLWriter:
+    def __init__(self, stream, field):
+        self.stream = stream
+        self.field = field
+
+    def write(self, line, row_id, value):
+        row = {'line': line}
+        if row_id is not None:
+            row['id'] = row_id
+        row[self.field] = value
+        self.stream.write(codec.dumps(row).decode('utf-8') + '\n')
+
+
+class CSVWriter:
+    def __init__(self, stream, field):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(['line', 'id', field])
+
+    def write(self, line, row_id, value):
+        self.writer.writerow([line, '' if row_id is None else row_id, value])
+
+
+def run(opts, input_stream, output_stream, errors_stream):
+    reader, writer_class = (read_csv, CSVWriter) if opts.format == 'csv' else (read_jsonl, JSONLWriter)
+    results, errors = writer_class(output_stream, 'score'), writer_class(errors_stream, 'error')
+    nrows = nerrors = 0
+    started = perf_counter()
+    for chunk in score_stream(reader(input_stream), opts):
+        for line, row_id, value in chunk:
+            if isinstance(value, str):
+                errors.write(line, row_id, value)
+                nerrors += 1
+            else:
+                results.write(line, row_id, value)
+            nrows += 1
+    elapsed = perf_counter() - started
+    logging.info("Scored %s rows, %s invalid, in %.1f s, %.0f rows/s" % (nrows, nerrors, elapsed,
+                                                                        nrows / elapsed if elapsed else 0))
+    return nrows, nerrors
+
+
+def _open(path, mode, default):
+    if path in (None, '-'):
+        return default
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def main():
+    op = OptionParser(description="Score rows of JSONL or CSV file with the online_score validation and scoring.")
+    op.add_option("-i", "--input", action="store", default='-', help="input file, stdin by default")
+    op.add_option("-o", "--output", action="store", default='-', help="scores file, stdout by default")
+    op.add_option("-e", "--errors", action="store", default=None, help="invalid rows file, stderr by default")
+    op.add_option("-f", "--format", action="store", choices=FORMATS, default=None,
+                  help="input and output format, by input file extension by default")
+    op.add_option("--id-field", action="store", default=None, help="input field copied to output rows as id")
+    op.add_option("-w", "--workers", action="store", type=int, default=os.cpu_count() or 1)
+    op.add_option("--chunk-size", action="store", type=int, default=CHUNK_SIZE, help="rows per worker task")
+    op.add_option("--scoring-weights", action="store", default=None, help="JSON file with scoring weights")
+    op.add_option("--warm-cache", action="store_true", default=False,
+                  help="read and write the Redis score cache as online_score does")
+    op.add_option("--redis", action="append", default=None, metavar="PRIMARY[,REPLICA...]",
+                  help="Redis shard for --warm-cache, see the server options")
+    op.add_option("--score-cache-ttl", action="store", type=float, default=SCORE_CACHE_TTL,
+                  help="seconds a score written with --warm-cache is served as is")
+    op.add_option("--score-cache-stale-ttl", action="store", type=float, default=SCORE_CACHE_STALE_TTL)
+    op.add_option("--score-key-migration", action="store_true", default=False,
+                  help="read scores missed under the canonical keys from the legacy keys")
+    op.add_option("--store-failure-threshold", action="store", type=int, default=FAILURE_THRESHOLD)
+    op.add_option("--store-recovery-timeout", action="store", type=float, default=RECOVERY_TIMEOUT)
+    opts, args = op.parse_args()
+    opts.local_cache_size, opts.local_cache_ttl, opts.interest_cache_size, opts.shared_cache = 0, 0, 0, False
+    if opts.format is None:
+        opts.format = 'csv' if opts.input.endswith('.csv') else 'jsonl'
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname).1s %(message)s',
+                        datefmt='%Y.%m.%d %H:%M:%S')
+    input_stream = _open(opts.input, 'r', sys.stdin)
+    output_stream = _open(opts.output, 'w', sys.stdout)
+    errors_stream = _open(opts.errors, 'w', sys.stderr)
+    try:
+        run(opts, input_stream, output_stream, errors_stream)
+    finally:
+        for stream in (input_stream, output_stream, errors_stream):
+            if stream not in (sys.stdin, sys.stdout, sys.stderr):
+                stream.close()
+
+
+if __name__ == "__main__":
+    main()
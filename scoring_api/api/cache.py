@@ -0,0 +1,185 @@
+import os
+import asyncio
+import threading
+import weakref
+
+from time import monotonic, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LRUCache:
+    """
+    Bounded in-process cache with per entry expiration and least recently used eviction.
+    Safe to share between threads. Expired entries are dropped lazily on access or by eviction.
+    `generation` is incremented by every `invalidate` and `clear`, values read from the source before
+    an invalidation are not stored if `set` gets the generation seen before the read.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60.0):
+        """
+        `maxsize` - max number of entries.
+        `ttl` - max entry lifetime in seconds, shorter lifetime can be set per entry.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _after_fork(self):
+        # a thread of the parent could hold the lock at fork, the entries are kept: the cache is filled before fork
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, generation=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, keys):
+        """Drops `keys`, returns the number of dropped entries."""
+        with self._lock:
+            self.generation += 1
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+SCORE_CACHE_TTL = 60 * 60
+SCORE_CACHE_STALE_TTL = 60
+
+
+class CachePolicy:
+    """
+    Lifetime of the score cache entries.
+    An entry is fresh for `ttl` seconds and is kept in the cache for `stale_ttl` seconds more,
+    a stale entry is served at once while one background refresh per key recomputes and rewrites it.
+
+    Entries carry the time they stop being fresh, `<score>:<unix time>`. Plain scores written
+    without the time, e.g. when `stale_ttl` is 0, are fresh until the cache expires them.
+    """
+    FRESH, STALE, MISS = 'fresh', 'stale', 'miss'
+
+    def __init__(self, ttl=SCORE_CACHE_TTL, stale_ttl=SCORE_CACHE_STALE_TTL, refresh_threads=1):
+        """
+        `ttl` - seconds an entry is served as is.
+        `stale_ttl` - seconds an expired entry is still served while it is refreshed, 0 disables.
+        `refresh_threads` - threads running background refreshes of the synchronous server.
+        """
+        if ttl <= 0 or stale_ttl < 0:
+            raise ValueError(f'cache ttl must be positive and stale ttl not negative, got {ttl} and {stale_ttl}')
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_threads = refresh_threads
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def expire_ms(self):
+        """Expiry of the entries in the cache, milliseconds as taken by the store."""
+        return int((self.ttl + self.stale_ttl) * 1000)
+
+    def encode(self, score):
+        if not self.stale_ttl:
+            return score
+        return f'{score}:{round(time() + self.ttl)}'
+
+    def decode(self, value):
+        """`(score, state)` of a cached `value`, score is None for a miss."""
+        if not value:
+            return None, self.MISS
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        elif not isinstance(value, bytes):
+            return float(value), self.FRESH
+        score, _, fresh_until = value.partition(b':')
+        if fresh_until and int(fresh_until) <= time():
+            return float(score), self.STALE
+        return float(score), self.FRESH
+
+    def _start_refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _finish_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def refresh(self, key, func, *args):
+        """
+        Calls `func(*args)` in a background thread unless a refresh of `key` is already in progress.
+        Returns whether the refresh is started.
+        """
+        if not self._start_refresh(key):
+            return False
+        if self._executor is None:
+            with self._lock:
+                # created on first use, so a pre-fork worker starts its own threads
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.refresh_threads, thread_name_prefix='cache-refresh')
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda _: self._finish_refresh(key))
+        return True
+
+    def refresh_async(self, key, func, *args):
+        """Coroutine counterpart of `refresh`, runs `func(*args)` as a task of the running loop."""
+        if not self._start_refresh(key):
+            return False
+        task = asyncio.ensure_future(func(*args))
+        # the loop keeps only weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._finish_refresh(key))
+        return True
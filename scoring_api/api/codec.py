@@ -0,0 +1,86 @@
+"""
+JSON codec of request and response bodies.
+
+The fastest installed backend is used: orjson, ujson or the standard library json.
+`loads` accepts bytes, `dumps` returns UTF-8 encoded bytes, so bodies are not copied through an intermediate str
+where the backend allows it.
+"""
+import json
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def _orjson():
+    import orjson
+    return orjson.loads, orjson.dumps
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+    return ujson.loads, dumps
+
+
+def _json():
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def dumps(obj):
+        return encode(obj).encode('utf-8')
+    return json.loads, dumps
+
+
+_loaders = {'orjson': _orjson, 'ujson': _ujson, 'json': _json}
+
+
+def get_backend(name=None):
+    """
+    `(name, loads, dumps)` of the backend `name`, of the first installed one from BACKENDS if name is None.
+    Raises ImportError if the requested backend is not installed.
+    """
+    if name is not None:
+        if name not in _loaders:
+            raise ValueError(f"unknown JSON backend {name}, expected one of {BACKENDS}")
+        return (name,) + _loaders[name]()
+    for name in BACKENDS:
+        try:
+            return (name,) + _loaders[name]()
+        except ImportError:
+            continue
+
+
+def available_backends():
+    result = []
+    for name in BACKENDS:
+        try:
+            _loaders[name]()
+        except ImportError:
+            continue
+        result.append(name)
+    return result
+
+
+def exceeds_depth(obj, max_depth):
+    """Whether lists and dicts of decoded `obj` are nested deeper than `max_depth`, a scalar has depth 0."""
+    stack = [(obj, 1)]
+    while stack:
+        obj, depth = stack.pop()
+        if isinstance(obj, dict):
+            obj = obj.values()
+        elif not isinstance(obj, list):
+            continue
+        if depth > max_depth:
+            return True
+        stack.extend((item, depth + 1) for item in obj if isinstance(item, (dict, list)))
+    return False
+
+
+def use(name=None):
+    """Switch the module level `loads` and `dumps` to the backend `name`, see `get_backend`."""
+    global BACKEND, loads, dumps
+    BACKEND, loads, dumps = get_backend(name)
+
+
+BACKEND, loads, dumps = None, None, None
+use()
@@ -0,0 +1,140 @@
+"""
+Scoring engines. The engine in use is set once at startup by `set_engine` and may be replaced at runtime,
+e.g. by `reload` on SIGHUP; callers take it with `get_engine` on every call.
+"""
+import json
+import hashlib
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FIELDS = ('phone', 'email', 'birthday', 'gender', 'first_name', 'last_name')
+DEFAULT_WEIGHTS = {'phone': 1.5, 'email': 1.5, 'birthday_gender': 1.5, 'name': 0.5}
+# smaller batches are faster scored row by row than converted to columns
+VECTORIZE_MIN = 64
+
+
+class ScoringEngine:
+    # identifies the scores of the engine, a part of the score cache keys, so scores of replaced weights are not served
+    version = ''
+
+    def score(self, phone=None, email=None, birthday=None, gender=None, first_name=None, last_name=None):
+        raise NotImplementedError
+
+    def score_many(self, records):
+        """Scores of records given as dicts of `score` keyword arguments."""
+        return [self.score(**record) for record in records]
+
+    def score_columns(self, columns):
+        """
+        Scores of records given as columns: dict of equal length NumPy arrays keyed by `FIELDS`,
+        a missing column means the field is empty in every record. Returns float64 array.
+        """
+        raise NotImplementedError
+
+
+def _present(column):
+    """Boolean mask of non empty values of a column, empty are None, '', 0 and NaT."""
+    kind = column.dtype.kind
+    if kind == 'O':
+        return column.astype(bool)
+    if kind == 'M':
+        return ~np.isnat(column)
+    if kind in 'US':
+        return column != column.dtype.type()
+    if kind == 'f':
+        return (column != 0) & ~np.isnan(column)
+    return column != 0
+
+
+def to_columns(records):
+    return {name: np.array([record.get(name) for record in records], dtype=object) for name in FIELDS}
+
+
+class LinearScoringEngine(ScoringEngine):
+    """
+    Score is a sum of weights of the filled groups of fields:
+    `phone`, `email`, `birthday_gender` - both birthday and gender, `name` - both first and last name.
+    """
+
+    def __init__(self, weights=None):
+        weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        unknown = set(weights) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f"unknown weights {sorted(unknown)}, expected {sorted(DEFAULT_WEIGHTS)}")
+        for name, weight in weights.items():
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+                raise ValueError(f"weight {name} must be a number")
+        self.weights = weights
+        self.version = hashlib.blake2b(json.dumps(weights, sort_keys=True).encode('utf-8'), digest_size=4).hexdigest()
+        self.phone = weights['phone']
+        self.email = weights['email']
+        self.birthday_gender = weights['birthday_gender']
+        self.name = weights['name']
+
+    def score(self, phone=None, email=None, birthday=None, gender=None, first_name=None, last_name=None):
+        score = 0
+        if phone:
+            score += self.phone
+        if email:
+            score += self.email
+        if birthday and gender:
+            score += self.birthday_gender
+        if first_name and last_name:
+            score += self.name
+        # a float as the vectorized scores and the cached ones are, whatever the weights
+        return float(score)
+
+    def score_many(self, records):
+        if np is None or len(records) < VECTORIZE_MIN:
+            return super().score_many(records)
+        return self.score_columns(to_columns(records)).tolist()
+
+    def score_columns(self, columns):
+        if np is None:
+            raise RuntimeError("NumPy is required for columnar scoring")
+        size = len(next(iter(columns.values()))) if columns else 0
+        empty = np.zeros(size, dtype=bool)
+        present = {name: _present(np.asarray(columns[name])) if name in columns else empty for name in FIELDS}
+        # weights are added in the same order as by `score`, so the sums are equal to the last bit
+        scores = np.zeros(size)
+        scores += np.where(present['phone'], self.phone, 0.0)
+        scores += np.where(present['email'], self.email, 0.0)
+        scores += np.where(present['birthday'] & present['gender'], self.birthday_gender, 0.0)
+        scores += np.where(present['first_name'] & present['last_name'], self.name, 0.0)
+        return scores
+
+
+def load_engine(path):
+    """Engine with weights from JSON file, e.g. {"phone": 1.5, "email": 1.5, "birthday_gender": 1.5, "name": 0.5}."""
+    with open(path) as f:
+        weights = json.load(f)
+    if not isinstance(weights, dict):
+        raise ValueError("weights file must contain JSON object")
+    return LinearScoringEngine(weights)
+
+
+_engine = LinearScoringEngine()
+
+
+def get_engine():
+    return _engine
+
+
+def set_engine(engine):
+    global _engine
+    _engine = engine
+
+
+def reload(path):
+    """Replace the engine with the one loaded from `path`, the current engine is kept if loading fails."""
+    try:
+        set_engine(load_engine(path))
+    except (OSError, ValueError) as e:
+        logging.error("Scoring weights are not reloaded from %s: %s" % (path, e))
+        return False
+    logging.info("Scoring weights reloaded from %s: %s" % (path, _engine.weights))
+    return True
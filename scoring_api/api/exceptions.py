@@ -2,5 +2,9 @@ class ValidationError(Exception):
     pass
 
 
+class PayloadTooLargeError(ValidationError):
+    pass
+
+
 class StoreConnectionError(Exception):
     pass
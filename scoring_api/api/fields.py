@@ -1,8 +1,7 @@
 import abc
-from weakref import WeakKeyDictionary
 from datetime import datetime, timedelta
 
-from scoring_api.api.exceptions import ValidationError
+from scoring_api.api.exceptions import ValidationError, PayloadTooLargeError
 from scoring_api.api.validators import email_validator, type_validator, phone_validator, date_validator
 
 
@@ -22,29 +21,41 @@ class BaseField(abc.ABC):
     def __init__(self, required=False, nullable=False):
         self.required = required
         self.nullable = nullable
-        self.data = WeakKeyDictionary()
-
-    def __get__(self, instance, owner):
-        return self.data.get(instance, self.default)
-
-    def __set__(self, instance, value):
-        if value is None:
-            self.data[instance] = self.default
-        else:
-            self.data[instance] = value
 
     def __set_name__(self, owner, name):
         self.name = name
 
     def validate(self, value):
-        if value == self.default or value is None:
-            if self.required:
-                if not self.nullable:
-                    raise ValidationError(f'field {repr(self.name)} is required')
-            elif not self.nullable:
-                raise ValidationError(f'field {repr(self.name)} not be nullable')
+        self.clean(value)
+
+    def clean(self, value):
+        """
+        Validate value and return it converted to the field's python representation.
+        Field keeps no per-request state, so one instance is safe to share between threads.
+        """
+        return self.compile()(value)
+
+    def compile(self):
+        """
+        Build cleaning function for the current field settings
+        with required/nullable checks resolved once instead of on every call.
+        """
+        default, validate_value = self.default, self.validate_value
+        if self.required and not self.nullable:
+            empty_error = f'field {repr(self.name)} is required'
+        elif not self.required and not self.nullable:
+            empty_error = f'field {repr(self.name)} not be nullable'
         else:
-            self.validate_value(value)
+            empty_error = None
+
+        def clean(value):
+            if value is None or value == default:
+                if empty_error:
+                    raise ValidationError(empty_error)
+                return default
+            cleaned = validate_value(value)
+            return value if cleaned is None else cleaned
+        return clean
 
     @abc.abstractmethod
     def validate_value(self, value): pass
@@ -70,11 +81,7 @@ class PhoneField(CharField):
     @type_validator
     @phone_validator
     def validate_value(self, value):
-        try:
-            instance, _ = next(self.__dict__['data'].items())
-            self.data[instance] = str(value)
-        except StopIteration:
-            pass
+        return str(value)
 
 
 class ArgumentsField(BaseField):
@@ -85,24 +92,23 @@ class ArgumentsField(BaseField):
     def validate_value(self, value): pass
 
 
-class DateField(CharField):
-    dt_format = '%d.%m.%Y'
+class ArgumentsListField(BaseField):
+    default = []
+    types = (list,)
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.parsed_date = None
+    @type_validator
+    def validate_value(self, value):
+        if not all(map(lambda x: isinstance(x, dict), value)):
+            raise ValidationError(f'{repr(self.name)} field must contains only dict types')
 
-    def _post_validate(self, value):
-        try:
-            instance, _ = next(self.__dict__['data'].items())
-            self.data[instance] = self.parsed_date
-        except StopIteration:
-            pass
+
+class DateField(CharField):
+    dt_format = '%d.%m.%Y'
 
     @type_validator
     @date_validator(dt_format)
     def validate_value(self, value):
-        self._post_validate(value)
+        return value
 
 
 class BirthDayField(DateField):
@@ -113,12 +119,12 @@ class BirthDayField(DateField):
     @date_validator(dt_format)
     def validate_value(self, value):
         current_time = datetime.now()
-        if self.parsed_date + timedelta(days=365 * self.max_years) < current_time:
+        if value + timedelta(days=365 * self.max_years) < current_time:
             raise ValidationError(f'invalid value for {repr(self.name)} field, age over {self.max_years}')
-        elif self.parsed_date > current_time:
+        elif value > current_time:
             str_fmt = current_time.strftime(self.dt_format)
             raise ValidationError(f'invalid value for {repr(self.name)} field, value must be less {str_fmt}')
-        self._post_validate(value)
+        return value
 
 
 class GenderField(BaseField):
@@ -134,7 +140,14 @@ class ClientIDsField(BaseField):
     default = []
     types = (list,)
 
+    def __init__(self, required=False, nullable=False, max_length=None):
+        super().__init__(required, nullable)
+        # read on every call, so the limit can be changed after the request schema is compiled
+        self.max_length = max_length
+
     @type_validator
     def validate_value(self, value):
+        if self.max_length is not None and len(value) > self.max_length:
+            raise PayloadTooLargeError(f'{repr(self.name)} field must contain no more than {self.max_length} ids')
         if not all(map(lambda x: isinstance(x, int), value)):
             raise ValidationError(f'{repr(self.name)} field must contains only int types')
@@ -0,0 +1,4 @@
+import threading
+
+# set once the process is warmed up and may receive traffic
+READY = threading.Event()
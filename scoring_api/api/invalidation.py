@@ -0,0 +1,194 @@
+"""
+Server-assisted invalidation of the local interest cache.
+
+`InvalidationListener` subscribes to changes of the interest sets on a Redis primary and drops the changed sets
+from the local cache as soon as they are written, so the cache ttl only bounds staleness while the subscription
+is down. Changes are learned in one of two ways:
+
+- tracking: client side caching of Redis 6+ in the broadcasting mode. One connection is subscribed to
+  `__redis__:invalidate`, another one turns on `CLIENT TRACKING ... REDIRECT <subscriber id> BCAST PREFIX i:`,
+  so every write of an `i:` key is announced to the subscriber. redis-py speaks RESP2 only,
+  hence the redirection instead of RESP3 push messages on the same connection.
+- keyspace: keyspace notifications `__keyspace@<db>__:i:*`, the server must have `notify-keyspace-events`
+  with `K` and the `g`, `s`, `x` and `e` event classes, the listener does not change the server config.
+
+The whole cache is cleared when the subscription is lost and again when it is restored,
+since the changes made in between are not delivered.
+A change reaches the replicas a little later than the listener, so the store reads the sets invalidated
+in the last `REPLICA_LAG` seconds from the primary, see `InvalidationListener.changed_recently`.
+"""
+import os
+import logging
+import threading
+
+import redis
+from time import monotonic
+from itertools import takewhile
+from redis.exceptions import ConnectionError, TimeoutError, ResponseError
+
+from scoring_api.api.metrics import INTEREST_CACHE_INVALIDATIONS, INTEREST_CACHE_RESETS
+
+AUTO, TRACKING, KEYSPACE = 'auto', 'tracking', 'keyspace'
+MODES = (AUTO, TRACKING, KEYSPACE)
+PREFIX = b'i:'
+INVALIDATE_CHANNEL = b'__redis__:invalidate'
+KEYSPACE_EVENTS = 'gsxe'
+POLL_INTERVAL = 1.0
+PING_INTERVAL = 5.0
+SOCKET_TIMEOUT = 5.0
+RECONNECT_DELAY = 0.1
+RECONNECT_MAX_DELAY = 5.0
+REPLICA_LAG = 1.0
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Keeps `cache` in sync with the keys of `prefix` on one Redis primary, start it in every worker process.
+    `mode` - `tracking`, `keyspace` or `auto`: tracking if the server supports it, keyspace notifications otherwise.
+    `connection_kwargs` - connection args of the primary as for `RedisStore`.
+    """
+
+    def __init__(self, cache, mode=AUTO, prefix=PREFIX, **connection_kwargs):
+        if mode not in MODES:
+            raise ValueError(f'invalidation mode must be one of {", ".join(MODES)}')
+        super().__init__(name='interest-invalidation', daemon=True)
+        self.cache = cache
+        self.mode = mode
+        self.prefix = prefix
+        self.pid = os.getpid()
+        self.subscribed = threading.Event()
+        connection_kwargs = dict(connection_kwargs, decode_responses=False)
+        if connection_kwargs.get('socket_timeout') is None:
+            connection_kwargs['socket_timeout'] = SOCKET_TIMEOUT
+        self.pool = redis.ConnectionPool(**connection_kwargs)
+        self._connections = []
+        self._stopped = threading.Event()
+        # key -> time of its last invalidation, oldest first, kept for `REPLICA_LAG` seconds
+        self._changed = {}
+        self._reset_at = None
+
+    def run(self):
+        delay, restored = RECONNECT_DELAY, False
+        while not self._stopped.is_set():
+            try:
+                subscriber, tracker = self.subscribe()
+                if restored:
+                    self.reset()
+                self.subscribed.set()
+                delay = RECONNECT_DELAY
+                self.listen(subscriber, tracker)
+            except (ConnectionError, TimeoutError, OSError) as e:
+                if not self._stopped.is_set():
+                    logging.warning("Interest cache invalidation subscription lost: %s" % e)
+            except ResponseError as e:
+                logging.error("Interest cache is invalidated by ttl only, %s mode is not supported: %s"
+                              % (self.mode, e))
+                return
+            finally:
+                self.disconnect()
+            if self.subscribed.is_set():
+                self.subscribed.clear()
+                self.reset()
+            restored = True
+            self._stopped.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def stop(self):
+        self._stopped.set()
+
+    def connect(self):
+        connection = self.pool.make_connection()
+        self._connections.append(connection)
+        connection.connect()
+        return connection
+
+    def disconnect(self):
+        for connection in self._connections:
+            connection.disconnect()
+        self._connections = []
+
+    @staticmethod
+    def command(connection, *args):
+        connection.send_command(*args)
+        return connection.read_response()
+
+    def subscribe(self):
+        """Subscribed connection and the tracking one, None in the keyspace mode."""
+        if self.mode != KEYSPACE:
+            try:
+                return self.subscribe_tracking()
+            except ResponseError:
+                if self.mode == TRACKING:
+                    raise
+                self.disconnect()
+                logging.info("Client tracking is not supported, keyspace notifications are used instead")
+                self.mode = KEYSPACE
+        return self.subscribe_keyspace(), None
+
+    def subscribe_tracking(self):
+        subscriber = self.connect()
+        client_id = self.command(subscriber, 'CLIENT', 'ID')
+        self.command(subscriber, 'SUBSCRIBE', INVALIDATE_CHANNEL)
+        tracker = self.connect()
+        self.command(tracker, 'CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST', 'PREFIX', self.prefix)
+        return subscriber, tracker
+
+    def subscribe_keyspace(self):
+        subscriber = self.connect()
+        try:
+            _, events = self.command(subscriber, 'CONFIG', 'GET', 'notify-keyspace-events')
+            events = events.decode('ascii')
+            if 'K' not in events or not ('A' in events or set(KEYSPACE_EVENTS) <= set(events)):
+                logging.warning("Keyspace notifications are off for interest keys, set notify-keyspace-events "
+                                "to at least K%s" % KEYSPACE_EVENTS)
+        except ResponseError:
+            # CONFIG can be renamed or disabled, the server config is trusted then
+            pass
+        db = self.pool.connection_kwargs.get('db', 0)
+        self.channel_prefix = f'__keyspace@{db}__:'.encode('ascii')
+        self.command(subscriber, 'PSUBSCRIBE', self.channel_prefix + self.prefix + b'*')
+        return subscriber
+
+    def listen(self, subscriber, tracker=None):
+        """Handles messages of `subscriber` until stopped, pings `tracker` to find out its connection is lost."""
+        pinged_at = monotonic()
+        while not self._stopped.is_set():
+            if subscriber.can_read(timeout=POLL_INTERVAL):
+                self.handle(subscriber.read_response())
+            if tracker is not None and monotonic() - pinged_at >= PING_INTERVAL:
+                self.command(tracker, 'PING')
+                pinged_at = monotonic()
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == b'message' and message[1] == INVALIDATE_CHANNEL:
+            keys = message[2]
+            if keys is None:
+                # FLUSHALL or FLUSHDB
+                self.reset()
+            else:
+                self.invalidate(keys)
+        elif kind == b'pmessage':
+            self.invalidate([message[2][len(self.channel_prefix):]])
+
+    def invalidate(self, keys):
+        now, changed = monotonic(), self._changed
+        for key in keys:
+            changed.pop(key, None)
+            changed[key] = now
+        expired = [key for key, _ in takewhile(lambda item: now - item[1] >= REPLICA_LAG, changed.items())]
+        for key in expired:
+            del changed[key]
+        self.cache.invalidate(keys)
+        INTEREST_CACHE_INVALIDATIONS.inc(len(keys))
+
+    def reset(self):
+        self._reset_at = monotonic()
+        self.cache.clear()
+        INTEREST_CACHE_RESETS.inc()
+
+    def changed_recently(self, key):
+        """Whether `key` is invalidated less than `REPLICA_LAG` seconds ago, thread safe."""
+        now, changed_at, reset_at = monotonic(), self._changed.get(key), self._reset_at
+        return ((changed_at is not None and now - changed_at < REPLICA_LAG)
+                or (reset_at is not None and now - reset_at < REPLICA_LAG))
@@ -0,0 +1,215 @@
+import threading
+
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+
+    def render(self):
+        """Metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self.metrics):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Timer:
+    """Observes elapsed seconds into a histogram, usable as context manager and as decorator."""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(perf_counter() - self.started)
+
+    def __call__(self, func):
+        histogram = self.histogram
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started)
+        return wrapper
+
+
+class CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return Timer(self)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.setdefault(values, self.new_child())
+        return child
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def new_child(self):
+        return HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return Timer(self.labels())
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float('inf'),), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}'
+            labels = _format_labels(self.labelnames, values)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+REQUESTS = Counter('scoring_requests_total', 'HTTP requests by API method and response code.',
+                   ('method', 'code'))
+REQUEST_DURATION = Histogram('scoring_request_duration_seconds', 'HTTP request handling time by API method.',
+                             ('method',))
+VALIDATION_DURATION = Histogram('scoring_validation_duration_seconds', 'Request validation time by request type.',
+                                ('request',))
+AUTH_DURATION = Histogram('scoring_auth_duration_seconds', 'Token check time.')
+STORE_DURATION = Histogram('scoring_store_operation_duration_seconds',
+                           'Store operation time including retries.', ('operation',))
+STORE_RETRIES = Counter('scoring_store_retries_total', 'Store operation attempts failed with connection error.',
+                        ('operation',))
+STORE_FAILURES = Counter('scoring_store_failures_total', 'Store operations failed after all retries.',
+                         ('operation',))
+STORE_REJECTED = Counter('scoring_store_rejected_total', 'Store operations rejected by the open circuit breaker.',
+                         ('operation',))
+STORE_CIRCUIT_OPENED = Counter('scoring_store_circuit_opened_total', 'Times the store circuit breaker was opened.')
+SCORE_CACHE = Counter('scoring_score_cache_total', 'Score cache lookups by result: hit, stale or miss.', ('result',))
+SCORE_CACHE_REFRESHES = Counter('scoring_score_cache_refreshes_total',
+                                'Background refreshes of stale score cache entries by result, ok or error.',
+                                ('result',))
+SCORE_CACHE_MIGRATED = Counter('scoring_score_cache_migrated_total',
+                               'Cached scores found under the legacy key and copied to the canonical one.')
+INTEREST_CACHE = Counter('scoring_interest_cache_total', 'Local interest cache lookups by result: hit or miss.',
+                         ('result',))
+INTEREST_CACHE_INVALIDATIONS = Counter('scoring_interest_cache_invalidations_total',
+                                       'Interest keys changed in Redis and dropped from the local cache.')
+INTEREST_CACHE_RESETS = Counter('scoring_interest_cache_resets_total',
+                                'Local interest cache clears after lost invalidation subscription or flushed Redis.')
+SCORE_COALESCED = Counter('scoring_score_coalesced_total',
+                          'Score requests served by an identical concurrent request instead of own lookup.')
+
+
+def observe_request(method, code, duration):
+    REQUESTS.labels(method, str(code)).inc()
+    REQUEST_DURATION.labels(method).observe(duration)
@@ -1,32 +1,279 @@
 import hashlib
+import logging
+import unicodedata
 
+from scoring_api.api.cache import CachePolicy
+from scoring_api.api.engine import get_engine
+from scoring_api.api.metrics import SCORE_CACHE, SCORE_CACHE_REFRESHES, SCORE_CACHE_MIGRATED, SCORE_COALESCED
+from scoring_api.api.singleflight import SingleFlight, AsyncSingleFlight
+from scoring_api.api.vocabulary import Vocabulary
 
-def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+_cache_hits, _cache_misses, _cache_stale = SCORE_CACHE.labels('hit'), SCORE_CACHE.labels('miss'), \
+    SCORE_CACHE.labels('stale')
+_refreshed, _refresh_errors = SCORE_CACHE_REFRESHES.labels('ok'), SCORE_CACHE_REFRESHES.labels('error')
+# lifetime of the score cache entries, replaced with the configured one on start
+cache_policy = CachePolicy()
+# read scores missed under the canonical keys from the legacy keys and copy them, while the legacy entries live
+key_migration = False
+# interned interest names, ids of the compact interest sets too if the vocabulary has a Redis key
+vocabulary = Vocabulary()
+
+SCORE_KEY_PREFIX = b'u:'
+SCORE_KEY_DIGEST_SIZE = 12
+# concurrent requests of the same client share one cache lookup, calculation and cache write
+_score_flight, _score_flight_async = SingleFlight(SCORE_COALESCED), AsyncSingleFlight(SCORE_COALESCED)
+# recently requested client ids and score keys, `warmup.HotKeys` if tracking is enabled
+hot_keys = None
+
+
+def _track(keys):
+    if hot_keys is not None:
+        hot_keys.add(keys)
+
+
+def interests_key(cid):
+    return f'i:{cid}'.encode('utf-8')
+
+
+def canonical_name(name):
+    """Name compared regardless of case, Unicode forms and whitespace."""
+    if not name:
+        return ''
+    if not name.isascii():
+        name = unicodedata.normalize('NFKC', name)
+    return ' '.join(name.casefold().split())
+
+
+def canonical_phone(phone):
+    """Phone digits, the same for int and str phones."""
+    if not phone:
+        return ''
+    phone = str(phone)
+    return phone if phone.isdigit() else ''.join(c for c in phone if c.isdigit())
+
+
+def get_score_key(phone, birthday=None, first_name=None, last_name=None):
+    """
+    Binary score cache key of the canonical client data, equal for the spellings of the same client,
+    `SCORE_KEY_PREFIX` and a short blake2b digest. The version of the engine weights is a part of the key,
+    so the scores cached before a reload of the weights are not served.
+    """
+    key_parts = (
+        canonical_name(first_name),
+        canonical_name(last_name),
+        canonical_phone(phone),
+        birthday.strftime("%Y%m%d") if birthday else "",
+        get_engine().version,
+    )
+    digest = hashlib.blake2b("\x1f".join(key_parts).encode("utf-8"), digest_size=SCORE_KEY_DIGEST_SIZE).digest()
+    return SCORE_KEY_PREFIX + digest
+
+
+def get_legacy_score_key(phone, birthday=None, first_name=None, last_name=None):
+    """Key of the raw client data the scores were cached with before the canonical keys, see `key_migration`."""
     key_parts = [
         first_name or "",
         last_name or "",
-        phone or "",
+        str(phone) if phone else "",
         birthday.strftime("%Y%m%d") if birthday else "",
     ]
-    key = "uid:" + hashlib.md5("".join(key_parts).encode("utf-8")).hexdigest()
+    return "uid:" + hashlib.md5("".join(key_parts).encode("utf-8")).hexdigest()
+
+
+def _record_keys(records, get_key):
+    return [get_key(r.get('phone'), r.get('birthday'), r.get('first_name'), r.get('last_name')) for r in records]
+
+
+def calculate_score(phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    return get_engine().score(phone, email, birthday, gender, first_name, last_name)
+
+
+def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    key = get_score_key(phone, birthday, first_name, last_name)
+    _track((key,))
+    return _score_flight.do(key, _get_score, store, key, phone, email, birthday, gender, first_name, last_name)
+
+
+def _get_score(store, key, phone, email, birthday, gender, first_name, last_name):
     # try get from cache,
     # fallback to heavy calculation in case of cache miss
-    score = store.cache_get(key) or 0
-    if score:
-        return float(score)
-    if phone:
-        score += 1.5
-    if email:
-        score += 1.5
-    if birthday and gender:
-        score += 1.5
-    if first_name and last_name:
-        score += 0.5
-    # cache for 60 minutes
-    store.cache_set(key, score, 60 * 60)
+    score, state = cache_policy.decode(store.cache_get(key))
+    if state == CachePolicy.MISS and key_migration:
+        score, state = cache_policy.decode(store.cache_get(get_legacy_score_key(phone, birthday, first_name,
+                                                                                last_name)))
+        if score is not None:
+            SCORE_CACHE_MIGRATED.inc()
+            store.cache_set(key, cache_policy.encode(score), cache_policy.expire_ms)
+    if state == CachePolicy.FRESH:
+        _cache_hits.inc()
+        return score
+    if state == CachePolicy.STALE:
+        _cache_stale.inc()
+        cache_policy.refresh(key, _refresh_score, store, key, phone, email, birthday, gender, first_name, last_name)
+        return score
+    _cache_misses.inc()
+    score = calculate_score(phone, email, birthday, gender, first_name, last_name)
+    store.cache_set(key, cache_policy.encode(score), cache_policy.expire_ms)
     return score
 
 
+def _refresh_score(store, key, *args):
+    try:
+        store.cache_set(key, cache_policy.encode(calculate_score(*args)), cache_policy.expire_ms)
+    except Exception as e:
+        logging.warning("Score cache entry %s is not refreshed: %s" % (key, e))
+        _refresh_errors.inc()
+        return
+    _refreshed.inc()
+
+
+async def get_score_async(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    key = get_score_key(phone, birthday, first_name, last_name)
+    _track((key,))
+    return await _score_flight_async.do(key, _get_score_async, store, key, phone, email, birthday, gender,
+                                        first_name, last_name)
+
+
+async def _get_score_async(store, key, phone, email, birthday, gender, first_name, last_name):
+    score, state = cache_policy.decode(await store.cache_get(key))
+    if state == CachePolicy.MISS and key_migration:
+        score, state = cache_policy.decode(await store.cache_get(get_legacy_score_key(phone, birthday, first_name,
+                                                                                      last_name)))
+        if score is not None:
+            SCORE_CACHE_MIGRATED.inc()
+            await store.cache_set(key, cache_policy.encode(score), cache_policy.expire_ms)
+    if state == CachePolicy.FRESH:
+        _cache_hits.inc()
+        return score
+    if state == CachePolicy.STALE:
+        _cache_stale.inc()
+        cache_policy.refresh_async(key, _refresh_score_async, store, key, phone, email, birthday, gender,
+                                   first_name, last_name)
+        return score
+    _cache_misses.inc()
+    score = calculate_score(phone, email, birthday, gender, first_name, last_name)
+    await store.cache_set(key, cache_policy.encode(score), cache_policy.expire_ms)
+    return score
+
+
+async def _refresh_score_async(store, key, *args):
+    try:
+        await store.cache_set(key, cache_policy.encode(calculate_score(*args)), cache_policy.expire_ms)
+    except Exception as e:
+        logging.warning("Score cache entry %s is not refreshed: %s" % (key, e))
+        _refresh_errors.inc()
+        return
+    _refreshed.inc()
+
+
+def _score_many(keys, records, cached):
+    """
+    Scores of `records` from the `cached` values and scores to write to the cache by key.
+    Stale entries are recomputed along with the missed ones, the batch is written with one pipeline anyway.
+    """
+    scores, positions, nstale = [], [], 0
+    for i, value in enumerate(cached):
+        score, state = cache_policy.decode(value)
+        if state != CachePolicy.FRESH:
+            positions.append(i)
+            nstale += state == CachePolicy.STALE
+        scores.append(score)
+    missed = {}
+    for i, score in zip(positions, get_engine().score_many([records[i] for i in positions])):
+        scores[i] = score
+        missed[keys[i]] = cache_policy.encode(score)
+    _cache_hits.inc(len(scores) - len(positions))
+    _cache_misses.inc(len(positions) - nstale)
+    _cache_stale.inc(nstale)
+    return scores, missed
+
+
+def _missed_positions(cached):
+    return [i for i, value in enumerate(cached) if not value] if key_migration else []
+
+
+def _copy_legacy(keys, cached, positions, legacy_values):
+    """Puts values found under the legacy keys to `cached`, returns them by canonical key to be written."""
+    migrated = {}
+    for i, value in zip(positions, legacy_values):
+        score, _ = cache_policy.decode(value)
+        if score is not None:
+            cached[i] = value
+            migrated[keys[i]] = cache_policy.encode(score)
+    SCORE_CACHE_MIGRATED.inc(len(migrated))
+    return migrated
+
+
+def get_scores(store, records):
+    """
+    Batch `get_score` for list of records with `get_score` keyword arguments.
+    Reads all cached scores with one MGET and writes the missed ones with one pipelined SET.
+    """
+    keys = _record_keys(records, get_score_key)
+    _track(keys)
+    cached, migrated = store.cache_get_many(keys), {}
+    if positions := _missed_positions(cached):
+        legacy_keys = _record_keys([records[i] for i in positions], get_legacy_score_key)
+        migrated = _copy_legacy(keys, cached, positions, store.cache_get_many(legacy_keys))
+    scores, missed = _score_many(keys, records, cached)
+    missed.update(migrated)
+    if missed:
+        store.cache_set_many(missed, cache_policy.expire_ms)
+    return scores
+
+
+async def get_scores_async(store, records):
+    keys = _record_keys(records, get_score_key)
+    _track(keys)
+    cached, migrated = await store.cache_get_many(keys), {}
+    if positions := _missed_positions(cached):
+        legacy_keys = _record_keys([records[i] for i in positions], get_legacy_score_key)
+        migrated = _copy_legacy(keys, cached, positions, await store.cache_get_many(legacy_keys))
+    scores, missed = _score_many(keys, records, cached)
+    missed.update(migrated)
+    if missed:
+        await store.cache_set_many(missed, cache_policy.expire_ms)
+    return scores
+
+
+def decode_interests(r):
+    return vocabulary.decode(r) if r else []
+
+
+def _decode_many(replies):
+    return [decode_interests(r) for r in replies]
+
+
+def _decode_sync(store, replies):
+    """Decoded interest sets, the vocabulary is reloaded and the sets decoded again if they have new ids."""
+    result = _decode_many(replies)
+    if vocabulary.unknown and vocabulary.reload_due() and vocabulary.load(store):
+        result = _decode_many(replies)
+    return result
+
+
+async def _decode_async(store, replies):
+    result = _decode_many(replies)
+    if vocabulary.unknown and vocabulary.reload_due() and await vocabulary.load_async(store):
+        result = _decode_many(replies)
+    return result
+
+
 def get_interests(store, cid):
-    r = store.get(f'i:{cid}'.encode('utf-8'))
-    return [i.decode('utf-8') for i in r] if r else []
+    _track((cid,))
+    return _decode_sync(store, [store.get(interests_key(cid))])[0]
+
+
+async def get_interests_async(store, cid):
+    _track((cid,))
+    return (await _decode_async(store, [await store.get(interests_key(cid))]))[0]
+
+
+def get_interests_many(store, cids):
+    _track(cids)
+    return _decode_sync(store, store.get_many([interests_key(cid) for cid in cids]))
+
+
+async def get_interests_many_async(store, cids):
+    _track(cids)
+    return await _decode_async(store, await store.get_many([interests_key(cid) for cid in cids]))
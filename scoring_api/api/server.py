@@ -0,0 +1,228 @@
+import os
+import sys
+import socket
+import select
+import signal
+import logging
+import threading
+
+from time import monotonic, sleep
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+DRAIN_TIMEOUT = 10.0
+# a worker exiting sooner after its start is respawned with a delay doubled from RESPAWN_DELAY up to RESPAWN_MAX_DELAY
+MIN_UPTIME = 5.0
+RESPAWN_DELAY = 0.1
+RESPAWN_MAX_DELAY = 10.0
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """
+    HTTPServer handling every accepted connection in a fixed size pool of worker threads,
+    so one slow store round trip does not block the other clients.
+    Open connections are tracked, so `serve` can stop the server gracefully, see `drain`.
+    A persistent connection waiting for its next request holds a thread, so when all the threads are taken
+    and another connection is accepted, a kept alive connection with no request pending is closed to free one.
+    """
+    drain_timeout = DRAIN_TIMEOUT
+
+    def __init__(self, server_address, handler_class, threads=1, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http-worker')
+        self.draining = False
+        # connection -> whether it waits for the next request, None while it waits for a thread
+        self._connections = {}
+        self._connections_changed = threading.Condition()
+        self._queued = 0
+        # idle connections which have handled a request, a new one is about to send its first request
+        self._kept_alive = set()
+
+    def process_request(self, request, client_address):
+        with self._connections_changed:
+            self._connections[request] = None
+            self._queued += 1
+            if len(self._connections) - self._queued >= self.threads:
+                self._close_idle_connection()
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def _close_idle_connection(self):
+        for request in self._kept_alive:
+            poll = select.poll()
+            poll.register(request, select.POLLIN)
+            if not poll.poll(0):
+                self._kept_alive.discard(request)
+                self._connections[request] = False
+                try:
+                    # the blocked read of its handler returns at once and the thread is released
+                    request.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+                return
+
+    def process_request_thread(self, request, client_address):
+        with self._connections_changed:
+            self._connections[request] = False
+            self._queued -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._connections_changed:
+                self._connections.pop(request, None)
+                self._kept_alive.discard(request)
+                self._connections_changed.notify_all()
+
+    def set_idle(self, request, idle, kept_alive=False):
+        """
+        Marks a connection as waiting for the next request or as handling one,
+        `kept_alive` - the connection waits after a response, so it can be closed when a thread is needed.
+        Returns False if the connection should be closed instead of waiting,
+        as the server is draining or, for a kept alive one, other connections wait for a thread.
+        """
+        with self._connections_changed:
+            if request in self._connections:
+                self._connections[request] = idle
+                if idle and kept_alive:
+                    self._kept_alive.add(request)
+                else:
+                    self._kept_alive.discard(request)
+            return not (idle and (self.draining or kept_alive and self._queued))
+
+    def drain(self, timeout):
+        """
+        Stops accepting connections, closes idle persistent connections
+        and waits no longer than `timeout` seconds for the requests in progress.
+        Connections still open after the timeout are closed.
+        Call when `serve_forever` has returned.
+        """
+        self.draining = True
+        self.socket.close()
+        deadline = monotonic() + timeout
+        with self._connections_changed:
+            self._shutdown_connections(only_idle=True)
+            while self._connections and monotonic() < deadline:
+                self._connections_changed.wait(deadline - monotonic())
+            if self._connections:
+                logging.warning("%s connections are not drained in %s s" % (len(self._connections), timeout))
+                self._shutdown_connections(only_idle=False)
+
+    def _shutdown_connections(self, only_idle):
+        for request, idle in self._connections.items():
+            if idle or not only_idle:
+                try:
+                    # a blocked read of the handler returns at once, the response in progress can still be sent
+                    request.shutdown(socket.SHUT_RD if only_idle else socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def serve(self, on_terminate=None, on_stop=None):
+        """
+        Serves until SIGTERM or SIGINT, then drains the connections no longer than `drain_timeout`.
+        `on_terminate` is called at once on the signal, `on_stop` - after the server is closed.
+        """
+        def terminate(signum, frame):
+            self.draining = True
+            if on_terminate:
+                on_terminate()
+            # shutdown waits for serve_forever loop, which runs in this thread
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, terminate)
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            if on_terminate:
+                on_terminate()
+        logging.info("Draining connections of %s" % os.getpid())
+        self.drain(self.drain_timeout)
+        self.server_close()
+        if on_stop:
+            on_stop()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+def _run_worker(server, init_worker, hup_handler, on_terminate, on_stop):
+    signal.signal(signal.SIGHUP, hup_handler)
+    code = 0
+    try:
+        if init_worker:
+            init_worker()
+        server.serve(on_terminate, on_stop)
+    except Exception as err:
+        logging.exception("Worker %s failed: %s" % (os.getpid(), err))
+        code = 1
+        server.server_close()
+    finally:
+        os._exit(code)
+
+
+def serve_prefork(server, workers, init_worker=None, on_terminate=None, on_stop=None):
+    """
+    Fork `workers` processes accepting connections on the listening socket of already bound `ThreadPoolHTTPServer`.
+    Dead workers are respawned, with a growing delay while they exit right after the start, e.g. failing
+    to connect to the store, so a crash on startup does not turn into a fork loop.
+    SIGINT/SIGTERM of the master stops the whole pool,
+    every worker drains its connections as `ThreadPoolHTTPServer.serve` with `on_terminate` and `on_stop`.
+    If a SIGHUP handler is set before the call, SIGHUP of the master is passed to the workers to run it.
+    `init_worker` is called in every child right after fork, e.g. to open its own store connections.
+    """
+    # pid -> start time
+    children = {}
+    hup_handler = signal.getsignal(signal.SIGHUP)
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(server, init_worker, hup_handler, on_terminate, on_stop)
+        children[pid] = monotonic()
+        logging.info("Started worker %s" % pid)
+
+    def terminate(signum, frame):
+        sys.exit(0)
+
+    def forward(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, terminate)
+    if callable(hup_handler):
+        signal.signal(signal.SIGHUP, forward)
+    try:
+        for _ in range(workers):
+            spawn()
+        delay = 0
+        while children:
+            pid, status = os.wait()
+            if pid in children:
+                if monotonic() - children.pop(pid) < MIN_UPTIME:
+                    delay = min(max(delay * 2, RESPAWN_DELAY), RESPAWN_MAX_DELAY)
+                else:
+                    delay = 0
+                logging.warning("Worker %s exited with status %s, respawning in %s s" % (pid, status, delay))
+                sleep(delay)
+                spawn()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        server.server_close()
@@ -0,0 +1,237 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+import weakref
+
+from time import monotonic
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from scoring_api.api.exceptions import StoreConnectionError
+
+VNODES = 160
+SHARD_TIMEOUT = 5.0
+
+
+def _hash(key):
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring, every node is placed on the ring `vnodes` times.
+    A key belongs to the node of the first point clockwise from the key hash,
+    so adding or removing a node moves only the keys of its own points.
+    """
+
+    def __init__(self, nodes, vnodes=VNODES):
+        points = sorted((_hash(f'{node}#{i}'), index) for index, node in enumerate(nodes) for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._indexes = [index for _, index in points]
+
+    def get_index(self, key):
+        """Index of the node owning `key` in the list of nodes the ring was built of."""
+        i = bisect(self._hashes, _hash(key))
+        return self._indexes[i if i < len(self._indexes) else 0]
+
+
+class _ShardCall:
+    """Shard call run by an executor, the timeout of its result counts from the start of the call."""
+
+    def __init__(self, executor, method, *args):
+        self.started_at = None
+        self.started = threading.Event()
+        self.future = executor.submit(self._run, method, args)
+
+    def _run(self, method, args):
+        self.started_at = monotonic()
+        self.started.set()
+        return method(*args)
+
+    def result(self, timeout):
+        """Result of the call, `StoreConnectionError` if it does not start or finish in `timeout` seconds."""
+        try:
+            if self.started.wait(timeout):
+                return self.future.result(max(0.0, self.started_at + timeout - monotonic()))
+        except TimeoutError:
+            pass
+        # a call still waiting in the queue is not run, a running one can not be interrupted
+        self.future.cancel()
+        raise StoreConnectionError(f'shard did not answer in {timeout} s')
+
+
+class BaseShardedStore:
+    def __init__(self, shards, names=None, vnodes=VNODES):
+        """
+        `shards` - stores of the shards, every one is a `RedisStore` with its primary and replicas.
+        `names` - stable shard names placed on the hash ring, e.g. primary addresses,
+            shard indexes are used if None, so reordering shards moves keys between them.
+        """
+        self.shards = list(shards)
+        self.ring = HashRing(names or [str(i) for i in range(len(self.shards))], vnodes)
+
+    @property
+    def healthy(self):
+        return all(shard.healthy for shard in self.shards)
+
+    def shard(self, key):
+        return self.shards[self.ring.get_index(key)]
+
+    def _group(self, keys):
+        """Positions of `keys` by shard index."""
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.ring.get_index(key), []).append(i)
+        return groups
+
+    @staticmethod
+    def _merge(size, parts):
+        result = [None] * size
+        for positions, values in parts:
+            for i, value in zip(positions, values):
+                result[i] = value
+        return result
+
+
+class ShardedStore(BaseShardedStore):
+    """
+    `RedisStore` API over several shards. Single key operations go to the shard owning the key,
+    batch operations are split by shard and sent to all the shards in parallel.
+    As `RedisStore`, the score cache is best effort: a shard not answering in `timeout` seconds
+    makes its keys cache misses and its writes are dropped, while interest reads fail.
+    """
+
+    timeout = SHARD_TIMEOUT
+
+    def __init__(self, shards, names=None, vnodes=VNODES, threads=1):
+        """`threads` - number of threads calling the store at once, each one can fan out to every shard."""
+        super().__init__(shards, names, vnodes)
+        self.threads = threads
+        self._new_executor()
+        # threads of the pool do not exist in a forked child, the inherited pool would never run its tasks
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._new_executor())
+
+    def _new_executor(self):
+        # concurrent fan-outs do not queue behind each other
+        self.executor = ThreadPoolExecutor(max_workers=self.threads * len(self.shards), thread_name_prefix='shard')
+
+    def set_connection(self):
+        for shard in self.shards:
+            shard.set_connection()
+
+    def start_invalidation(self):
+        for shard in self.shards:
+            shard.start_invalidation()
+
+    def warm_pool(self, size):
+        for shard in self.shards:
+            shard.warm_pool(size)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.executor.shutdown(wait=False)
+
+    def get(self, key):
+        return self.shard(key).get(key)
+
+    def get_hash(self, key):
+        return self.shard(key).get_hash(key)
+
+    def cache_get(self, key):
+        return self.shard(key).cache_get(key)
+
+    def cache_set(self, key, value, expire_ms):
+        return self.shard(key).cache_set(key, value, expire_ms)
+
+    def get_many(self, keys):
+        return self._fan_out('get_many', keys)
+
+    def cache_get_many(self, keys):
+        return self._fan_out('cache_get_many', keys, soft=True)
+
+    def cache_set_many(self, mapping, expire_ms):
+        keys = list(mapping)
+        calls = [_ShardCall(self.executor, self.shards[index].cache_set_many,
+                            {keys[i]: mapping[keys[i]] for i in positions}, expire_ms)
+                 for index, positions in self._group(keys).items()]
+        for call in calls:
+            try:
+                call.result(self.timeout)
+            except StoreConnectionError as e:
+                logging.warning("Score cache entries are not written: %s" % e)
+
+    def _fan_out(self, method, keys, soft=False):
+        """
+        Results of `method` of the shards owning `keys`, ordered as keys.
+        `soft` - keys of a shard not answering in time get None instead of the error.
+        """
+        groups = self._group(keys)
+        if len(groups) == 1:
+            (index, positions), = groups.items()
+            return getattr(self.shards[index], method)(keys)
+        calls = [(positions, _ShardCall(self.executor, getattr(self.shards[index], method),
+                                        [keys[i] for i in positions]))
+                 for index, positions in groups.items()]
+        parts = []
+        for positions, call in calls:
+            try:
+                parts.append((positions, call.result(self.timeout)))
+            except StoreConnectionError as e:
+                if not soft:
+                    for _, pending in calls:
+                        pending.future.cancel()
+                    raise
+                logging.warning("Score cache entries are not read: %s" % e)
+        return self._merge(len(keys), parts)
+
+
+class AsyncShardedStore(BaseShardedStore):
+    """Coroutine counterpart of `ShardedStore` over `AsyncRedisStore` shards, fans out with `asyncio.gather`."""
+
+    async def set_connection(self):
+        await asyncio.gather(*(shard.set_connection() for shard in self.shards))
+
+    async def start_invalidation(self):
+        await asyncio.gather(*(shard.start_invalidation() for shard in self.shards))
+
+    async def close(self):
+        await asyncio.gather(*(shard.close() for shard in self.shards))
+
+    async def warm_pool(self, size):
+        await asyncio.gather(*(shard.warm_pool(size) for shard in self.shards))
+
+    async def get(self, key):
+        return await self.shard(key).get(key)
+
+    async def get_hash(self, key):
+        return await self.shard(key).get_hash(key)
+
+    async def cache_get(self, key):
+        return await self.shard(key).cache_get(key)
+
+    async def cache_set(self, key, value, expire_ms):
+        return await self.shard(key).cache_set(key, value, expire_ms)
+
+    async def get_many(self, keys):
+        return await self._fan_out('get_many', keys)
+
+    async def cache_get_many(self, keys):
+        return await self._fan_out('cache_get_many', keys)
+
+    async def cache_set_many(self, mapping, expire_ms):
+        keys = list(mapping)
+        await asyncio.gather(*(self.shards[index].cache_set_many({keys[i]: mapping[keys[i]] for i in positions},
+                                                                 expire_ms)
+                               for index, positions in self._group(keys).items()))
+
+    async def _fan_out(self, method, keys):
+        groups = list(self._group(keys).items())
+        results = await asyncio.gather(*(getattr(self.shards[index], method)([keys[i] for i in positions])
+                                         for index, positions in groups))
+        return self._merge(len(keys), [(positions, values) for (_, positions), values in zip(groups, results)])
@@ -0,0 +1,211 @@
+"""
+Local cache tier shared by the pre-forked worker processes of a host.
+
+`SharedCache` is a drop-in replacement of `cache.LRUCache` kept in an anonymous shared memory mapping,
+so the workers forked after it is created share one hot set and one memory budget.
+
+The table is open addressing with `WAYS` slots per group, a key lives in one of the slots of the group of its hash,
+a full group evicts the entry expiring first. Every slot has a sequence number (seqlock): readers take no lock,
+they read a slot and take it for a miss if its sequence was odd or changed meanwhile. Writers of a group are serialized
+with an `fcntl` record lock of the group, the kernel releases it when a process dies, and the sequence left odd
+by a writer crashed in the middle of a write is repaired by the next write of the slot.
+"""
+import os
+import mmap
+import zlib
+import fcntl
+import struct
+import marshal
+import tempfile
+import threading
+import weakref
+
+from time import monotonic
+from contextlib import contextmanager
+
+WAYS = 8
+SLOT_SIZE = 256
+# generation and epoch, see `SharedCache.generation` and `SharedCache.clear`
+HEADER = struct.Struct('<QQ')
+HEADER_SIZE = 64
+# sequence, key hash, epoch, expiration (monotonic), key length, value length, value format
+SLOT = struct.Struct('<QIIdHHB3x')
+SEQUENCE = struct.Struct('<Q')
+RAW, MARSHAL = 0, 1
+EPOCH_MASK = 0xFFFFFFFF
+
+
+def _encode_key(key):
+    return key if isinstance(key, bytes) else str(key).encode('utf-8')
+
+
+def _encode_value(value):
+    return (RAW, value) if isinstance(value, bytes) else (MARSHAL, marshal.dumps(value))
+
+
+class SharedCache:
+    """
+    Bounded cache in shared memory with per entry expiration, create it before fork.
+    Values are bytes or marshallable objects, e.g. sets of bytes, entries bigger than a slot are not cached.
+    Hit, miss and eviction counters are per process.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60.0, slot_size=SLOT_SIZE):
+        """
+        `maxsize` - number of entries, rounded up to `WAYS`, the cache takes `maxsize * slot_size` bytes.
+        `ttl` - max entry lifetime in seconds, shorter lifetime can be set per entry.
+        """
+        self.groups = max(1, -(-maxsize // WAYS))
+        self.maxsize = self.groups * WAYS
+        self.ttl = ttl
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT.size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._buf = mmap.mmap(-1, HEADER_SIZE + self.maxsize * slot_size)
+        # only fcntl locks are taken on the file, its data is never written
+        self._lock_file = tempfile.TemporaryFile()
+        self._lock = threading.Lock()
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _after_fork(self):
+        # a thread of the parent could hold the lock at fork
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @contextmanager
+    def _locked(self, index):
+        """Exclusive lock of the group `index`, -1 for the header, across threads and processes."""
+        fd = self._lock_file.fileno()
+        with self._lock:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, index + 1)
+            try:
+                yield
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, index + 1)
+
+    def _header(self):
+        return HEADER.unpack_from(self._buf, 0)
+
+    @property
+    def generation(self):
+        """Incremented by every `invalidate` and `clear` of any process, see `LRUCache.set`."""
+        return self._header()[0]
+
+    def _slots(self, h):
+        index = h % self.groups
+        base = HEADER_SIZE + index * WAYS * self.slot_size
+        return index, range(base, base + WAYS * self.slot_size, self.slot_size)
+
+    def __len__(self):
+        now, epoch = monotonic(), self._header()[1] & EPOCH_MASK
+        size = 0
+        for offset in range(HEADER_SIZE, len(self._buf), self.slot_size):
+            _, _, slot_epoch, expires_at, key_len, _, _ = SLOT.unpack_from(self._buf, offset)
+            size += key_len > 0 and slot_epoch == epoch and expires_at > now
+        return size
+
+    def get(self, key, default=None):
+        key = _encode_key(key)
+        h = zlib.crc32(key)
+        buf, epoch = self._buf, self._header()[1] & EPOCH_MASK
+        for offset in self._slots(h)[1]:
+            sequence, slot_hash, slot_epoch, expires_at, key_len, value_len, kind = SLOT.unpack_from(buf, offset)
+            if slot_hash != h or key_len != len(key) or slot_epoch != epoch or sequence & 1:
+                continue
+            data = buf[offset + SLOT.size:offset + SLOT.size + key_len + value_len]
+            if SEQUENCE.unpack_from(buf, offset)[0] != sequence:
+                # written meanwhile, the new value is not waited for
+                break
+            if data[:key_len] != key:
+                continue
+            if expires_at <= monotonic():
+                continue
+            self.hits += 1
+            value = data[key_len:]
+            return value if kind == RAW else marshal.loads(value)
+        self.misses += 1
+        return default
+
+    def _write(self, offset, *fields, data=b''):
+        buf = self._buf
+        # odd sequence while the slot is written, even one of a crashed writer is repaired here
+        sequence = SEQUENCE.unpack_from(buf, offset)[0] | 1
+        SEQUENCE.pack_into(buf, offset, sequence)
+        buf[offset + SLOT.size:offset + SLOT.size + len(data)] = data
+        SLOT.pack_into(buf, offset, sequence, *fields)
+        SEQUENCE.pack_into(buf, offset, sequence + 1)
+
+    def set(self, key, value, ttl=None, generation=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        key = _encode_key(key)
+        kind, value = _encode_value(value)
+        if len(key) + len(value) > self.capacity:
+            return
+        h = zlib.crc32(key)
+        index, slots = self._slots(h)
+        with self._locked(index):
+            generation_now, epoch = self._header()
+            if generation is not None and generation != generation_now:
+                return
+            epoch &= EPOCH_MASK
+            now = monotonic()
+            target, evicted = None, None
+            for offset in slots:
+                _, slot_hash, slot_epoch, expires_at, key_len, _, _ = SLOT.unpack_from(self._buf, offset)
+                if key_len and slot_hash == h and self._key(offset, key_len) == key:
+                    target = offset
+                    break
+                if not key_len or slot_epoch != epoch or expires_at <= now:
+                    target = offset if target is None else target
+                elif evicted is None or expires_at < evicted[1]:
+                    evicted = offset, expires_at
+            if target is None:
+                target = evicted[0]
+                self.evictions += 1
+            self._write(target, h, epoch, now + ttl, len(key), len(value), kind, data=key + value)
+
+    def _key(self, offset, key_len):
+        return self._buf[offset + SLOT.size:offset + SLOT.size + key_len]
+
+    def delete(self, key):
+        return self._delete(_encode_key(key))
+
+    def _delete(self, key):
+        h = zlib.crc32(key)
+        index, slots = self._slots(h)
+        with self._locked(index):
+            for offset in slots:
+                _, slot_hash, _, _, key_len, _, _ = SLOT.unpack_from(self._buf, offset)
+                if key_len and slot_hash == h and self._key(offset, key_len) == key:
+                    self._write(offset, 0, 0, 0.0, 0, 0, RAW)
+                    return True
+        return False
+
+    def _bump(self, epoch=0):
+        with self._locked(-1):
+            generation, current = self._header()
+            HEADER.pack_into(self._buf, 0, generation + 1, current + epoch)
+
+    def invalidate(self, keys):
+        """Drops `keys`, returns the number of dropped entries."""
+        self._bump()
+        return sum(self._delete(_encode_key(key)) for key in keys)
+
+    def clear(self):
+        """Drops all the entries at once: entries of the previous epochs are not read."""
+        self._bump(epoch=1)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
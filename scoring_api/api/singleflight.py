@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key: while a call with some key is running in one thread,
+    other threads calling with the same key wait for it and get its result or exception.
+    """
+
+    def __init__(self, counter=None):
+        """`counter` - optional metric incremented for every call joined to a running one."""
+        self.counter = counter
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if self.counter is not None:
+                self.counter.inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """
+    Coroutine counterpart of `SingleFlight` for tasks of one event loop.
+    The shared call runs as a separate task, so a cancelled caller does not cancel it for the others.
+    """
+
+    def __init__(self, counter=None):
+        self.counter = counter
+        self._calls = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        elif self.counter is not None:
+            self.counter.inc()
+        return await asyncio.shield(task)
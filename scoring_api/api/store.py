@@ -1,36 +1,247 @@
+import os
 import redis
-from time import sleep
+import random
+import asyncio
+import threading
+import redis.asyncio as aioredis
+from time import sleep, perf_counter, monotonic
 from scoring_api.api.exceptions import StoreConnectionError
+from scoring_api.api.invalidation import InvalidationListener
+from scoring_api.api.metrics import STORE_DURATION, STORE_RETRIES, STORE_FAILURES, STORE_REJECTED, STORE_CIRCUIT_OPENED
+from scoring_api.api.metrics import INTEREST_CACHE
 from redis.exceptions import TimeoutError, ConnectionError
 
 RETRY_COUNT = 3
-RETRY_DELAY = 0.5
+RETRY_DELAY = 0.05
+RETRY_MAX_DELAY = 0.5
+RETRY_DEADLINE = 1.0
+FAILURE_THRESHOLD = 5
+RECOVERY_TIMEOUT = 5.0
+CHUNK_SIZE = 100
+SUBSCRIBE_TIMEOUT = 1.0
+
+_interest_hits, _interest_misses = INTEREST_CACHE.labels('hit'), INTEREST_CACHE.labels('miss')
+
+
+class CircuitBreaker:
+    """
+    Stops calls to the store after `failure_threshold` failed attempts in a row (open state).
+    After `recovery_timeout` seconds one probe call is let through (half-open state):
+    its success closes the circuit, its failure opens it for another `recovery_timeout`.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, recovery_timeout=RECOVERY_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # a probe lost without a result is replaced after recovery_timeout as well
+            if monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        if self.state != self.CLOSED or self.failures:
+            with self._lock:
+                self.state = self.CLOSED
+                self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = monotonic()
+                STORE_CIRCUIT_OPENED.inc()
+
+
+def _backoff(attempt):
+    """Delay before the attempt following `attempt`, exponential with full jitter."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** attempt))
+
+
+def _operation_metrics(method):
+    operation = method.__name__.lstrip('_')
+    return (STORE_DURATION.labels(operation), STORE_RETRIES.labels(operation), STORE_FAILURES.labels(operation),
+            STORE_REJECTED.labels(operation))
 
 
 def retry_connect(raise_on_failure=True):
+    """
+    Retries a store method on connection errors with jittered exponential backoff,
+    no more than RETRY_COUNT attempts and RETRY_DEADLINE seconds in total.
+    Calls are rejected at once while the circuit breaker of the store is open.
+    """
     def decorator(method):
-        def wrapper(*args, **kwargs):
+        duration, retries, failures, rejected = _operation_metrics(method)
+
+        def wrapper(store, *args, **kwargs):
             error = None
-            for _ in range(RETRY_COUNT):
-                try:
-                    return method(*args, **kwargs)
-                except (ConnectionError, TimeoutError) as err:
-                    error = err
-                    sleep(RETRY_DELAY)
-            else:
+            started = perf_counter()
+            breaker = store.breaker
+            try:
+                if not breaker.allow():
+                    rejected.inc()
+                    if raise_on_failure:
+                        raise StoreConnectionError('circuit breaker is open')
+                    return None
+                for attempt in range(RETRY_COUNT):
+                    try:
+                        result = method(store, *args, **kwargs)
+                    except (ConnectionError, TimeoutError) as err:
+                        error = err
+                        retries.inc()
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                        return result
+                    delay = _backoff(attempt)
+                    if (attempt == RETRY_COUNT - 1 or perf_counter() - started + delay > RETRY_DEADLINE
+                            or not breaker.allow()):
+                        break
+                    sleep(delay)
+                failures.inc()
                 if raise_on_failure:
                     raise StoreConnectionError(error)
-                else:
+                return None
+            finally:
+                duration.observe(perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def async_retry_connect(raise_on_failure=True):
+    """Coroutine counterpart of `retry_connect`."""
+    def decorator(method):
+        duration, retries, failures, rejected = _operation_metrics(method)
+
+        async def wrapper(store, *args, **kwargs):
+            error = None
+            started = perf_counter()
+            breaker = store.breaker
+            try:
+                if not breaker.allow():
+                    rejected.inc()
+                    if raise_on_failure:
+                        raise StoreConnectionError('circuit breaker is open')
                     return None
+                for attempt in range(RETRY_COUNT):
+                    try:
+                        result = await method(store, *args, **kwargs)
+                    except (ConnectionError, TimeoutError) as err:
+                        error = err
+                        retries.inc()
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                        return result
+                    delay = _backoff(attempt)
+                    if (attempt == RETRY_COUNT - 1 or perf_counter() - started + delay > RETRY_DEADLINE
+                            or not breaker.allow()):
+                        break
+                    await asyncio.sleep(delay)
+                failures.inc()
+                if raise_on_failure:
+                    raise StoreConnectionError(error)
+                return None
+            finally:
+                duration.observe(perf_counter() - started)
         return wrapper
     return decorator
 
 
+def _encode(value):
+    # keep values in the local tier in the same form as they come back from Redis
+    return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+
+def _lookup_interests(interest_cache, keys):
+    """Cached interests of `keys`, positions of the missed ones and the cache generation to store them with."""
+    generation = interest_cache.generation
+    result = [interest_cache.get(key) for key in keys]
+    missed = [i for i, value in enumerate(result) if value is None]
+    _interest_hits.inc(len(keys) - len(missed))
+    _interest_misses.inc(len(missed))
+    return result, missed, generation
+
+
+def _store_interests(interest_cache, keys, result, missed, values, generation):
+    for i, value in zip(missed, values):
+        result[i] = value
+        # a set changed while it was read is returned but not cached
+        interest_cache.set(keys[i], value, generation=generation)
+    return result
+
+
+def _start_invalidation(store):
+    """
+    Starts the invalidation listener of the interest cache of `store` once per process.
+    Waits a little for the subscription, so the cache is filled under it.
+    """
+    if store.interest_cache is None or store.interest_invalidation is None:
+        return
+    listener = store.invalidation_listener
+    if listener is not None and listener.pid == os.getpid():
+        return
+    store.invalidation_listener = InvalidationListener(store.interest_cache, store.interest_invalidation,
+                                                       **store.connection_kwargs)
+    store.invalidation_listener.start()
+    store.invalidation_listener.subscribed.wait(SUBSCRIBE_TIMEOUT)
+
+
+def _stop_invalidation(store):
+    if store.invalidation_listener is not None:
+        store.invalidation_listener.stop()
+        store.invalidation_listener = None
+
+
+def _changed_recently(store, keys):
+    """Whether some of `keys` were invalidated so recently that the replicas may still have the old values."""
+    listener = store.invalidation_listener
+    return bool(store.replica_conns) and listener is not None and any(map(listener.changed_recently, keys))
+
+
+def _fill_local_cache(local_cache, keys, values, ttls):
+    for key, value, ttl in zip(keys, values, ttls):
+        # PTTL is -1 for keys without expiration and -2 for keys expired after MGET
+        if value is not None and ttl != -2:
+            local_cache.set(key, value, ttl / 1000 if ttl >= 0 else None)
+
+
 class RedisStore:
     conn = None
+    replica_conns = ()
+    invalidation_listener = None
 
-    def __init__(self, **connection_kwargs):
+    def __init__(self, chunk_size=CHUNK_SIZE, local_cache=None, breaker=None, replicas=(), interest_cache=None,
+                 interest_invalidation=None, **connection_kwargs):
         """
+        One Redis primary with optional read replicas. Reads of interests and cached scores go to a random replica,
+        writes go to the primary. Several primaries are combined with `sharding.ShardedStore`.
+
+        `chunk_size` - max number of commands sent in one pipeline by batch methods.
+        `local_cache` - optional in-process tier in front of the score cache, e.g. `cache.LRUCache`.
+            Entries are kept no longer than the expiry passed to `cache_set` or left in Redis.
+        `interest_cache` - optional in-process tier in front of the interest sets,
+            entries are kept for the ttl of the cache or until they are changed in Redis.
+        `interest_invalidation` - mode of `invalidation.InvalidationListener` dropping changed sets
+            from `interest_cache`: `auto`, `tracking` or `keyspace`, None to rely on the ttl only.
+        `breaker` - `CircuitBreaker` failing calls fast while Redis is unavailable, default one if None.
+        `replicas` - connection args of the replicas, e.g. `[{'host': 'replica1', 'port': 6379}]`,
+            missing ones are taken from the primary connection args.
+
         Default connection args:
             host='localhost'
             port=6379
@@ -59,24 +270,320 @@ class RedisStore:
             client_name=None
             username=None
         """
+        self.chunk_size = chunk_size
+        self.local_cache = local_cache
+        self.breaker = breaker or CircuitBreaker()
+        self.replicas = [dict(connection_kwargs, **replica) for replica in replicas]
+        self.interest_cache = interest_cache
+        self.interest_invalidation = interest_invalidation
         self.connection_kwargs = connection_kwargs
 
-    def set_connection(self):
+    @staticmethod
+    def connect(connection_kwargs):
         try:
-            conn = redis.Redis(connection_pool=redis.ConnectionPool(**self.connection_kwargs))
+            conn = redis.Redis(connection_pool=redis.ConnectionPool(**connection_kwargs))
             conn.ping()
         except ConnectionError as err:
             raise StoreConnectionError(err)
-        self.conn = conn
+        return conn
+
+    def set_connection(self):
+        self.conn = self.connect(self.connection_kwargs)
+        self.replica_conns = [self.connect(replica) for replica in self.replicas]
+
+    def start_invalidation(self):
+        """
+        Starts the invalidation listener of the interest cache, if any. Call it in the serving process:
+        a listener of the master would write to the cache while workers are forked, and its thread is not inherited.
+        Entries cached before, e.g. by the warm-up, miss the changes made until the listener is subscribed.
+        """
+        _start_invalidation(self)
+
+    @property
+    def healthy(self):
+        """Connected and not failing fast, known without a call to Redis."""
+        return self.conn is not None and self.breaker.state != CircuitBreaker.OPEN
+
+    def reader(self):
+        """Connection for reads: a random replica, the primary if there are no replicas."""
+        return random.choice(self.replica_conns) if self.replica_conns else self.conn
+
+    def warm_pool(self, size):
+        """Open `size` connections to the primary and to every replica in advance."""
+        for conn in [self.conn, *self.replica_conns]:
+            pool = conn.connection_pool
+            connections = [pool.get_connection('PING') for _ in range(size)]
+            for connection in connections:
+                pool.release(connection)
+
+    def close(self):
+        """Disconnect all the pooled connections, call when no requests are in progress."""
+        _stop_invalidation(self)
+        for conn in [self.conn, *self.replica_conns]:
+            if conn is not None:
+                conn.connection_pool.disconnect()
+        self.conn, self.replica_conns = None, ()
 
-    @retry_connect(raise_on_failure=True)
     def get(self, key):
-        return self.conn.smembers(key)
+        if self.interest_cache is None:
+            return self._get(key)
+        return self.get_many([key])[0]
+
+    @retry_connect(raise_on_failure=True)
+    def _get(self, key):
+        return self.reader().smembers(key)
+
+    def get_many(self, keys):
+        """Batch `get`, costs one round trip per `chunk_size` keys, result is ordered as keys."""
+        if self.interest_cache is None:
+            return self._get_remote(keys)
+        result, missed, generation = _lookup_interests(self.interest_cache, keys)
+        if not missed:
+            return result
+        missed_keys = [keys[i] for i in missed]
+        # a set changed a moment ago is read from the primary, so the old value of a replica is not cached
+        values = self._get_remote(missed_keys, primary=_changed_recently(self, missed_keys))
+        return _store_interests(self.interest_cache, keys, result, missed, values, generation)
+
+    def _get_remote(self, keys, primary=False):
+        result = []
+        for i in range(0, len(keys), self.chunk_size):
+            result.extend(self._get_chunk(keys[i:i + self.chunk_size], primary))
+        return result
+
+    @retry_connect(raise_on_failure=True)
+    def get_hash(self, key):
+        """All fields and values of the hash `key`, e.g. the interest vocabulary."""
+        return self.reader().hgetall(key)
+
+    @retry_connect(raise_on_failure=True)
+    def _get_chunk(self, keys, primary=False):
+        pipe = (self.conn if primary else self.reader()).pipeline(transaction=False)
+        for key in keys:
+            pipe.smembers(key)
+        return pipe.execute()
 
-    @retry_connect(raise_on_failure=False)
     def cache_get(self, key):
-        return self.conn.get(key)
+        if self.local_cache is None:
+            return self._cache_get(key)
+        return self.cache_get_many([key])[0]
 
-    @retry_connect(raise_on_failure=False)
     def cache_set(self, key, value, expire_ms):
+        if self.local_cache is not None:
+            self.local_cache.set(key, _encode(value), expire_ms / 1000)
+        return self._cache_set(key, value, expire_ms)
+
+    def cache_get_many(self, keys):
+        """Batch `cache_get`, one MGET per `chunk_size` keys, values of unavailable chunks are None."""
+        if self.local_cache is None:
+            return self._cache_get_remote(keys)
+        result = [self.local_cache.get(key) for key in keys]
+        missed = [i for i, value in enumerate(result) if value is None]
+        if missed:
+            for i, value in zip(missed, self._cache_get_remote([keys[i] for i in missed])):
+                result[i] = value
+        return result
+
+    def cache_set_many(self, mapping, expire_ms):
+        """Batch `cache_set`, one pipeline of SET commands per `chunk_size` items."""
+        if self.local_cache is not None:
+            for key, value in mapping.items():
+                self.local_cache.set(key, _encode(value), expire_ms / 1000)
+        items = list(mapping.items())
+        for i in range(0, len(items), self.chunk_size):
+            self._cache_set_chunk(items[i:i + self.chunk_size], expire_ms)
+
+    def _cache_get_remote(self, keys):
+        result = []
+        for i in range(0, len(keys), self.chunk_size):
+            chunk = keys[i:i + self.chunk_size]
+            result.extend(self._cache_get_chunk(chunk) or [None] * len(chunk))
+        return result
+
+    @retry_connect(raise_on_failure=False)
+    def _cache_get(self, key):
+        return self.reader().get(key)
+
+    @retry_connect(raise_on_failure=False)
+    def _cache_set(self, key, value, expire_ms):
         return self.conn.set(key, value, px=expire_ms)
+
+    @retry_connect(raise_on_failure=False)
+    def _cache_get_chunk(self, keys):
+        conn = self.reader()
+        if self.local_cache is None:
+            return conn.mget(keys)
+        pipe = conn.pipeline(transaction=False)
+        pipe.mget(keys)
+        for key in keys:
+            pipe.pttl(key)
+        values, *ttls = pipe.execute()
+        _fill_local_cache(self.local_cache, keys, values, ttls)
+        return values
+
+    @retry_connect(raise_on_failure=False)
+    def _cache_set_chunk(self, items, expire_ms):
+        pipe = self.conn.pipeline(transaction=False)
+        for key, value in items:
+            pipe.set(key, value, px=expire_ms)
+        return pipe.execute()
+
+
+class AsyncRedisStore:
+    conn = None
+    replica_conns = ()
+    invalidation_listener = None
+    max_connections = 64
+
+    def __init__(self, chunk_size=CHUNK_SIZE, local_cache=None, breaker=None, replicas=(), interest_cache=None,
+                 interest_invalidation=None, **connection_kwargs):
+        """
+        Accepts the same args as `RedisStore`.
+        Connections are taken from a blocking pool of `max_connections` size (64 by default),
+        so a burst of requests waits for a free connection instead of opening a new one per request.
+        """
+        connection_kwargs.setdefault('max_connections', self.max_connections)
+        self.chunk_size = chunk_size
+        self.local_cache = local_cache
+        self.breaker = breaker or CircuitBreaker()
+        self.replicas = [dict(connection_kwargs, **replica) for replica in replicas]
+        self.interest_cache = interest_cache
+        self.interest_invalidation = interest_invalidation
+        self.connection_kwargs = connection_kwargs
+
+    @staticmethod
+    async def connect(connection_kwargs):
+        try:
+            conn = aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool(**connection_kwargs))
+            await conn.ping()
+        except ConnectionError as err:
+            raise StoreConnectionError(err)
+        return conn
+
+    async def set_connection(self):
+        self.conn = await self.connect(self.connection_kwargs)
+        self.replica_conns = [await self.connect(replica) for replica in self.replicas]
+
+    async def start_invalidation(self):
+        # the listener thread uses its own blocking connections
+        await asyncio.get_running_loop().run_in_executor(None, _start_invalidation, self)
+
+    @property
+    def healthy(self):
+        return self.conn is not None and self.breaker.state != CircuitBreaker.OPEN
+
+    def reader(self):
+        return random.choice(self.replica_conns) if self.replica_conns else self.conn
+
+    async def warm_pool(self, size):
+        for conn in [self.conn, *self.replica_conns]:
+            pool = conn.connection_pool
+            connections = [await pool.get_connection('PING') for _ in range(min(size, pool.max_connections))]
+            for connection in connections:
+                await pool.release(connection)
+
+    async def close(self):
+        _stop_invalidation(self)
+        for conn in [self.conn, *self.replica_conns]:
+            if conn is not None:
+                await conn.close(close_connection_pool=True)
+        self.conn, self.replica_conns = None, ()
+
+    async def get(self, key):
+        if self.interest_cache is None:
+            return await self._get(key)
+        return (await self.get_many([key]))[0]
+
+    @async_retry_connect(raise_on_failure=True)
+    async def _get(self, key):
+        return await self.reader().smembers(key)
+
+    async def get_many(self, keys):
+        if self.interest_cache is None:
+            return await self._get_remote(keys)
+        result, missed, generation = _lookup_interests(self.interest_cache, keys)
+        if not missed:
+            return result
+        missed_keys = [keys[i] for i in missed]
+        values = await self._get_remote(missed_keys, primary=_changed_recently(self, missed_keys))
+        return _store_interests(self.interest_cache, keys, result, missed, values, generation)
+
+    async def _get_remote(self, keys, primary=False):
+        result = []
+        for i in range(0, len(keys), self.chunk_size):
+            result.extend(await self._get_chunk(keys[i:i + self.chunk_size], primary))
+        return result
+
+    @async_retry_connect(raise_on_failure=True)
+    async def get_hash(self, key):
+        return await self.reader().hgetall(key)
+
+    @async_retry_connect(raise_on_failure=True)
+    async def _get_chunk(self, keys, primary=False):
+        pipe = (self.conn if primary else self.reader()).pipeline(transaction=False)
+        for key in keys:
+            pipe.smembers(key)
+        return await pipe.execute()
+
+    async def cache_get(self, key):
+        if self.local_cache is None:
+            return await self._cache_get(key)
+        return (await self.cache_get_many([key]))[0]
+
+    async def cache_set(self, key, value, expire_ms):
+        if self.local_cache is not None:
+            self.local_cache.set(key, _encode(value), expire_ms / 1000)
+        return await self._cache_set(key, value, expire_ms)
+
+    async def cache_get_many(self, keys):
+        if self.local_cache is None:
+            return await self._cache_get_remote(keys)
+        result = [self.local_cache.get(key) for key in keys]
+        missed = [i for i, value in enumerate(result) if value is None]
+        if missed:
+            for i, value in zip(missed, await self._cache_get_remote([keys[i] for i in missed])):
+                result[i] = value
+        return result
+
+    async def cache_set_many(self, mapping, expire_ms):
+        if self.local_cache is not None:
+            for key, value in mapping.items():
+                self.local_cache.set(key, _encode(value), expire_ms / 1000)
+        items = list(mapping.items())
+        for i in range(0, len(items), self.chunk_size):
+            await self._cache_set_chunk(items[i:i + self.chunk_size], expire_ms)
+
+    async def _cache_get_remote(self, keys):
+        result = []
+        for i in range(0, len(keys), self.chunk_size):
+            chunk = keys[i:i + self.chunk_size]
+            result.extend(await self._cache_get_chunk(chunk) or [None] * len(chunk))
+        return result
+
+    @async_retry_connect(raise_on_failure=False)
+    async def _cache_get(self, key):
+        return await self.reader().get(key)
+
+    @async_retry_connect(raise_on_failure=False)
+    async def _cache_set(self, key, value, expire_ms):
+        return await self.conn.set(key, value, px=expire_ms)
+
+    @async_retry_connect(raise_on_failure=False)
+    async def _cache_get_chunk(self, keys):
+        conn = self.reader()
+        if self.local_cache is None:
+            return await conn.mget(keys)
+        pipe = conn.pipeline(transaction=False)
+        pipe.mget(keys)
+        for key in keys:
+            pipe.pttl(key)
+        values, *ttls = await pipe.execute()
+        _fill_local_cache(self.local_cache, keys, values, ttls)
+        return values
+
+    @async_retry_connect(raise_on_failure=False)
+    async def _cache_set_chunk(self, items, expire_ms):
+        pipe = self.conn.pipeline(transaction=False)
+        for key, value in items:
+            pipe.set(key, value, px=expire_ms)
+        return await pipe.execute()
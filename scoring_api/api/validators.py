@@ -1,5 +1,5 @@
 import re
-from functools import wraps
+from functools import wraps, lru_cache
 from datetime import datetime, timedelta
 from scoring_api.api.exceptions import ValidationError
 
@@ -20,7 +20,7 @@ def email_validator(func):
     pattern = re.compile(r'^[._\w]+@\w+\.\w{2,10}$')
     @wraps(func)
     def wrapper(self, value):
-        if not re.match(pattern, value):
+        if not pattern.match(value):
             raise ValidationError(f'{value} is not valid email')
         return func(self, value)
     return wrapper
@@ -30,20 +30,26 @@ def phone_validator(func):
     pattern = re.compile(r'^7\d{10}$')
     @wraps(func)
     def wrapper(self, value):
-        if not re.match(pattern, str(value)):
+        if not pattern.match(str(value)):
             raise ValidationError(f'{value} is not valid phone number')
         return func(self, value)
     return wrapper
 
 
+@lru_cache(maxsize=4096)
+def parse_date(value, fmt):
+    # same dates (birthdays) come again and again, strptime is the slowest part of request validation
+    return datetime.strptime(value, fmt)
+
+
 def date_validator(fmt):
     def validator(func):
         @wraps(func)
         def wrapper(self, value):
             try:
-                self.parsed_date = datetime.strptime(value, fmt)
+                parsed_date = parse_date(value, fmt)
             except ValueError:
                 raise ValidationError(f'invalid date format for {repr(self.name)} field, expected {fmt}')
-            return func(self, value)
+            return func(self, parsed_date)
         return wrapper
     return validator
@@ -0,0 +1,159 @@
+"""
+Interest vocabulary: ids and names of the interests.
+
+Interests of a client are kept in the Redis set `i:<cid>` as names or, in the compact format, as ids
+of the vocabulary hash `VOCABULARY_KEY` of id -> name. Redis stores small integer-only sets as intsets,
+a few bytes per interest instead of a string per member, and `SMEMBERS` replies get shorter.
+Both formats can be mixed while the sets are converted with
+
+    $ python -m scoring_api.api.vocabulary --redis localhost:6379
+
+Ids are never reused or renamed, a new interest gets a new id, so the vocabulary is loaded once at start
+and reloaded only when an unknown id is met, no more than once per `RELOAD_INTERVAL` seconds.
+Decoded names are interned: a reply member costs one dict lookup and no new string.
+"""
+import sys
+import logging
+from time import monotonic
+from optparse import OptionParser
+
+from redis.exceptions import WatchError
+
+from scoring_api.api.exceptions import StoreConnectionError
+
+VOCABULARY_KEY = b'interests:vocabulary'
+SEQUENCE_KEY = b'interests:vocabulary:seq'
+INTERESTS_PATTERN = b'i:*'
+RELOAD_INTERVAL = 1.0
+MAX_NAMES = 10000
+SCAN_COUNT = 1000
+
+
+class Vocabulary:
+    def __init__(self, key=None):
+        """
+        `key` - Redis hash of the vocabulary, None if interests are stored as names only,
+            digit members are names then.
+        """
+        self.key = key
+        self.names = {}
+        self.unknown = False
+        self.loaded_at = None
+
+    def decode(self, members):
+        """Interned names of the set `members`, unknown ids are left as is and set `unknown`."""
+        names = self.names
+        result = []
+        for member in members:
+            name = names.get(member)
+            result.append(self._add(member) if name is None else name)
+        return result
+
+    def _add(self, member):
+        if self.key is not None and member.isdigit():
+            self.unknown = True
+            return member.decode('ascii')
+        if len(self.names) >= MAX_NAMES:
+            return member.decode('utf-8')
+        name = self.names[member] = sys.intern(member.decode('utf-8'))
+        return name
+
+    def update(self, ids):
+        """Replaces the known ids with `ids` of id -> name, as read from the vocabulary hash."""
+        names = {member: name for member, name in self.names.items() if not member.isdigit()}
+        for member, name in ids.items():
+            names[member] = sys.intern(name.decode('utf-8'))
+        self.names, self.unknown = names, False
+
+    def reload_due(self):
+        return self.key is not None and (self.loaded_at is None or monotonic() - self.loaded_at >= RELOAD_INTERVAL)
+
+    def load(self, store):
+        """Reads the vocabulary from `store`, returns False if the store is unavailable."""
+        self.loaded_at = monotonic()
+        try:
+            ids = store.get_hash(self.key)
+        except StoreConnectionError as e:
+            logging.warning("Interest vocabulary is not loaded: %s" % e)
+            return False
+        self.update(ids)
+        logging.info("Loaded interest vocabulary of %s ids" % len(ids))
+        return True
+
+    async def load_async(self, store):
+        self.loaded_at = monotonic()
+        try:
+            ids = await store.get_hash(self.key)
+        except StoreConnectionError as e:
+            logging.warning("Interest vocabulary is not loaded: %s" % e)
+            return False
+        self.update(ids)
+        logging.info("Loaded interest vocabulary of %s ids" % len(ids))
+        return True
+
+
+def _assign_id(conn, key, ids, name):
+    member = str(conn.incr(SEQUENCE_KEY)).encode('ascii')
+    conn.hset(key, member, name)
+    ids[name] = member
+    return member
+
+
+def compact(conn, set_conns=None, key=VOCABULARY_KEY):
+    """
+    Rewrites names in the interest sets of `set_conns` (`conn` by default) as vocabulary ids,
+    new names get new ids in the vocabulary of `conn`. Returns the number of rewritten sets.
+    A set is watched while it is read and rewritten in a transaction, the rewrite of a set changed meanwhile
+    is retried, so names added or removed concurrently are neither lost nor brought back as ids.
+    """
+    ids = {name: member for member, name in conn.hgetall(key).items()}
+    rewritten = 0
+    for set_conn in set_conns or [conn]:
+        for set_key in set_conn.scan_iter(match=INTERESTS_PATTERN, count=SCAN_COUNT, _type='set'):
+            rewritten += _compact_set(conn, set_conn, key, ids, set_key)
+    return rewritten
+
+
+def _compact_set(conn, set_conn, key, ids, set_key):
+    with set_conn.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(set_key)
+                names = [member for member in pipe.smembers(set_key) if not member.isdigit()]
+                if not names:
+                    return False
+                members = [ids.get(name) or _assign_id(conn, key, ids, name) for name in names]
+                pipe.multi()
+                pipe.srem(set_key, *names)
+                pipe.sadd(set_key, *members)
+                pipe.execute()
+                return True
+            except WatchError:
+                continue
+
+
+def main():
+    from scoring_api.api.api import make_store
+    from scoring_api.api.sharding import BaseShardedStore
+    from scoring_api.api.store import FAILURE_THRESHOLD, RECOVERY_TIMEOUT
+
+    op = OptionParser(description="Rewrite interest sets of names as compact sets of vocabulary ids.")
+    op.add_option("--redis", action="append", default=None, metavar="PRIMARY[,REPLICA...]",
+                  help="Redis shard, see the server options")
+    opts, args = op.parse_args()
+    opts.local_cache_size, opts.local_cache_ttl, opts.interest_cache_size, opts.shared_cache = 0, 0, 0, False
+    opts.store_failure_threshold, opts.store_recovery_timeout = FAILURE_THRESHOLD, RECOVERY_TIMEOUT
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname).1s %(message)s',
+                        datefmt='%Y.%m.%d %H:%M:%S')
+    store = make_store(opts)
+    store.set_connection()
+    if isinstance(store, BaseShardedStore):
+        conn, set_conns = store.shard(VOCABULARY_KEY).conn, [shard.conn for shard in store.shards]
+    else:
+        conn, set_conns = store.conn, [store.conn]
+    logging.info("Rewritten %s interest sets" % compact(conn, set_conns))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
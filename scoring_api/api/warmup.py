@@ -0,0 +1,158 @@
+"""
+Warm-up of the local cache tiers before the server takes traffic.
+
+Hot keys file has one key per line: a client id, whose interests are loaded to the interest cache,
+or a score cache key, loaded to the local score cache: `u:<hex digest>` for the canonical binary keys
+and `uid:...` for the legacy ones. The file can be written by hand or dumped periodically by a running server
+from its recent traffic, see `SnapshotWriter`.
+"""
+import os
+import logging
+import threading
+
+from collections import OrderedDict
+
+from scoring_api.api import scoring
+from scoring_api.api.exceptions import StoreConnectionError
+
+HOT_KEYS_SIZE = 10000
+CHUNK_SIZE = 1000
+LEGACY_SCORE_KEY_PREFIX = 'uid:'
+SCORE_KEY_PREFIX = scoring.SCORE_KEY_PREFIX.decode('ascii')
+
+
+class HotKeys:
+    """Most recently requested client ids and score keys, no more than `maxsize` of them."""
+
+    def __init__(self, maxsize=HOT_KEYS_SIZE):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, keys):
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+    def snapshot(self):
+        """Keys from the most recent one."""
+        with self._lock:
+            return list(reversed(self._keys))
+
+    def dump(self, path):
+        """Writes the snapshot to `path` atomically, readers never see a partially written file."""
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.writelines(f'{format_key(key)}\n' for key in self.snapshot())
+        os.replace(tmp, path)
+
+
+def format_key(key):
+    """Text form of a hot key, binary score keys are written as hex."""
+    if isinstance(key, bytes):
+        return SCORE_KEY_PREFIX + key[len(scoring.SCORE_KEY_PREFIX):].hex()
+    return key
+
+
+def parse_score_key(line):
+    """Score key of a hot keys file line, None if the line is not a score key."""
+    if line.startswith(LEGACY_SCORE_KEY_PREFIX):
+        return line
+    if line.startswith(SCORE_KEY_PREFIX):
+        try:
+            return scoring.SCORE_KEY_PREFIX + bytes.fromhex(line[len(SCORE_KEY_PREFIX):])
+        except ValueError:
+            return None
+    return None
+
+
+def track(maxsize=HOT_KEYS_SIZE):
+    """Start recording keys requested from the store, returns the `HotKeys`."""
+    scoring.hot_keys = HotKeys(maxsize)
+    return scoring.hot_keys
+
+
+class SnapshotWriter(threading.Thread):
+    """Dumps `hot_keys` to `path` every `interval` seconds, start it in every worker process."""
+
+    def __init__(self, hot_keys, path, interval):
+        super().__init__(name='hot-keys-snapshot', daemon=True)
+        self.hot_keys = hot_keys
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            if not len(self.hot_keys):
+                continue
+            try:
+                self.hot_keys.dump(self.path)
+            except OSError as e:
+                logging.warning("Hot keys are not dumped to %s: %s" % (self.path, e))
+
+    def stop(self):
+        self._stopped.set()
+
+
+def read_keys(path):
+    """Client ids and score keys of the hot keys file, unknown lines are skipped."""
+    client_ids, score_keys = [], []
+    with open(path) as f:
+        for line in f:
+            key = line.strip()
+            if key.isdigit():
+                client_ids.append(int(key))
+            elif (score_key := parse_score_key(key)) is not None:
+                score_keys.append(score_key)
+    return client_ids, score_keys
+
+
+def _chunks(keys):
+    for i in range(0, len(keys), CHUNK_SIZE):
+        yield keys[i:i + CHUNK_SIZE]
+
+
+def _read(path):
+    try:
+        return read_keys(path)
+    except OSError as e:
+        logging.warning("Warm-up skipped, hot keys are not read from %s: %s" % (path, e))
+        return [], []
+
+
+def warm_up(store, path):
+    """
+    Loads interests of the hot clients and the hot cached scores of `path` to the local tiers of `store`
+    with batched reads. Store errors stop the warm-up but not the server start.
+    Returns numbers of the loaded client ids and score keys.
+    """
+    client_ids, score_keys = _read(path)
+    try:
+        for chunk in _chunks([scoring.interests_key(cid) for cid in client_ids]):
+            store.get_many(chunk)
+        for chunk in _chunks(score_keys):
+            store.cache_get_many(chunk)
+    except StoreConnectionError as e:
+        logging.warning("Warm-up stopped: %s" % e)
+    logging.info("Warmed up %s client ids, %s score keys" % (len(client_ids), len(score_keys)))
+    return len(client_ids), len(score_keys)
+
+
+async def warm_up_async(store, path):
+    client_ids, score_keys = _read(path)
+    try:
+        for chunk in _chunks([scoring.interests_key(cid) for cid in client_ids]):
+            await store.get_many(chunk)
+        for chunk in _chunks(score_keys):
+            await store.cache_get_many(chunk)
+    except StoreConnectionError as e:
+        logging.warning("Warm-up stopped: %s" % e)
+    logging.info("Warmed up %s client ids, %s score keys" % (len(client_ids), len(score_keys)))
+    return len(client_ids), len(score_keys)
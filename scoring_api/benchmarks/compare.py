@@ -0,0 +1,64 @@
+"""
+Compare two benchmark reports of the same kind and fail on regressions.
+
+    $ python -m scoring_api.benchmarks.compare baseline.json current.json --threshold 10
+
+Exits with status 1 if throughput dropped or p99 latency grew by more than `threshold` percent.
+"""
+import sys
+import json
+from optparse import OptionParser
+
+# metric name -> True if bigger is better
+METRICS = {
+    "micro": {"ops_per_sec": True, "p99_us": False, "alloc_peak_bytes": False},
+    "load": {"rps": True, "p99_ms": False},
+}
+
+
+def flatten(report):
+    if report["kind"] == "micro":
+        return report["results"]
+    result = report["result"]
+    rows = {"total": result}
+    rows.update(result.get("methods", {}))
+    return rows
+
+
+def compare(baseline, current, threshold):
+    if baseline["kind"] != current["kind"]:
+        raise ValueError(f'can not compare {baseline["kind"]} report with {current["kind"]} report')
+    metrics = METRICS[current["kind"]]
+    base_rows, rows = flatten(baseline), flatten(current)
+    lines, regressions = [], []
+    for name, row in rows.items():
+        if name not in base_rows:
+            continue
+        for metric, higher_is_better in metrics.items():
+            old, new = base_rows[name].get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            regressed = change < -threshold if higher_is_better else change > threshold
+            lines.append(f'{"!" if regressed else " "} {name:45} {metric:18} {old:14.2f} -> {new:14.2f} {change:+7.1f}%')
+            if regressed:
+                regressions.append((name, metric, change))
+    return lines, regressions
+
+
+def main():
+    op = OptionParser(usage="%prog [options] baseline.json current.json")
+    op.add_option("--threshold", action="store", type=float, default=10.0, help="allowed change, percent")
+    opts, args = op.parse_args()
+    if len(args) != 2:
+        op.error("baseline and current reports are required")
+    with open(args[0]) as baseline, open(args[1]) as current:
+        lines, regressions = compare(json.load(baseline), json.load(current), opts.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {opts.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
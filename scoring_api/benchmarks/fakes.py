@@ -0,0 +1,67 @@
+import random
+import threading
+
+from time import sleep, monotonic
+
+INTERESTS = ["cars", "pets", "travel", "hi-tech", "sport", "music", "books", "tv", "cinema", "geek", "otus"]
+
+
+class InMemoryStore:
+    """
+    Thread safe in-memory stand-in for `RedisStore` with an optional simulated round trip latency per call.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sets = {}
+        self.cache = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency:
+            sleep(self.latency)
+
+    def set_connection(self):
+        pass
+
+    def populate(self, nclients, seed=0):
+        rnd = random.Random(seed)
+        with self._lock:
+            for cid in range(nclients):
+                self.sets[f'i:{cid}'.encode('utf-8')] = {i.encode('utf-8') for i in rnd.sample(INTERESTS, 2)}
+
+    def get(self, key):
+        self._round_trip()
+        return self.sets.get(key if isinstance(key, bytes) else key.encode('utf-8'), set())
+
+    def get_many(self, keys):
+        self._round_trip()
+        return [self.sets.get(key if isinstance(key, bytes) else key.encode('utf-8'), set()) for key in keys]
+
+    def _cache_lookup(self, key, now):
+        entry = self.cache.get(key)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry[0]
+
+    def cache_get(self, key):
+        self._round_trip()
+        return self._cache_lookup(key, monotonic())
+
+    def cache_get_many(self, keys):
+        self._round_trip()
+        now = monotonic()
+        return [self._cache_lookup(key, now) for key in keys]
+
+    def cache_set(self, key, value, expire_ms):
+        self._round_trip()
+        with self._lock:
+            self.cache[key] = (str(value).encode('utf-8'), monotonic() + expire_ms / 1000)
+        return True
+
+    def cache_set_many(self, mapping, expire_ms):
+        self._round_trip()
+        expires_at = monotonic() + expire_ms / 1000
+        with self._lock:
+            for key, value in mapping.items():
+                self.cache[key] = (str(value).encode('utf-8'), expires_at)
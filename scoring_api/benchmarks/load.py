@@ -0,0 +1,200 @@
+"""
+End-to-end load generator for the `/method` endpoint.
+
+Drives an in-process server backed by an in-memory fake store (default) or a local redis-server,
+or an already running server given by `--url`:
+
+    $ python -m scoring_api.benchmarks.load --duration 10 --concurrency 16 --threads 8
+    $ python -m scoring_api.benchmarks.load --store redis --redis-port 6379 --mix online_score=1
+    $ python -m scoring_api.benchmarks.load --url http://127.0.0.1:8080/method/
+
+Prints one JSON object with throughput, latency percentiles and response code counts, in total and per method.
+"""
+import sys
+import json
+import logging
+import threading
+import http.client
+import tracemalloc
+
+from time import perf_counter, sleep
+from urllib.parse import urlsplit
+from optparse import OptionParser
+from collections import Counter, defaultdict
+
+from scoring_api.api import api
+from scoring_api.api.store import RedisStore
+from scoring_api.api.server import ThreadPoolHTTPServer
+from scoring_api.benchmarks.fakes import InMemoryStore
+from scoring_api.benchmarks.workload import Workload, latency_summary
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        method, _, weight = item.partition('=')
+        mix[method.strip()] = float(weight or 1)
+    return mix
+
+
+def start_server(store, threads):
+    handler = type('BenchmarkHandler', (api.MainHTTPHandler,), {
+        'store': store,
+        'log_message': lambda *args: None,
+    })
+    server = ThreadPoolHTTPServer(('127.0.0.1', 0), handler, threads=threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_store(opts):
+    if opts.store == 'redis':
+        store = RedisStore(host=opts.redis_host, port=opts.redis_port, db=opts.redis_db, socket_connect_timeout=3)
+        store.set_connection()
+        pipe = store.conn.pipeline(transaction=False)
+        fake = InMemoryStore()
+        fake.populate(opts.max_client_id)
+        for key, interests in fake.sets.items():
+            pipe.delete(key)
+            pipe.sadd(key, *interests)
+        pipe.execute()
+        return store
+    store = InMemoryStore(latency=opts.latency / 1000)
+    store.populate(opts.max_client_id)
+    return store
+
+
+class LoadGenerator:
+
+    def __init__(self, host, port, path, workload_factory, concurrency, duration=None, requests=None):
+        self.host, self.port, self.path = host, port, path
+        self.workload_factory = workload_factory
+        self.concurrency = concurrency
+        self.duration = duration
+        self.requests = requests
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.codes = defaultdict(Counter)
+        self.errors = Counter()
+        self.sent = 0
+
+    def take(self):
+        with self.lock:
+            if self.requests is not None and self.sent >= self.requests:
+                return False
+            self.sent += 1
+            return True
+
+    def worker(self, n, deadline):
+        workload = self.workload_factory(n)
+        latencies, codes = defaultdict(list), defaultdict(Counter)
+        while (deadline is None or perf_counter() < deadline) and self.take():
+            body = workload.next_body()
+            method = body["method"]
+            data = json.dumps(body).encode('utf-8')
+            started = perf_counter()
+            try:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                conn.request('POST', self.path, data, {'Content-Type': 'application/json'})
+                code = json.loads(conn.getresponse().read()).get("code")
+                conn.close()
+            except Exception as err:
+                with self.lock:
+                    self.errors[err.__class__.__name__] += 1
+                continue
+            latencies[method].append(perf_counter() - started)
+            codes[method][code] += 1
+        with self.lock:
+            for method, values in latencies.items():
+                self.latencies[method].extend(values)
+                self.codes[method].update(codes[method])
+
+    def run(self):
+        started = perf_counter()
+        deadline = started + self.duration if self.duration else None
+        workers = [threading.Thread(target=self.worker, args=(n, deadline)) for n in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        total = [v for values in self.latencies.values() for v in values]
+        codes = Counter()
+        methods = {}
+        for method, values in self.latencies.items():
+            codes.update(self.codes[method])
+            methods[method] = {"requests": len(values), "rps": len(values) / elapsed, **latency_summary(values),
+                               "codes": {str(k): v for k, v in self.codes[method].items()}}
+        return {
+            "requests": len(total),
+            "elapsed_sec": elapsed,
+            "rps": len(total) / elapsed if elapsed else 0.0,
+            **latency_summary(total),
+            "codes": {str(k): v for k, v in codes.items()},
+            "errors": dict(self.errors),
+            "methods": methods,
+        }
+
+
+def main():
+    op = OptionParser()
+    op.add_option("--url", action="store", default=None, help="target already running server")
+    op.add_option("--store", action="store", choices=["fake", "redis"], default="fake")
+    op.add_option("--latency", action="store", type=float, default=0.0, help="fake store round trip, ms")
+    op.add_option("--redis-host", action="store", default="localhost")
+    op.add_option("--redis-port", action="store", type=int, default=6379)
+    op.add_option("--redis-db", action="store", type=int, default=1)
+    op.add_option("-t", "--threads", action="store", type=int, default=8, help="in-process server threads")
+    op.add_option("-c", "--concurrency", action="store", type=int, default=8, help="concurrent clients")
+    op.add_option("-d", "--duration", action="store", type=float, default=10.0, help="seconds")
+    op.add_option("-n", "--requests", action="store", type=int, default=None, help="stop after N requests")
+    op.add_option("--mix", action="store", default="online_score=0.7,clients_interests=0.3")
+    op.add_option("--nclients", action="store", type=int, default=10, help="client ids per clients_interests")
+    op.add_option("--max-client-id", action="store", type=int, default=10000)
+    op.add_option("--hot-ratio", action="store", type=float, default=0.5)
+    op.add_option("--trace-allocations", action="store_true", default=False,
+                  help="report memory allocated by the in-process server during the run")
+    op.add_option("-o", "--output", action="store", default=None)
+    opts, args = op.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    server = None
+    if opts.url:
+        url = urlsplit(opts.url)
+        host, port, path = url.hostname, url.port or 80, url.path or '/method/'
+    else:
+        server = start_server(make_store(opts), opts.threads)
+        (host, port), path = server.server_address, '/method/'
+    mix = parse_mix(opts.mix)
+
+    def workload_factory(n):
+        return Workload(mix=mix, nclients=opts.nclients, max_client_id=opts.max_client_id,
+                        hot_ratio=opts.hot_ratio, seed=n)
+
+    if opts.trace_allocations:
+        tracemalloc.start()
+    generator = LoadGenerator(host, port, path, workload_factory, opts.concurrency,
+                              duration=None if opts.requests else opts.duration, requests=opts.requests)
+    result = generator.run()
+    if opts.trace_allocations:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["alloc_peak_bytes"] = peak
+        result["alloc_current_bytes"] = current
+    if server:
+        server.shutdown()
+        sleep(0.1)
+        server.server_close()
+
+    report = {"kind": "load", "target": opts.url or f"in-process:{opts.store}", "concurrency": opts.concurrency,
+              "threads": None if opts.url else opts.threads, "mix": mix, "result": result}
+    output = open(opts.output, 'w') if opts.output else sys.stdout
+    json.dump(report, output, indent=2)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
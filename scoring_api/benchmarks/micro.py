@@ -0,0 +1,140 @@
+"""
+Micro benchmarks of the request hot path pieces.
+
+    $ python -m scoring_api.benchmarks.micro --number 20000 --output micro.json
+
+Prints one JSON object with a result per case: ops/s, per call latency percentiles in microseconds
+and peak bytes allocated per call.
+"""
+import sys
+import json
+import random
+import platform
+import tracemalloc
+
+from time import perf_counter_ns
+from optparse import OptionParser
+
+from scoring_api.api import api, codec, engine
+from scoring_api.api.scoring import get_score_key
+from scoring_api.benchmarks.fakes import InMemoryStore
+from scoring_api.benchmarks.workload import method_body, score_arguments, clients_interests_arguments, percentile
+
+
+def measure(func, number, alloc_number):
+    for _ in range(min(number, 100)):
+        func()
+    samples = []
+    for _ in range(number):
+        started = perf_counter_ns()
+        func()
+        samples.append(perf_counter_ns() - started)
+    samples.sort()
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(alloc_number):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        func()
+        peak += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    total = sum(samples)
+    return {
+        "ops_per_sec": number / total * 1e9 if total else 0.0,
+        "mean_us": total / number / 1000,
+        "p50_us": percentile(samples, 50) / 1000,
+        "p95_us": percentile(samples, 95) / 1000,
+        "p99_us": percentile(samples, 99) / 1000,
+        "alloc_peak_bytes": peak / alloc_number if alloc_number else 0.0,
+    }
+
+
+def build_cases(nclients):
+    rnd = random.Random(0)
+    store = InMemoryStore()
+    store.populate(nclients)
+    score_args = {"phone": "79175002040", "email": "stupnikov@otus.ru", "first_name": "Иван",
+                  "last_name": "Иванов", "birthday": "01.01.1990", "gender": 1}
+    score_body = method_body("online_score", score_args)
+    interests_body = method_body("clients_interests", clients_interests_arguments(rnd, nclients, nclients))
+    admin_body = method_body("online_score", score_args, login=api.ADMIN_LOGIN)
+    method_request = api.MethodRequest.load(score_body)
+    admin_request = api.MethodRequest.load(admin_body)
+    score_request = api.OnlineScoreRequest.load(score_args)
+    score_body_raw = json.dumps(score_body).encode('utf-8')
+    interests_response = api.make_response(
+        api.method_handler({"body": interests_body, "headers": {}}, {}, store)[0], api.OK)
+    random_scores = [score_arguments(rnd) for _ in range(1000)]
+    score_records = [api.OnlineScoreRequest.load(args).as_dict() for args in random_scores]
+    scoring_engine = engine.get_engine()
+    counter = iter(range(10 ** 9))
+
+    def handle(body):
+        return lambda: api.method_handler({"body": body, "headers": {}}, {}, store)
+
+    cases = {
+        "validate_method_request": lambda: api.MethodRequest.load(score_body),
+        "validate_online_score_request": lambda: api.OnlineScoreRequest.load(score_args),
+        "validate_online_score_request_random": lambda: api.OnlineScoreRequest.load(
+            random_scores[next(counter) % len(random_scores)]),
+        "validate_clients_interests_request": lambda: api.ClientsInterestsRequest.load(interests_body["arguments"]),
+        "check_auth_user": lambda: api.check_auth(method_request),
+        "check_auth_admin": lambda: api.check_auth(admin_request),
+        "get_score_key": lambda: get_score_key(score_request.phone, score_request.birthday,
+                                               score_request.first_name, score_request.last_name),
+        # codec used by the handlers, i.e. the fastest installed backend
+        "json_decode_online_score": lambda: codec.loads(score_body_raw),
+        "json_encode_online_score": lambda: codec.dumps({"response": {"score": 5.0}, "code": 200}),
+        "json_encode_clients_interests": lambda: codec.dumps(interests_response),
+        "score_many_1000": lambda: scoring_engine.score_many(score_records),
+        "score_many_1000[python]": lambda: [scoring_engine.score(**r) for r in score_records],
+        "method_handler_online_score": handle(score_body),
+        "method_handler_clients_interests": handle(interests_body),
+    }
+    if engine.np is not None:
+        score_columns = engine.to_columns(score_records)
+        cases["score_columns_1000"] = lambda: scoring_engine.score_columns(score_columns)
+    for backend in codec.available_backends():
+        _, loads, dumps = codec.get_backend(backend)
+        cases.update({
+            f"json_decode_online_score[{backend}]": lambda loads=loads: loads(score_body_raw),
+            f"json_encode_online_score[{backend}]": lambda dumps=dumps: dumps({"response": {"score": 5.0},
+                                                                               "code": 200}),
+            f"json_encode_clients_interests[{backend}]": lambda dumps=dumps: dumps(interests_response),
+        })
+    return cases
+
+
+def run(number=20000, alloc_number=1000, nclients=100, only=None):
+    results = {}
+    for name, func in build_cases(nclients).items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        results[name] = measure(func, number, alloc_number)
+    return {
+        "kind": "micro",
+        "python": platform.python_version(),
+        "number": number,
+        "nclients": nclients,
+        "results": results,
+    }
+
+
+def main():
+    op = OptionParser()
+    op.add_option("-n", "--number", action="store", type=int, default=20000, help="timed calls per case")
+    op.add_option("--alloc-number", action="store", type=int, default=1000, help="traced calls per case")
+    op.add_option("--nclients", action="store", type=int, default=100, help="client ids per clients_interests")
+    op.add_option("-k", "--only", action="append", default=None, help="run only cases containing substring")
+    op.add_option("-o", "--output", action="store", default=None)
+    opts, args = op.parse_args()
+    report = run(opts.number, opts.alloc_number, opts.nclients, opts.only)
+    output = open(opts.output, 'w') if opts.output else sys.stdout
+    json.dump(report, output, indent=2)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import random
+import hashlib
+
+from datetime import datetime
+
+from scoring_api.api import api
+
+ACCOUNT, LOGIN = "horns&hoofs", "h&f"
+FIRST_NAMES = ["Иван", "Пётр", "Анна", "Мария", "John", "Jane"]
+LAST_NAMES = ["Иванов", "Петрова", "Сидоров", "Smith", "Doe"]
+
+
+def user_token(account=ACCOUNT, login=LOGIN):
+    return hashlib.sha512((account + login + api.SALT).encode('utf-8')).hexdigest()
+
+
+def admin_token():
+    return hashlib.sha512((datetime.now().strftime("%Y%m%d%H") + api.ADMIN_SALT).encode('utf-8')).hexdigest()
+
+
+def method_body(method, arguments, login=LOGIN):
+    token = admin_token() if login == api.ADMIN_LOGIN else user_token(login=login)
+    return {"account": ACCOUNT, "login": login, "method": method, "token": token, "arguments": arguments}
+
+
+def score_arguments(rnd, identity=None):
+    """Random `online_score` arguments, same `identity` gives the same arguments."""
+    rnd = random.Random(identity) if identity is not None else rnd
+    arguments = {}
+    if rnd.random() < 0.8:
+        arguments["phone"] = rnd.choice([str, int])(70000000000 + rnd.randrange(10 ** 10))
+        arguments["email"] = f"user{rnd.randrange(10 ** 6)}@example.ru"
+    if rnd.random() < 0.6:
+        arguments["first_name"] = rnd.choice(FIRST_NAMES)
+        arguments["last_name"] = rnd.choice(LAST_NAMES)
+    if rnd.random() < 0.5 or not arguments:
+        arguments["gender"] = rnd.choice([0, 1, 2])
+        arguments["birthday"] = f"{rnd.randint(1, 28):02}.{rnd.randint(1, 12):02}.{rnd.randint(1960, 2005)}"
+    return arguments
+
+
+def clients_interests_arguments(rnd, nclients, max_client_id):
+    return {"client_ids": rnd.sample(range(max_client_id), nclients), "date": "20.07.2017"}
+
+
+class Workload:
+    """
+    Generator of realistic `/method` request bodies.
+    `mix` - weights of methods, `hot_ratio` - share of score requests repeating one of `hot_keys` identities.
+    """
+
+    def __init__(self, mix=None, nclients=10, max_client_id=10000, hot_ratio=0.5, hot_keys=100, seed=0):
+        self.mix = mix or {"online_score": 0.7, "clients_interests": 0.3}
+        self.nclients = nclients
+        self.max_client_id = max_client_id
+        self.hot_ratio = hot_ratio
+        self.hot_keys = hot_keys
+        self.rnd = random.Random(seed)
+
+    def next_body(self):
+        method = self.rnd.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if method == "clients_interests":
+            arguments = clients_interests_arguments(self.rnd, self.nclients, self.max_client_id)
+        elif method == "online_score_batch":
+            arguments = {"items": [self.next_score_arguments() for _ in range(self.nclients)]}
+        else:
+            arguments = self.next_score_arguments()
+        return method_body(method, arguments)
+
+    def next_score_arguments(self):
+        identity = self.rnd.randrange(self.hot_keys) if self.rnd.random() < self.hot_ratio else None
+        return score_arguments(self.rnd, identity)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    """p50/p95/p99/max in milliseconds for list of latencies in seconds."""
+    values = sorted(latencies)
+    return {
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
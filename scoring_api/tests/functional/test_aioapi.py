@@ -0,0 +1,149 @@
+import json
+import asyncio
+import hashlib
+import datetime
+import unittest
+from unittest.mock import AsyncMock
+
+from scoring_api.api import api, aioapi
+
+
+class AsyncTestSuite(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.context = {}
+        self.store = AsyncMock(
+            cache_get=AsyncMock(return_value=None),
+            cache_set=AsyncMock(return_value=True),
+            get=AsyncMock(return_value=[b'music', b'books']),
+            cache_get_many=AsyncMock(side_effect=lambda keys: [None] * len(keys)),
+            cache_set_many=AsyncMock(return_value=None),
+            get_many=AsyncMock(side_effect=lambda keys: [[b'music', b'books']] * len(keys)),
+        )
+
+    @staticmethod
+    def make_request(method, arguments, login="h&f"):
+        request = {"account": "horns&hoofs", "login": login, "method": method, "arguments": arguments}
+        if login == api.ADMIN_LOGIN:
+            msg = datetime.datetime.now().strftime("%Y%m%d%H") + api.ADMIN_SALT
+        else:
+            msg = request["account"] + request["login"] + api.SALT
+        request["token"] = hashlib.sha512(msg.encode('utf-8')).hexdigest()
+        return request
+
+    async def get_response(self, request):
+        return await aioapi.method_handler({"body": request, "headers": {}}, self.context, self.store)
+
+    async def test_bad_auth(self):
+        request = self.make_request("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})
+        request["token"] = ""
+        _, code = await self.get_response(request)
+        self.assertEqual(api.FORBIDDEN, code)
+
+    async def test_ok_score_request(self):
+        arguments = {"phone": 79175002040, "email": "stupnikov@otus.ru", "gender": 1, "birthday": "01.01.2000"}
+        response, code = await self.get_response(self.make_request("online_score", arguments))
+        self.assertEqual(api.OK, code)
+        self.assertEqual(response, {"score": 4.5})
+        self.store.cache_set.assert_awaited_once()
+
+    async def test_ok_score_admin_request(self):
+        arguments = {"phone": "79175002040", "email": "stupnikov@otus.ru"}
+        response, code = await self.get_response(self.make_request("online_score", arguments, login="admin"))
+        self.assertEqual(api.OK, code)
+        self.assertEqual(response, {"score": 42})
+
+    async def test_invalid_score_request(self):
+        for arguments in ({"phone": "79175002040"}, {"client_ids": [1, 2]}):
+            response, code = await self.get_response(self.make_request("online_score", arguments))
+            self.assertEqual(api.INVALID_REQUEST, code, arguments)
+            self.assertTrue(len(response))
+
+    async def test_ok_score_batch_request(self):
+        arguments = {"items": [{"first_name": "a", "last_name": "b"}, {"phone": "79175002040"}]}
+        response, code = await self.get_response(self.make_request("online_score_batch", arguments))
+        self.assertEqual(api.OK, code)
+        self.assertEqual(response[0], {"score": 0.5})
+        self.assertIn("error", response[1])
+        self.store.cache_set_many.assert_awaited_once()
+
+    async def test_ok_interests_request(self):
+        response, code = await self.get_response(self.make_request("clients_interests", {"client_ids": [1, 2, 3]}))
+        self.assertEqual(api.OK, code)
+        self.assertDictEqual(response, {str(i): ['music', 'books'] for i in (1, 2, 3)})
+        self.assertEqual(self.context["nclients"], 3)
+
+    async def test_http_server(self):
+        server = await asyncio.start_server(aioapi.AsyncHTTPServer(self.store).handle_connection, 'localhost', 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        body = json.dumps(self.make_request("clients_interests", {"client_ids": [1]})).encode('utf-8')
+        async with server:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b'POST /method/ HTTP/1.0\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+            data = await reader.read()
+            writer.close()
+        head, _, payload = data.partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200 OK'))
+        self.assertIn(b'Connection: close', head)
+        self.assertDictEqual(json.loads(payload), {"code": 200, "response": {"1": ["music", "books"]}})
+
+    async def test_http_server_keep_alive(self):
+        handler = aioapi.AsyncHTTPServer(self.store, max_requests=2)
+        server = await asyncio.start_server(handler.handle_connection, 'localhost', 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        body = json.dumps(self.make_request("clients_interests", {"client_ids": [1]})).encode('utf-8')
+        request = b'POST /method/ HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+        async with server:
+            reader, writer = await asyncio.open_connection(host, port)
+            # pipelined requests are answered in order, the connection is closed after max_requests
+            writer.write(request * 2)
+            data = await asyncio.wait_for(reader.read(), 1)
+            writer.close()
+        self.assertEqual(data.count(b'HTTP/1.1 200 OK'), 2)
+        self.assertEqual(data.count(b'Connection: keep-alive'), 1)
+        self.assertEqual(data.count(b'Connection: close'), 1)
+
+    async def test_http_server_body_limits(self):
+        handler = aioapi.AsyncHTTPServer(self.store, max_body_size=100, max_json_depth=3)
+        server = await asyncio.start_server(handler.handle_connection, 'localhost', 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        responses = []
+        async with server:
+            for data in [b'Content-Length: 101\r\n\r\n', b'Content-Length: x\r\n\r\n',
+                         b'Content-Length: 8\r\n\r\n[[[[]]]]']:
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write(b'POST /method/ HTTP/1.1\r\n' + data)
+                await writer.drain()
+                responses.append(await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 1))
+                writer.close()
+        self.assertListEqual([r.split(b' ')[1] for r in responses], [b'413', b'400', b'413'])
+        self.assertIn(b'Connection: close', responses[0])
+        self.assertIn(b'Connection: keep-alive', responses[2])
+
+    async def test_http_server_drain(self):
+        async def slow_get_many(keys):
+            await asyncio.sleep(0.2)
+            return [[b'music']] * len(keys)
+
+        self.store.get_many.side_effect = slow_get_many
+        handler = aioapi.AsyncHTTPServer(self.store)
+        server = await asyncio.start_server(handler.handle_connection, 'localhost', 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        body = json.dumps(self.make_request("clients_interests", {"client_ids": [1]})).encode('utf-8')
+        async with server:
+            idle_reader, idle_writer = await asyncio.open_connection(host, port)
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b'POST /method/ HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+            await asyncio.sleep(0.05)
+            server.close()
+            await handler.drain(1)
+            self.assertEqual(await idle_reader.read(), b'')
+            data = await reader.read()
+            idle_writer.close()
+            writer.close()
+        self.assertTrue(data.startswith(b'HTTP/1.1 200 OK'))
+        self.assertIn(b'Connection: close', data)
+        self.assertDictEqual(handler.connections, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
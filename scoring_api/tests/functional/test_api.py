@@ -14,6 +14,9 @@ class TestSuite(unittest.TestCase):
             cache_get=Mock(return_value=None),
             cache_set=Mock(return_value=True),
             get=Mock(return_value=[b'music', b'books', b'movies']),
+            cache_get_many=Mock(side_effect=lambda keys: [None] * len(keys)),
+            cache_set_many=Mock(return_value=None),
+            get_many=Mock(side_effect=lambda keys: [[b'music', b'books', b'movies']] * len(keys)),
         )
 
     def get_response(self, request):
@@ -102,6 +105,51 @@ class TestSuite(unittest.TestCase):
         score = response.get("score")
         self.assertEqual(score, 42)
 
+    @cases([
+        {},
+        {"items": []},
+        {"items": {"phone": "79175002040"}},
+        {"items": [{"phone": "79175002040"}, "test"]},
+    ])
+    def test_invalid_score_batch_request(self, arguments):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score_batch", "arguments": arguments}
+        self.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.INVALID_REQUEST, code, arguments)
+        self.assertTrue(len(response))
+
+    def test_ok_score_batch_request(self):
+        arguments = {"items": [
+            {"phone": "79175002040", "email": "stupnikov@otus.ru"},
+            {"phone": "79175002040"},
+            {"first_name": "a", "last_name": "b"},
+            {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": "01.01.2000",
+             "first_name": "a", "last_name": "b"},
+        ]}
+        self.settings.cache_get_many = Mock(side_effect=lambda keys: [None, b'2.5', None])
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score_batch", "arguments": arguments}
+        self.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.OK, code)
+        self.assertEqual(len(response), 4)
+        self.assertDictEqual(response[0], {"score": 3.0})
+        self.assertIn("error", response[1])
+        self.assertDictEqual(response[2], {"score": 2.5})
+        self.assertDictEqual(response[3], {"score": 5.0})
+        self.settings.cache_get_many.assert_called_once()
+        self.assertEqual(len(self.settings.cache_set_many.call_args.args[0]), 2)
+        self.assertEqual(self.context["nitems"], 4)
+
+    def test_ok_score_batch_admin_request(self):
+        arguments = {"items": [{"phone": "79175002040", "email": "stupnikov@otus.ru"}, {}]}
+        request = {"account": "horns&hoofs", "login": "admin", "method": "online_score_batch", "arguments": arguments}
+        self.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.OK, code)
+        self.assertEqual(response[0], {"score": 42})
+        self.assertIn("error", response[1])
+        self.settings.cache_get_many.assert_not_called()
+
     @cases([
         {},
         {"date": "20.07.2017"},
@@ -132,6 +180,47 @@ class TestSuite(unittest.TestCase):
                             for v in response.values()))
         self.assertEqual(self.context.get("nclients"), len(arguments["client_ids"]))
 
+    def test_too_many_client_ids(self):
+        arguments = {"client_ids": list(range(api.MAX_CLIENT_IDS + 1))}
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests", "arguments": arguments}
+        self.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.PAYLOAD_TOO_LARGE, code)
+        self.assertIn(str(api.MAX_CLIENT_IDS), response)
+
+
+class MakeStoreTestCase(unittest.TestCase):
+    def make_store(self, *args):
+        opts = Mock()
+        opts.redis, opts.local_cache_size, opts.local_cache_ttl = list(args) or None, 100, 10
+        opts.store_failure_threshold, opts.store_recovery_timeout = 5, 5
+        opts.interest_cache_size, opts.interest_cache_ttl, opts.shared_cache = 0, 0, False
+        return api.make_store(opts)
+
+    def test_single_node(self):
+        store = self.make_store()
+        self.assertIsInstance(store, api.RedisStore)
+        self.assertEqual(store.connection_kwargs['host'], 'localhost')
+
+    def test_shards_and_replicas(self):
+        store = self.make_store('10.0.0.1:6379,10.0.0.2:6380', '10.0.0.3:6379')
+        self.assertIsInstance(store, api.ShardedStore)
+        first, second = store.shards
+        self.assertEqual(first.connection_kwargs['host'], '10.0.0.1')
+        self.assertListEqual([(r['host'], r['port']) for r in first.replicas], [('10.0.0.2', 6380)])
+        self.assertListEqual(second.replicas, [])
+        self.assertIs(first.local_cache, second.local_cache)
+        self.assertIsNot(first.breaker, second.breaker)
+        store.executor.shutdown()
+
+    def test_shared_cache(self):
+        opts = Mock(redis=None, local_cache_size=100, local_cache_ttl=10, interest_cache_size=100,
+                    interest_cache_ttl=10, interest_cache_invalidation='off', shared_cache=True)
+        store = api.make_store(opts)
+        self.assertIsInstance(store.local_cache, api.SharedCache)
+        self.assertIsInstance(store.interest_cache, api.SharedCache)
+        self.assertIsNot(store.local_cache, store.interest_cache)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+from scoring_api.benchmarks import micro, compare
+from scoring_api.benchmarks.fakes import InMemoryStore
+from scoring_api.benchmarks.load import LoadGenerator, start_server
+from scoring_api.benchmarks.workload import Workload
+
+
+class BenchmarksTestCase(unittest.TestCase):
+
+    def test_micro(self):
+        report = micro.run(number=10, alloc_number=2, nclients=5)
+        self.assertIn('method_handler_online_score', report['results'])
+        for result in report['results'].values():
+            self.assertGreater(result['ops_per_sec'], 0)
+
+    def test_load(self):
+        store = InMemoryStore()
+        store.populate(100)
+        server = start_server(store, threads=2)
+        try:
+            generator = LoadGenerator(*server.server_address, '/method/', lambda n: Workload(max_client_id=100, seed=n),
+                                      concurrency=2, requests=20)
+            result = generator.run()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(result['requests'], 20)
+        self.assertDictEqual(result['codes'], {'200': 20})
+
+    def test_compare(self):
+        baseline = {'kind': 'load', 'result': {'rps': 100.0, 'p99_ms': 10.0}}
+        current = {'kind': 'load', 'result': {'rps': 80.0, 'p99_ms': 10.5}}
+        _, regressions = compare.compare(baseline, current, threshold=10)
+        self.assertListEqual([(name, metric) for name, metric, _ in regressions], [('total', 'rps')])
+
+
+if __name__ == '__main__':
+    unittest.main()
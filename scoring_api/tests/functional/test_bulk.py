@@ -0,0 +1,83 @@
+import io
+import csv
+import json
+import unittest
+from optparse import Values
+from unittest.mock import Mock, patch
+
+from scoring_api.api import bulk, scoring
+
+JSONL = '\n'.join([
+    '{"id": 1, "phone": "79175002040", "email": "stupnikov@otus.ru"}',
+    '',
+    'not json',
+    '{"id": 3, "first_name": "a", "last_name": "b"}',
+    '{"id": 4, "phone": "123"}',
+    '[1, 2]',
+    '{"id": 6, "gender": 1, "birthday": "01.01.2000", "first_name": "a", "last_name": "b"}',
+]) + '\n'
+
+CSV = (
+    'id,phone,email,first_name,last_name,birthday,gender\n'
+    'a1,79175002040,stupnikov@otus.ru,,,,\n'
+    'a2,,,Иван,Иванов,01.01.1990,1\n'
+    'a3,123,,,,,\n'
+)
+
+
+def make_opts(**kwargs):
+    opts = dict(format='jsonl', id_field='id', workers=1, chunk_size=2, scoring_weights=None, warm_cache=False,
+                redis=None, store_failure_threshold=5, store_recovery_timeout=5, local_cache_size=0,
+                local_cache_ttl=0, score_cache_ttl=3600, score_cache_stale_ttl=60,
+                score_key_migration=False)
+    opts.update(kwargs)
+    return Values(opts)
+
+
+class BulkTestCase(unittest.TestCase):
+    def tearDown(self):
+        bulk._store = None
+
+    def run_bulk(self, data, **kwargs):
+        output, errors = io.StringIO(), io.StringIO()
+        result = bulk.run(make_opts(**kwargs), io.StringIO(data), output, errors)
+        return result, output.getvalue(), errors.getvalue()
+
+    def test_jsonl(self):
+        (nrows, nerrors), output, errors = self.run_bulk(JSONL)
+        self.assertEqual((nrows, nerrors), (6, 3))
+        self.assertListEqual([json.loads(line) for line in output.splitlines()], [
+            {"line": 1, "id": 1, "score": 3.0},
+            {"line": 4, "id": 3, "score": 0.5},
+            {"line": 7, "id": 6, "score": 2.0},
+        ])
+        self.assertListEqual([(e["line"], e.get("id")) for e in map(json.loads, errors.splitlines())],
+                             [(3, None), (5, 4), (6, None)])
+
+    def test_csv(self):
+        (nrows, nerrors), output, errors = self.run_bulk(CSV, format='csv')
+        self.assertEqual((nrows, nerrors), (3, 1))
+        self.assertListEqual(list(csv.reader(io.StringIO(output))),
+                             [['line', 'id', 'score'], ['2', 'a1', '3.0'], ['3', 'a2', '2.0']])
+        self.assertListEqual(list(csv.reader(io.StringIO(errors)))[1][:2], ['4', 'a3'])
+
+    def test_process_pool(self):
+        _, output, errors = self.run_bulk(JSONL, workers=2, chunk_size=1)
+        _, expected_output, expected_errors = self.run_bulk(JSONL)
+        self.assertEqual(output, expected_output)
+        self.assertEqual(errors, expected_errors)
+
+    def test_warm_cache(self):
+        store = Mock(cache_get_many=Mock(side_effect=lambda keys: [b'5.0'] + [None] * (len(keys) - 1)),
+                     cache_set_many=Mock(return_value=None))
+        with patch('scoring_api.api.bulk.make_store', return_value=store):
+            _, output, _ = self.run_bulk(JSONL, warm_cache=True, chunk_size=10)
+        store.set_connection.assert_called_once()
+        self.assertListEqual([json.loads(line)["score"] for line in output.splitlines()], [5.0, 0.5, 2.0])
+        (written, expire_ms), _ = store.cache_set_many.call_args
+        self.assertListEqual(sorted(scoring.cache_policy.decode(v)[0] for v in written.values()), [0.5, 2.0])
+        self.assertEqual(expire_ms, scoring.cache_policy.expire_ms)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import signal
+import logging
+import tempfile
+import socket
+import hashlib
+import threading
+import unittest
+import http.client
+
+from unittest.mock import Mock, patch
+from concurrent.futures import ThreadPoolExecutor
+
+from scoring_api.api import api, health
+from scoring_api.api.server import ThreadPoolHTTPServer, serve_prefork
+from scoring_api.tests.helpers import wait_exit_code
+
+
+def slow_cache_get(key):
+    time.sleep(0.2)
+
+
+class ThreadPoolServerTestCase(unittest.TestCase):
+    threads = 4
+
+    def setUp(self):
+        handler = type('Handler', (api.MainHTTPHandler,), {
+            'store': Mock(cache_get=Mock(side_effect=slow_cache_get), cache_set=Mock(return_value=True)),
+            'log_message': lambda *args: None,
+        })
+        self.server = ThreadPoolHTTPServer(('localhost', 0), handler, threads=self.threads)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, arguments):
+        body = {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "arguments": arguments,
+                "token": hashlib.sha512(("horns&hoofs" + "h&f" + api.SALT).encode('utf-8')).hexdigest()}
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        conn.request('POST', '/method/', json.dumps(body))
+        response = json.loads(conn.getresponse().read())
+        conn.close()
+        return response
+
+    def test_concurrent_requests(self):
+        arguments = [
+            {"phone": "79175002040", "email": "stupnikov@otus.ru"},
+            {"first_name": "a", "last_name": "b"},
+            {"phone": 79175002040, "email": "stupnikov@otus.ru", "gender": 1, "birthday": "01.01.2000"},
+            {"gender": 1, "birthday": "01.01.2000"},
+        ]
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(arguments)) as executor:
+            responses = list(executor.map(self.post, arguments))
+        elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 0.2 * len(arguments))
+        self.assertListEqual([r['response']['score'] for r in responses], [3.0, 0.5, 4.5, 1.5])
+
+    def test_identical_requests_coalesced(self):
+        arguments = [{"phone": "79175002040", "email": "stupnikov@otus.ru"}] * self.threads
+        with ThreadPoolExecutor(max_workers=len(arguments)) as executor:
+            responses = list(executor.map(self.post, arguments))
+        self.assertListEqual([r['response']['score'] for r in responses], [3.0] * len(arguments))
+        self.assertLess(self.server.RequestHandlerClass.store.cache_get.call_count, len(arguments))
+
+    def test_metrics(self):
+        self.post({"phone": "79175002040", "email": "stupnikov@otus.ru"})
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        conn.request('GET', '/metrics')
+        response = conn.getresponse()
+        body = response.read().decode('utf-8')
+        conn.close()
+        self.assertEqual(response.status, api.OK)
+        self.assertTrue(response.getheader('Content-Type').startswith('text/plain'))
+        self.assertIn('scoring_requests_total{method="online_score",code="200"}', body)
+        self.assertIn('scoring_auth_duration_seconds_count', body)
+        self.assertIn('scoring_score_cache_total{result="miss"}', body)
+
+    def get(self, path):
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        conn.request('GET', path)
+        response = conn.getresponse()
+        body = json.loads(response.read())
+        conn.close()
+        return response.status, body
+
+    def test_health_probes(self):
+        store = self.server.RequestHandlerClass.store
+        self.addCleanup(health.READY.clear)
+        self.assertEqual(self.get('/healthz'), (api.OK, {"status": "ok"}))
+        self.assertEqual(self.get('/readyz'), (api.SERVICE_UNAVAILABLE, {"status": "not ready"}))
+        health.READY.set()
+        store.healthy = True
+        self.assertEqual(self.get('/readyz'), (api.OK, {"status": "ready"}))
+        store.healthy = False
+        self.assertEqual(self.get('/readyz'), (api.SERVICE_UNAVAILABLE, {"status": "store unavailable"}))
+        store.cache_get.assert_not_called()
+
+    def test_get_not_found(self):
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        conn.request('GET', '/unknown')
+        response = conn.getresponse()
+        self.assertEqual(response.status, api.NOT_FOUND)
+        self.assertDictEqual(json.loads(response.read()), {"error": "Not Found", "code": api.NOT_FOUND})
+        conn.close()
+
+
+class KeepAliveTestCase(unittest.TestCase):
+    max_requests = 3
+
+    def setUp(self):
+        handler = type('Handler', (api.MainHTTPHandler,), {
+            'store': Mock(cache_get=Mock(return_value=None), cache_set=Mock(return_value=True)),
+            'max_requests': self.max_requests,
+            'timeout': 1,
+            'log_message': lambda *args: None,
+        })
+        self.server = ThreadPoolHTTPServer(('localhost', 0), handler, threads=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.body = json.dumps({
+            "account": "horns&hoofs", "login": "h&f", "method": "online_score",
+            "arguments": {"first_name": "a", "last_name": "b"},
+            "token": hashlib.sha512(("horns&hoofs" + "h&f" + api.SALT).encode('utf-8')).hexdigest(),
+        }).encode('utf-8')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def raw_request(self, content_length=None):
+        content_length = len(self.body) if content_length is None else content_length
+        return b'POST /method/ HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n' % content_length + self.body
+
+    def read_all(self, data):
+        with socket.create_connection(self.server.server_address, timeout=2) as sock:
+            sock.sendall(data)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+
+    def test_connection_reused(self):
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        conn.request('POST', '/method/', self.body)
+        first = conn.getresponse()
+        self.assertEqual(json.loads(first.read())['response'], {"score": 0.5})
+        sock = conn.sock
+        conn.request('GET', '/unknown')
+        second = conn.getresponse()
+        second.read()
+        self.assertIs(conn.sock, sock)
+        self.assertEqual(second.status, api.NOT_FOUND)
+        self.assertEqual(first.version, 11)
+        self.assertIsNotNone(first.getheader('Content-Length'))
+        conn.close()
+
+    def test_idle_connections_do_not_hold_threads(self):
+        idle = [http.client.HTTPConnection(*self.server.server_address) for _ in range(self.server.threads)]
+        for conn in idle:
+            conn.request('POST', '/method/', self.body)
+            conn.getresponse().read()
+        started = time.monotonic()
+        conn = http.client.HTTPConnection(*self.server.server_address, timeout=2)
+        conn.request('POST', '/method/', self.body)
+        self.assertEqual(conn.getresponse().status, api.OK)
+        self.assertLess(time.monotonic() - started, 0.5)
+        # an idle connection is closed to free a thread
+        closed = 0
+        for c in idle:
+            c.sock.settimeout(0.2)
+            try:
+                closed += c.sock.recv(1) == b''
+            except socket.timeout:
+                pass
+        self.assertGreaterEqual(closed, 1)
+        for conn in idle + [conn]:
+            conn.close()
+
+    def test_pipelined_requests(self):
+        data = self.read_all(self.raw_request() * 2 + b'GET /unknown HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertEqual(data.count(b'HTTP/1.1 200 OK'), 2)
+        self.assertEqual(data.count(b'HTTP/1.1 404'), 1)
+
+    def test_max_requests(self):
+        data = self.read_all(self.raw_request() * (self.max_requests + 1))
+        # connection is closed after max_requests, the rest of the pipeline is dropped
+        self.assertEqual(data.count(b'HTTP/1.1 200 OK'), self.max_requests)
+        self.assertEqual(data.count(b'Connection: close'), 1)
+
+    def test_bad_body_closes_connection(self):
+        data = self.read_all(self.raw_request(content_length=len(self.body) + 10) + self.raw_request())
+        self.assertEqual(data.count(b'HTTP/1.1 400'), 1)
+        self.assertNotIn(b'HTTP/1.1 200 OK', data)
+
+    def test_body_limits(self):
+        self.server.RequestHandlerClass.max_body_size = len(self.body)
+        self.server.RequestHandlerClass.max_json_depth = 3
+        head = b'POST /method/ HTTP/1.1\r\nContent-Length: %s\r\n\r\n'
+        for data, code in [
+            (head % b'%d' % (len(self.body) + 1), b'413'),
+            (head % (b'9' * 100), b'413'),
+            (head % b'-1', b'400'),
+            (head.replace(b'Content-Length: %s\r\n', b''), b'400'),
+        ]:
+            response = self.read_all(data + self.raw_request())
+            # the body is not read and the connection is closed
+            self.assertTrue(response.startswith(b'HTTP/1.1 ' + code), data)
+            self.assertNotIn(b'200 OK', response)
+        # too deep body is read, the connection is kept
+        response = self.read_all(head % b'8' + b'[[[[]]]]' + self.raw_request())
+        self.assertTrue(response.startswith(b'HTTP/1.1 413'))
+        self.assertIn(b'200 OK', response)
+
+    def test_expect_continue_rejected(self):
+        self.server.RequestHandlerClass.max_body_size = 10
+        data = self.read_all(b'POST /method/ HTTP/1.1\r\nContent-Length: 11\r\nExpect: 100-continue\r\n\r\n')
+        self.assertTrue(data.startswith(b'HTTP/1.1 413'))
+        self.assertNotIn(b'100 Continue', data)
+
+    def test_idle_timeout(self):
+        with socket.create_connection(self.server.server_address, timeout=3) as sock:
+            started = time.monotonic()
+            self.assertEqual(sock.recv(1), b'')
+            self.assertLess(time.monotonic() - started, 2.5)
+
+
+class DrainTestCase(unittest.TestCase):
+    def setUp(self):
+        handler = type('Handler', (api.MainHTTPHandler,), {
+            'store': Mock(cache_get=Mock(side_effect=slow_cache_get), cache_set=Mock(return_value=True)),
+            'log_message': lambda *args: None,
+        })
+        self.server = ThreadPoolHTTPServer(('localhost', 0), handler, threads=4)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+        self.thread.start()
+        self.body = json.dumps({
+            "account": "horns&hoofs", "login": "h&f", "method": "online_score",
+            "arguments": {"first_name": "a", "last_name": "b"},
+            "token": hashlib.sha512(("horns&hoofs" + "h&f" + api.SALT).encode('utf-8')).hexdigest(),
+        }).encode('utf-8')
+
+    def tearDown(self):
+        self.server.server_close()
+
+    def start_request(self):
+        sock = socket.create_connection(self.server.server_address, timeout=3)
+        sock.sendall(b'POST /method/ HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(self.body) + self.body)
+        return sock
+
+    @staticmethod
+    def read_all(sock):
+        chunks = []
+        with sock:
+            while chunk := sock.recv(65536):
+                chunks.append(chunk)
+        return b''.join(chunks)
+
+    def stop(self, timeout):
+        self.server.shutdown()
+        started = time.monotonic()
+        self.server.drain(timeout)
+        return time.monotonic() - started
+
+    def test_drain(self):
+        idle = socket.create_connection(self.server.server_address, timeout=3)
+        busy = self.start_request()
+        time.sleep(0.1)
+        elapsed = self.stop(2)
+        self.assertLess(elapsed, 1)
+        self.assertEqual(self.read_all(idle), b'')
+        data = self.read_all(busy)
+        self.assertTrue(data.startswith(b'HTTP/1.1 200 OK'))
+        self.assertIn(b'Connection: close', data)
+        with self.assertRaises(OSError):
+            socket.create_connection(self.server.server_address, timeout=1)
+
+    def test_drain_timeout(self):
+        busy = self.start_request()
+        time.sleep(0.05)
+        self.assertLess(self.stop(0.05), 0.15)
+        self.assertNotIn(b'200 OK', self.read_all(busy))
+
+
+class PreforkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadPoolHTTPServer(('localhost', 0), api.MainHTTPHandler)
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        self.server.server_close()
+        os.remove(self.path)
+
+    @patch('scoring_api.api.server.RESPAWN_DELAY', 0.05)
+    def test_crash_on_startup_respawned_with_backoff(self):
+        def init_worker():
+            with open(self.path, 'a') as f:
+                f.write('.')
+            raise ConnectionError('store is unavailable')
+
+        master = os.fork()
+        if master == 0:
+            logging.disable(logging.CRITICAL)
+            try:
+                serve_prefork(self.server, 1, init_worker=init_worker)
+            finally:
+                os._exit(0)
+        time.sleep(0.5)
+        os.kill(master, signal.SIGTERM)
+        self.assertEqual(wait_exit_code(master), 0)
+        with open(self.path) as f:
+            starts = len(f.read())
+        # 0.05, 0.1, 0.2 s between the starts instead of a fork loop
+        self.assertGreaterEqual(starts, 2)
+        self.assertLessEqual(starts, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
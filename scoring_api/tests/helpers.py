@@ -1,3 +1,4 @@
+import os
 import logging
 import functools
 
@@ -18,3 +19,9 @@ def cases(_cases):
                     raise err
         return wrapper
     return decorator
+
+
+def wait_exit_code(pid):
+    """Exit code of the child `pid`, minus the signal number if it is killed, as `os.waitstatus_to_exitcode` of 3.9+."""
+    _, status = os.waitpid(pid, 0)
+    return os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
@@ -1,3 +1,6 @@
+import os
+import time
+import tempfile
 import unittest
 import logging
 import subprocess
@@ -6,7 +9,9 @@ from unittest.mock import Mock, patch
 from redis.exceptions import ConnectionError, TimeoutError
 
 from scoring_api.api.exceptions import StoreConnectionError
-from scoring_api.api.store import RedisStore
+from scoring_api.api import warmup, scoring, vocabulary
+from scoring_api.api.cache import LRUCache
+from scoring_api.api.store import RedisStore, CircuitBreaker
 from scoring_api.tests.helpers import cases
 
 logger = logging.getLogger(__name__)
@@ -30,6 +35,7 @@ class IntegrationTestCase(unittest.TestCase):
         cls.rds_proc.wait()
 
     def setUp(self):
+        self.storage.breaker = CircuitBreaker()
         self.storage.set_connection()
         self.storage.conn.flushdb()
 
@@ -54,6 +60,22 @@ class IntegrationTestCase(unittest.TestCase):
         response = int(self.storage.cache_get(key))
         self.assertEqual(response, val)
 
+    def test_score_cache_lifetime(self):
+        self.assertEqual(scoring.get_score(self.storage, "79175002040", "a@b.ru"), 3.0)
+        key = scoring.get_score_key("79175002040")
+        # entry lives for the fresh and the stale periods, not 3.6 seconds
+        self.assertGreater(self.storage.conn.pttl(key), scoring.cache_policy.ttl * 1000)
+        self.assertEqual(scoring.get_score(self.storage, "79175002040", "a@b.ru"), 3.0)
+
+    def test_score_key_migration(self):
+        self.storage.conn.set(scoring.get_legacy_score_key("79175002040"), 5.0, px=10000)
+        scoring.key_migration = True
+        try:
+            self.assertEqual(scoring.get_score(self.storage, "79175002040", "a@b.ru"), 5.0)
+        finally:
+            scoring.key_migration = False
+        self.assertEqual(scoring.get_score(self.storage, 79175002040, "a@b.ru"), 5.0)
+
     @cases(
         [
             'foo', 'bar', 'baz',
@@ -74,6 +96,26 @@ class IntegrationTestCase(unittest.TestCase):
         self.add_interests(key, interests)
         self.assertListEqual(sorted(list(self.storage.get(key))), sorted(interests))
 
+    def test_storage_get_many(self):
+        interests = {'i:1': [b'sport', b'pets'], 'i:2': [b'music'], 'i:3': [b'books', b'cars']}
+        for key, values in interests.items():
+            self.add_interests(key, values)
+        response = self.storage.get_many(['i:1', 'i:2', 'i:4', 'i:3'])
+        self.assertListEqual([sorted(r) for r in response],
+                             [sorted(interests['i:1']), interests['i:2'], [], sorted(interests['i:3'])])
+
+    def test_compact_interests(self):
+        self.add_interests('i:1', ['books', 'pets'])
+        self.add_interests('i:2', ['books'])
+        self.assertEqual(vocabulary.compact(self.storage.conn), 2)
+        self.assertEqual(self.storage.conn.object('encoding', 'i:1'), b'intset')
+        scoring.vocabulary = vocabulary.Vocabulary(vocabulary.VOCABULARY_KEY)
+        try:
+            self.assertListEqual([sorted(names) for names in scoring.get_interests_many(self.storage, [1, 2])],
+                                 [['books', 'pets'], ['books']])
+        finally:
+            scoring.vocabulary = vocabulary.Vocabulary()
+
     @cases(
         [
             ['foo', 1000], ['bar', 5000], ['baz', 3000]
@@ -99,6 +141,59 @@ class IntegrationTestCase(unittest.TestCase):
         with self.assertRaises(StoreConnectionError):
             self.storage.get(arguments)
 
+    def test_warm_pool(self):
+        self.storage.warm_pool(4)
+        self.assertGreaterEqual(len(self.storage.conn.connection_pool._available_connections), 4)
+
+    def test_warm_up_interest_cache(self):
+        self.add_interests('i:1', ['books'])
+        store = RedisStore(port=self.rds_port, db=self.rds_test_db, interest_cache=LRUCache())
+        store.set_connection()
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('1\n2\n')
+        try:
+            self.assertEqual(warmup.warm_up(store, path), (2, 0))
+        finally:
+            os.remove(path)
+        self.assertEqual(store.interest_cache.get(b'i:1'), {b'books'})
+        self.assertEqual(store.interest_cache.get(b'i:2'), set())
+
+    @cases(['tracking', 'keyspace'])
+    def test_interest_cache_invalidation(self, mode):
+        self.storage.conn.config_set('notify-keyspace-events', 'Kgsxe')
+        self.add_interests('i:1', ['books'])
+        store = RedisStore(port=self.rds_port, db=self.rds_test_db, interest_cache=LRUCache(),
+                           interest_invalidation=mode)
+        store.set_connection()
+        store.start_invalidation()
+        try:
+            self.assertTrue(store.invalidation_listener.subscribed.is_set())
+            self.assertEqual(store.get(b'i:1'), {b'books'})
+            self.add_interests('i:1', ['travel'])
+            for _ in range(100):
+                if store.interest_cache.get(b'i:1') is None:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(store.get(b'i:1'), {b'books', b'travel'})
+        finally:
+            store.close()
+
+    @patch('scoring_api.api.store.RETRY_DELAY', 0)
+    @patch('scoring_api.api.store.RETRY_COUNT', 1)
+    def test_circuit_breaker_recovery(self):
+        self.storage.breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.1)
+        conn = self.storage.conn
+        conn.set('foo', 1)
+        self.break_connection()
+        self.assertIsNone(self.storage.cache_get('foo'))
+        self.assertEqual(self.storage.breaker.state, CircuitBreaker.OPEN)
+        self.storage.conn = conn
+        self.assertIsNone(self.storage.cache_get('foo'))
+        time.sleep(0.1)
+        self.assertEqual(self.storage.cache_get('foo'), b'1')
+        self.assertEqual(self.storage.breaker.state, CircuitBreaker.CLOSED)
+
 
 if __name__ == '__main__':
     unittest.main()
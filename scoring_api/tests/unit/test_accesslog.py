@@ -0,0 +1,69 @@
+import json
+import queue
+import logging
+import unittest
+from unittest.mock import patch
+
+from scoring_api.api import accesslog
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class AccessRecordTestCase(unittest.TestCase):
+    body = {"account": "horns&hoofs", "login": "h&f", "method": "online_score_batch", "token": "x",
+            "arguments": {"items": [{"phone": "79175002040", "email": "", "gender": 1}]}}
+
+    def test_json_line(self):
+        context = {"request_id": "abc", "method": "online_score", "code": 200, "has": ["phone", "email"],
+                   "response": {"score": 3.0}}
+        record = accesslog.AccessRecord('/method/', context, 0.0012345)
+        self.assertDictEqual(json.loads(str(record)), {"path": "/method/", "request_id": "abc",
+                                                       "method": "online_score", "code": 200,
+                                                       "has": ["phone", "email"], "duration_ms": 1.234})
+
+    def test_body_redacted(self):
+        record = accesslog.AccessRecord('/method/', {}, 0, self.body)
+        self.assertDictEqual(json.loads(str(record))["body"]["arguments"],
+                             {"items": [{"phone": "***", "email": "", "gender": 1}]})
+        self.assertEqual(self.body["arguments"]["items"][0]["phone"], "79175002040")
+
+
+class LogRequestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = ListHandler()
+        accesslog.access_logger.addHandler(self.handler)
+        accesslog.access_logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        accesslog.access_logger.removeHandler(self.handler)
+
+    @patch('scoring_api.api.accesslog.SAMPLE_RATE', 0.0)
+    def test_sampling_keeps_errors(self):
+        accesslog.log_request('/method/', {"code": 200}, 0)
+        accesslog.log_request('/method/', {"code": 422}, 0)
+        self.assertListEqual([json.loads(line)["code"] for line in self.handler.lines], [422])
+
+    def test_body_not_logged_by_default(self):
+        accesslog.log_request('/method/', {"code": 200}, 0, {"phone": "79175002040"})
+        self.assertNotIn("body", json.loads(self.handler.lines[0]))
+
+
+class DroppingQueueHandlerTestCase(unittest.TestCase):
+    def test_drop_when_full(self):
+        handler = accesslog.DroppingQueueHandler(queue.Queue(1))
+        dropped = accesslog.LOG_DROPPED.labels().value
+        for n in range(3):
+            handler.handle(logging.makeLogRecord({"msg": n}))
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(accesslog.LOG_DROPPED.labels().value - dropped, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
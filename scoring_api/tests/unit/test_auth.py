@@ -0,0 +1,63 @@
+import hashlib
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from scoring_api.api import api
+
+
+def make_request(account, login, token):
+    return api.MethodRequest.load({'account': account, 'login': login, 'token': token, 'method': 'online_score',
+                                   'arguments': {}})
+
+
+def user_token(account, login):
+    return hashlib.sha512((account + login + api.SALT).encode('utf-8')).hexdigest()
+
+
+def admin_token(dt):
+    return hashlib.sha512((dt.strftime("%Y%m%d%H") + api.ADMIN_SALT).encode('utf-8')).hexdigest()
+
+
+class CheckAuthTestCase(unittest.TestCase):
+    def setUp(self):
+        api.reset_auth_cache()
+
+    def test_user_digest_cached(self):
+        token = user_token('horns&hoofs', 'h&f')
+        self.assertTrue(api.check_auth(make_request('horns&hoofs', 'h&f', token)))
+        with patch('scoring_api.api.api.hashlib.sha512') as sha512:
+            self.assertTrue(api.check_auth(make_request('horns&hoofs', 'h&f', token)))
+            self.assertFalse(api.check_auth(make_request('horns&hoofs', 'h&f', token[:-1])))
+            sha512.assert_not_called()
+
+    def test_invalid_tokens_not_cached(self):
+        for token in ('', 'invalid', 'токен', user_token('horns&hoofs', 'other')):
+            self.assertFalse(api.check_auth(make_request('horns&hoofs', 'h&f', token)))
+        self.assertDictEqual(api.auth_cache, {})
+
+    @patch('scoring_api.api.api.AUTH_CACHE_SIZE', 2)
+    def test_cache_bounded(self):
+        for login in ('a', 'b', 'c'):
+            self.assertTrue(api.check_auth(make_request('acc', login, user_token('acc', login))))
+        self.assertListEqual(list(api.auth_cache), [('acc', 'b'), ('acc', 'c')])
+
+    def test_admin_digest_refreshed_every_hour(self):
+        first, second = datetime(2020, 1, 1, 10, 59, 59), datetime(2020, 1, 1, 11, 0, 1)
+        with patch('scoring_api.api.api.time', return_value=first.timestamp()):
+            self.assertTrue(api.check_auth(make_request('', 'admin', admin_token(first))))
+        with patch('scoring_api.api.api.time', return_value=second.timestamp()):
+            self.assertFalse(api.check_auth(make_request('', 'admin', admin_token(first))))
+            self.assertTrue(api.check_auth(make_request('', 'admin', admin_token(second))))
+
+    def test_admin_digest_clock_stepped_back(self):
+        first, second = datetime(2020, 1, 1, 11, 0, 1), datetime(2020, 1, 1, 10, 59, 59)
+        with patch('scoring_api.api.api.time', return_value=first.timestamp()):
+            self.assertTrue(api.check_auth(make_request('', 'admin', admin_token(first))))
+        with patch('scoring_api.api.api.time', return_value=second.timestamp()):
+            self.assertFalse(api.check_auth(make_request('', 'admin', admin_token(first))))
+            self.assertTrue(api.check_auth(make_request('', 'admin', admin_token(second))))
+
+
+if __name__ == '__main__':
+    unittest.main()
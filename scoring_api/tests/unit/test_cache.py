@@ -0,0 +1,162 @@
+import os
+import asyncio
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from scoring_api.api import scoring
+from scoring_api.api.cache import LRUCache, CachePolicy
+from scoring_api.tests.helpers import cases, wait_exit_code
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(maxsize=2, ttl=10)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.set('foo', b'1')
+        self.assertEqual(self.cache.get('foo'), b'1')
+        self.assertDictEqual(self.cache.stats(),
+                             {'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0, 'hit_ratio': 0.5})
+
+    def test_lru_eviction(self):
+        self.cache.set('foo', 1)
+        self.cache.set('bar', 2)
+        self.cache.get('foo')
+        self.cache.set('baz', 3)
+        self.assertEqual(self.cache.get('foo'), 1)
+        self.assertIsNone(self.cache.get('bar'))
+        self.assertEqual(self.cache.get('baz'), 3)
+        self.assertEqual(self.cache.evictions, 1)
+
+    @patch('scoring_api.api.cache.monotonic')
+    def test_expiration(self, monotonic):
+        monotonic.return_value = 100
+        self.cache.set('foo', 1)
+        self.cache.set('bar', 2, ttl=1)
+        self.cache.set('baz', 3, ttl=60)
+        monotonic.return_value = 105
+        self.assertIsNone(self.cache.get('bar'))
+        self.assertEqual(self.cache.get('baz'), 3)
+        monotonic.return_value = 111
+        self.assertIsNone(self.cache.get('baz'))
+
+    def test_non_positive_ttl(self):
+        self.cache.set('foo', 1, ttl=0)
+        self.assertIsNone(self.cache.get('foo'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate(self):
+        self.cache.set('foo', 1)
+        generation = self.cache.generation
+        self.assertEqual(self.cache.invalidate(['foo', 'bar']), 1)
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.set('bar', 2, generation=generation)
+        self.assertIsNone(self.cache.get('bar'))
+        self.cache.set('bar', 2, generation=self.cache.generation)
+        self.assertEqual(self.cache.get('bar'), 2)
+
+    def test_fork_while_locked(self):
+        self.cache.set('foo', 1)
+        with self.cache._lock:
+            pid = os.fork()
+            if pid == 0:
+                # the lock held by the parent thread at fork is not inherited
+                os._exit(0 if self.cache.get('foo') == 1 else 1)
+        self.assertEqual(wait_exit_code(pid), 0)
+
+
+class CachePolicyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.policy = CachePolicy(ttl=3600, stale_ttl=60)
+
+    def test_expire_ms(self):
+        self.assertEqual(self.policy.expire_ms, 3660 * 1000)
+        self.assertEqual(CachePolicy(ttl=0.5, stale_ttl=0).expire_ms, 500)
+
+    @cases([(0, 60), (10, -1)])
+    def test_invalid_ttl(self, ttl, stale_ttl):
+        with self.assertRaises(ValueError):
+            CachePolicy(ttl, stale_ttl)
+
+    @patch('scoring_api.api.cache.time')
+    def test_encode_decode(self, time):
+        time.return_value = 1000
+        value = self.policy.encode(4.5)
+        self.assertEqual(value, '4.5:4600')
+        self.assertEqual(self.policy.decode(value.encode('utf-8')), (4.5, CachePolicy.FRESH))
+        time.return_value = 4600
+        self.assertEqual(self.policy.decode(value.encode('utf-8')), (4.5, CachePolicy.STALE))
+        self.assertEqual(self.policy.decode(b'3.0'), (3.0, CachePolicy.FRESH))
+        self.assertEqual(self.policy.decode(None), (None, CachePolicy.MISS))
+        self.assertEqual(CachePolicy(ttl=10, stale_ttl=0).encode(4.5), 4.5)
+
+    def test_refresh_once_per_key(self):
+        started, release, done = threading.Event(), threading.Event(), threading.Event()
+
+        def refresh():
+            started.set()
+            release.wait(1)
+            done.set()
+
+        self.assertTrue(self.policy.refresh('key', refresh))
+        started.wait(1)
+        self.assertFalse(self.policy.refresh('key', refresh))
+        release.set()
+        done.wait(1)
+        self.policy._executor.shutdown(wait=True)
+        self.assertSetEqual(self.policy._refreshing, set())
+
+    def test_refresh_async_once_per_key(self):
+        calls = []
+
+        async def refresh(n):
+            await asyncio.sleep(0.01)
+            calls.append(n)
+
+        async def run():
+            self.assertTrue(self.policy.refresh_async('key', refresh, 1))
+            self.assertFalse(self.policy.refresh_async('key', refresh, 2))
+            await asyncio.sleep(0.05)
+            self.assertTrue(self.policy.refresh_async('key', refresh, 3))
+            await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+        self.assertListEqual(calls, [1, 3])
+
+
+class ScoreCachePolicyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.policy = scoring.cache_policy = CachePolicy(ttl=3600, stale_ttl=60)
+        self.store = Mock(cache_get=Mock(return_value=None), cache_set=Mock(return_value=True),
+                          cache_get_many=Mock(return_value=[]), cache_set_many=Mock(return_value=None))
+
+    def tearDown(self):
+        scoring.cache_policy = CachePolicy()
+
+    @patch('scoring_api.api.cache.time', Mock(return_value=1000))
+    def test_miss_written_with_expiry_in_ms(self):
+        self.assertEqual(scoring.get_score(self.store, "79175002040", "a@b.ru"), 3.0)
+        self.store.cache_set.assert_called_once_with(scoring.get_score_key("79175002040"), '3.0:4600', 3660 * 1000)
+
+    @patch('scoring_api.api.cache.time', Mock(return_value=5000))
+    def test_stale_served_and_refreshed(self):
+        self.store.cache_get.return_value = b'1.0:4600'
+        self.assertEqual(scoring.get_score(self.store, "79175002040", "a@b.ru"), 1.0)
+        self.policy._executor.shutdown(wait=True)
+        self.store.cache_set.assert_called_once_with(scoring.get_score_key("79175002040"), '3.0:8600', 3660 * 1000)
+
+    @patch('scoring_api.api.cache.time', Mock(return_value=5000))
+    def test_batch_recomputes_stale(self):
+        self.store.cache_get_many.return_value = [b'1.0:4600', b'2.0:9000', None]
+        records = [{"phone": "79175002040", "email": "a@b.ru"}, {"first_name": "a", "last_name": "b"},
+                   {"first_name": "c", "last_name": "d"}]
+        self.assertListEqual(scoring.get_scores(self.store, records), [3.0, 2.0, 0.5])
+        (written, expire_ms), _ = self.store.cache_set_many.call_args
+        self.assertListEqual(sorted(written.values()), ['0.5:8600', '3.0:8600'])
+        self.assertEqual(expire_ms, 3660 * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
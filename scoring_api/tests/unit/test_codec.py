@@ -0,0 +1,55 @@
+import json
+import unittest
+
+from scoring_api.api import codec
+from scoring_api.tests.helpers import cases
+
+
+class CodecTestCase(unittest.TestCase):
+    def tearDown(self):
+        codec.use()
+
+    @cases(codec.available_backends())
+    def test_round_trip(self, backend):
+        _, loads, dumps = codec.get_backend(backend)
+        obj = {"response": {"1": ["music", "книги"], "2": []}, "code": 200, "score": 4.5}
+        data = dumps(obj)
+        self.assertIsInstance(data, bytes)
+        self.assertDictEqual(json.loads(data), obj)
+        self.assertDictEqual(loads(data), obj)
+        self.assertIn("книги".encode('utf-8'), data)
+
+    @cases([b'', b'{"a": ', b'not json'])
+    def test_decode_error(self, data):
+        for backend in codec.available_backends():
+            _, loads, _ = codec.get_backend(backend)
+            with self.assertRaises(ValueError, msg=backend):
+                loads(data)
+
+    @cases([
+        ({}, 1, False),
+        (1, 0, False),
+        ({"a": [1, {"b": 2}]}, 3, False),
+        ({"a": [1, {"b": 2}]}, 2, True),
+        ([[[[]]]], 3, True),
+        ({"a": [], "b": {"c": {}}}, 3, False),
+    ])
+    def test_exceeds_depth(self, obj, max_depth, expected):
+        self.assertEqual(codec.exceeds_depth(obj, max_depth), expected)
+
+    def test_default_backend(self):
+        self.assertEqual(codec.BACKEND, codec.available_backends()[0])
+        self.assertIn('json', codec.available_backends())
+
+    def test_use(self):
+        codec.use('json')
+        self.assertEqual(codec.BACKEND, 'json')
+        self.assertEqual(codec.dumps({"code": 200}), b'{"code":200}')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            codec.use('simplejson')
+
+
+if __name__ == '__main__':
+    unittest.main()
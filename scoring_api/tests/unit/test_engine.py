@@ -0,0 +1,105 @@
+import os
+import json
+import random
+import datetime
+import tempfile
+import unittest
+
+from scoring_api.api import engine
+from scoring_api.api.engine import LinearScoringEngine, np
+from scoring_api.tests.helpers import cases
+
+
+def random_records(n, seed=0):
+    rnd = random.Random(seed)
+    return [{
+        "phone": rnd.choice([None, "", "79175002040"]),
+        "email": rnd.choice([None, "", "a@b.ru"]),
+        "birthday": rnd.choice([None, datetime.datetime(2000, 1, 1)]),
+        "gender": rnd.choice([None, 0, 1, 2]),
+        "first_name": rnd.choice([None, "", "a"]),
+        "last_name": rnd.choice([None, "b"]),
+    } for _ in range(n)]
+
+
+class LinearScoringEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = LinearScoringEngine()
+
+    @cases([
+        ({"phone": "79175002040", "email": "a@b.ru"}, 3.0),
+        ({"phone": "79175002040", "email": "a@b.ru", "gender": 1, "birthday": datetime.datetime(2000, 1, 1)}, 4.5),
+        ({"gender": 0, "birthday": datetime.datetime(2000, 1, 1)}, 0),
+        ({"first_name": "a", "last_name": "b"}, 0.5),
+        ({}, 0),
+    ])
+    def test_default_weights(self, record, score):
+        self.assertEqual(self.engine.score(**record), score)
+
+    def test_custom_weights(self):
+        custom = LinearScoringEngine({"phone": 2, "name": 1})
+        self.assertEqual(custom.score(phone="79175002040", email="a@b.ru", first_name="a", last_name="b"), 4.5)
+
+    @cases([{"age": 1.0}, {"phone": "1.5"}, {"email": True}])
+    def test_invalid_weights(self, weights):
+        with self.assertRaises(ValueError):
+            LinearScoringEngine(weights)
+
+    def test_score_many(self):
+        records = random_records(engine.VECTORIZE_MIN * 2)
+        expected = [self.engine.score(**r) for r in records]
+        self.assertListEqual(self.engine.score_many(records), expected)
+        self.assertListEqual(self.engine.score_many(records[:3]), expected[:3])
+        self.assertListEqual(self.engine.score_many([]), [])
+
+    def test_score_many_floats(self):
+        custom = LinearScoringEngine({"phone": 2, "email": 1, "birthday_gender": 1, "name": 1})
+        for records in (random_records(3), random_records(engine.VECTORIZE_MIN)):
+            scores = custom.score_many(records)
+            self.assertTrue(all(type(score) is float for score in scores), scores)
+
+    def test_version(self):
+        self.assertEqual(LinearScoringEngine().version, LinearScoringEngine(dict(engine.DEFAULT_WEIGHTS)).version)
+        self.assertNotEqual(LinearScoringEngine().version, LinearScoringEngine({"phone": 3.0}).version)
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_score_columns(self):
+        columns = {
+            "phone": np.array(["79175002040", "", "79175002040", ""]),
+            "email": np.array(["a@b.ru", "a@b.ru", "", ""], dtype=object),
+            "birthday": np.array(["2000-01-01", "NaT", "2000-01-01", "2000-01-01"], dtype="datetime64[D]"),
+            "gender": np.array([1, 1, 0, 2]),
+        }
+        self.assertListEqual(self.engine.score_columns(columns).tolist(), [4.5, 1.5, 1.5, 1.5])
+        self.assertListEqual(self.engine.score_columns({"phone": np.array([1.0, np.nan])}).tolist(), [1.5, 0.0])
+
+
+class EngineReloadTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+        engine.set_engine(LinearScoringEngine())
+
+    def write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+
+    def test_reload(self):
+        self.write(json.dumps({"phone": 3.0}))
+        self.assertTrue(engine.reload(self.path))
+        self.assertEqual(engine.get_engine().score(phone="79175002040"), 3.0)
+        self.assertEqual(engine.get_engine().version, LinearScoringEngine({"phone": 3.0}).version)
+
+    @cases(['{"phone": ', '[1, 2]', '{"age": 1}'])
+    def test_reload_keeps_engine_on_error(self, content):
+        current = engine.get_engine()
+        self.write(content)
+        self.assertFalse(engine.reload(self.path))
+        self.assertIs(engine.get_engine(), current)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,9 @@ import unittest
 from datetime import datetime, timedelta
 
 from scoring_api.api.fields import CharField, EmailField, ArgumentsField, PhoneField, DateField, GenderField, \
-    BirthDayField, ClientIDsField
+    BirthDayField, ClientIDsField, ArgumentsListField
 from scoring_api.tests.helpers import cases
-from scoring_api.api.exceptions import ValidationError
+from scoring_api.api.exceptions import ValidationError, PayloadTooLargeError
 
 
 class CharFieldTestCase(unittest.TestCase):
@@ -326,6 +326,47 @@ class ClientIDsFieldTestCase(unittest.TestCase):
         self.init_field(case['required'], case['nullable'])
         self.assertIsNone(self.field.validate(case['value']))
 
+    def test_max_length(self):
+        self.field.max_length = 2
+        self.assertIsNone(self.field.validate([1, 2]))
+        with self.assertRaises(PayloadTooLargeError):
+            self.field.validate([1, 2, 3])
+
+
+class ArgumentsListFieldTestCase(unittest.TestCase):
+    def setUp(self):
+        self.field = ArgumentsListField()
+        self.field.__set_name__(self.field, self.field.__class__.__name__)
+
+    def init_field(self, required, nullable):
+        self.field.required = required
+        self.field.nullable = nullable
+
+    @cases(
+        [
+            {'required': True, 'nullable': False, 'value': None},
+            {'required': True, 'nullable': False, 'value': []},
+            {'required': False, 'nullable': False, 'value': {}},
+            {'required': False, 'nullable': False, 'value': [{}, 1]},
+            {'required': False, 'nullable': False, 'value': [[]]},
+        ]
+    )
+    def test_set_invalid_value(self, case):
+        self.init_field(case['required'], case['nullable'])
+        with self.assertRaises(ValidationError):
+            self.field.validate(case['value'])
+
+    @cases(
+        [
+            {'required': True, 'nullable': False, 'value': [{}]},
+            {'required': True, 'nullable': False, 'value': [{'phone': '79175002040'}, {'gender': 1}]},
+            {'required': False, 'nullable': True, 'value': []},
+        ]
+    )
+    def test_set_valid_value(self, case):
+        self.init_field(case['required'], case['nullable'])
+        self.assertIsNone(self.field.validate(case['value']))
+
 
 if __name__ == '__main__':
     unittest.main()
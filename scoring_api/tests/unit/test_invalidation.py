@@ -0,0 +1,134 @@
+import unittest
+from collections import deque
+from unittest.mock import Mock, patch
+
+from redis.exceptions import ResponseError, ConnectionError
+
+from scoring_api.api import invalidation
+from scoring_api.api.cache import LRUCache
+from scoring_api.api.metrics import INTEREST_CACHE_RESETS
+from scoring_api.api.invalidation import InvalidationListener
+
+
+class FakeConnection:
+    """Redis connection answering commands from `responses` and delivering pushed `messages`."""
+
+    def __init__(self, responses=None, messages=()):
+        self.responses = responses or {}
+        self.messages = deque(messages)
+        self.commands = []
+        self._replies = deque()
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def send_command(self, *args):
+        self.commands.append(args)
+        self._replies.append(self.responses.get(args[0], b'OK'))
+
+    def read_response(self):
+        reply = self._replies.popleft() if self._replies else self.messages.popleft()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def can_read(self, timeout=0):
+        if not self.messages:
+            raise ConnectionError('closed')
+        return True
+
+
+class InvalidationListenerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache()
+        for key in (b'i:1', b'i:2', b'i:3'):
+            self.cache.set(key, {b'books'})
+
+    def make_listener(self, mode, *connections):
+        listener = InvalidationListener(self.cache, mode, db=2)
+        listener.pool.make_connection = Mock(side_effect=connections)
+        return listener
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            InvalidationListener(self.cache, 'poll')
+
+    def test_tracking(self):
+        subscriber = FakeConnection({'CLIENT': 7}, [
+            [b'message', invalidation.INVALIDATE_CHANNEL, [b'i:1', b'i:3']],
+        ])
+        tracker = FakeConnection()
+        listener = self.make_listener(invalidation.AUTO, subscriber, tracker)
+        with self.assertRaises(ConnectionError):
+            listener.listen(*listener.subscribe())
+        self.assertEqual(tracker.commands, [('CLIENT', 'TRACKING', 'ON', 'REDIRECT', 7, 'BCAST', 'PREFIX', b'i:')])
+        self.assertEqual(subscriber.commands[1], ('SUBSCRIBE', invalidation.INVALIDATE_CHANNEL))
+        self.assertListEqual([self.cache.get(key) for key in (b'i:1', b'i:2', b'i:3')], [None, {b'books'}, None])
+
+    def test_keyspace_fallback(self):
+        failed_subscriber = FakeConnection({'CLIENT': 7})
+        failed_tracker = FakeConnection({'CLIENT': ResponseError('unknown subcommand')})
+        subscriber = FakeConnection({'CONFIG': [b'notify-keyspace-events', b'Kgsxe']}, [
+            [b'pmessage', b'__keyspace@2__:i:*', b'__keyspace@2__:i:2', b'sadd'],
+        ])
+        listener = self.make_listener(invalidation.AUTO, failed_subscriber, failed_tracker, subscriber)
+        connection, tracker = listener.subscribe()
+        self.assertIs(connection, subscriber)
+        self.assertIsNone(tracker)
+        self.assertEqual(listener.mode, invalidation.KEYSPACE)
+        self.assertEqual(subscriber.commands[-1], ('PSUBSCRIBE', b'__keyspace@2__:i:*'))
+        with self.assertRaises(ConnectionError):
+            listener.listen(connection)
+        self.assertIsNone(self.cache.get(b'i:2'))
+        self.assertEqual(self.cache.get(b'i:1'), {b'books'})
+
+    def test_tracking_required(self):
+        listener = self.make_listener(invalidation.TRACKING, FakeConnection({'CLIENT': 7}),
+                                      FakeConnection({'CLIENT': ResponseError('unknown subcommand')}))
+        with self.assertRaises(ResponseError):
+            listener.subscribe()
+
+    def test_flush_clears_cache(self):
+        self.make_listener(invalidation.TRACKING).handle([b'message', invalidation.INVALIDATE_CHANNEL, None])
+        self.assertEqual(len(self.cache), 0)
+
+    @patch('scoring_api.api.invalidation.monotonic')
+    def test_changed_recently(self, monotonic):
+        listener = self.make_listener(invalidation.TRACKING)
+        monotonic.return_value = 100
+        listener.invalidate([b'i:1'])
+        monotonic.return_value = 100 + invalidation.REPLICA_LAG / 2
+        listener.invalidate([b'i:2'])
+        self.assertTrue(listener.changed_recently(b'i:1'))
+        self.assertFalse(listener.changed_recently(b'i:3'))
+        monotonic.return_value = 100 + invalidation.REPLICA_LAG
+        listener.invalidate([b'i:3'])
+        self.assertFalse(listener.changed_recently(b'i:1'))
+        self.assertListEqual(list(listener._changed), [b'i:2', b'i:3'])
+        listener.reset()
+        self.assertTrue(listener.changed_recently(b'i:1'))
+
+    @patch('scoring_api.api.invalidation.RECONNECT_DELAY', 0)
+    def test_cache_cleared_on_lost_subscription(self):
+        resets = INTEREST_CACHE_RESETS.labels().value
+        refused = FakeConnection()
+        listener = self.make_listener(invalidation.TRACKING, FakeConnection({'CLIENT': 7}, [
+            [b'message', invalidation.INVALIDATE_CHANNEL, [b'i:1']],
+        ]), FakeConnection(), refused)
+
+        def connect():
+            listener.stop()
+            raise ConnectionError('refused')
+
+        refused.connect = connect
+        listener.run()
+        self.assertEqual(len(self.cache), 0)
+        self.assertFalse(listener.subscribed.is_set())
+        self.assertEqual(INTEREST_CACHE_RESETS.labels().value, resets + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
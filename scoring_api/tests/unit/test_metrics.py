@@ -0,0 +1,55 @@
+import unittest
+
+from scoring_api.api.metrics import Registry, Counter, Histogram
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        counter = Counter('requests_total', 'Requests.', ('method', 'code'), registry=self.registry)
+        counter.labels('online_score', '200').inc()
+        counter.labels('online_score', '200').inc(2)
+        counter.labels('say "hi"', '404').inc()
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{method="online_score",code="200"} 3',
+            'requests_total{method="say \\"hi\\"",code="404"} 1',
+        ]) + '\n')
+
+    def test_labels_count(self):
+        counter = Counter('requests_total', 'Requests.', ('method',), registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.labels('online_score', '200')
+
+    def test_histogram(self):
+        histogram = Histogram('duration_seconds', 'Duration.', buckets=(0.1, 1.0), registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP duration_seconds Duration.',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{le="0.1"} 2',
+            'duration_seconds_bucket{le="1.0"} 3',
+            'duration_seconds_bucket{le="+Inf"} 4',
+            'duration_seconds_sum 2.65',
+            'duration_seconds_count 4',
+        ]) + '\n')
+
+    def test_histogram_timer(self):
+        histogram = Histogram('duration_seconds', 'Duration.', registry=self.registry)
+
+        @histogram.time()
+        def func():
+            return 42
+
+        self.assertEqual(func(), 42)
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.labels().count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from scoring_api.api.api import ClientsInterestsRequest, OnlineScoreRequest, MethodRequest
 from scoring_api.api.exceptions import ValidationError
@@ -146,6 +148,32 @@ class OnlineScoreRequestTestCase(unittest.TestCase):
         request = self.request(**case)
         self.assertDictEqual(request.context, {'has': [k for k in case if case[k]]})
 
+    def test_cleaned_values(self):
+        request = self.request(phone=79991112233, email='test@test.test', birthday='01.01.2000', gender=1)
+        request.validate_fields()
+        self.assertEqual(request.phone, '79991112233')
+        self.assertEqual(request.birthday, datetime(2000, 1, 1))
+
+    def test_load(self):
+        case = {'phone': 79991112233, 'email': 'test@test.test', 'birthday': '01.01.2000', 'gender': None}
+        request = self.request.load(case)
+        self.assertEqual(request.as_dict(), {'first_name': '', 'last_name': '', 'email': 'test@test.test',
+                                             'phone': '79991112233', 'birthday': datetime(2000, 1, 1), 'gender': ''})
+        self.assertDictEqual(request.context, {'has': ['email', 'phone', 'birthday']})
+        self.assertFalse(hasattr(request, '__dict__'))
+        with self.assertRaises(ValidationError):
+            self.request.load({'phone': 79991112233})
+
+    def test_concurrent_validation(self):
+        def validate(n):
+            request = self.request(phone=79990000000 + n, email='test@test.test', birthday=f'01.01.{1960 + n}')
+            request.validate_fields()
+            return request.phone, request.birthday.year
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            result = list(executor.map(validate, range(50)))
+        self.assertListEqual(result, [(str(79990000000 + n), 1960 + n) for n in range(50)])
+
 
 class MethodRequestTestCase(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,113 @@
+import hashlib
+import datetime
+import unittest
+from unittest.mock import Mock
+
+from scoring_api.api import scoring, engine
+from scoring_api.api.engine import LinearScoringEngine
+from scoring_api.tests.helpers import cases
+
+BIRTHDAY = datetime.datetime(2000, 1, 1)
+
+
+def score_key(phone=None, **kwargs):
+    return scoring.get_score_key(phone, **kwargs)
+
+
+class ScoreKeyTestCase(unittest.TestCase):
+    @cases([
+        ({"phone": 79175002040}, {"phone": "79175002040"}),
+        ({"first_name": "Иван", "last_name": "Петров"},
+         {"first_name": " иван ", "last_name": "ПЕТРОВ"}),
+        ({"first_name": "Anna Maria"}, {"first_name": "anna  maria"}),
+        # composed and decomposed forms of the same letter
+        ({"first_name": "Jos\u00e9"}, {"first_name": "Jose\u0301"}),
+        ({"first_name": "Straße"}, {"first_name": "STRASSE"}),
+        ({"phone": "79175002040", "birthday": BIRTHDAY}, {"phone": 79175002040, "birthday": BIRTHDAY}),
+    ])
+    def test_same_client(self, first, second):
+        self.assertEqual(score_key(**first), score_key(**second))
+
+    @cases([
+        ({"first_name": "ab", "last_name": "c"}, {"first_name": "a", "last_name": "bc"}),
+        ({"phone": "79175002040"}, {"phone": "79175002041"}),
+        ({"first_name": "a"}, {"last_name": "a"}),
+        ({"phone": "79175002040"}, {"phone": "79175002040", "birthday": BIRTHDAY}),
+    ])
+    def test_different_clients(self, first, second):
+        self.assertNotEqual(score_key(**first), score_key(**second))
+
+    def test_compact_key(self):
+        key = scoring.get_score_key("79175002040", BIRTHDAY, "a", "b")
+        self.assertIsInstance(key, bytes)
+        self.assertTrue(key.startswith(scoring.SCORE_KEY_PREFIX))
+        self.assertEqual(len(key), len(scoring.SCORE_KEY_PREFIX) + scoring.SCORE_KEY_DIGEST_SIZE)
+
+    def test_weights_version(self):
+        key = score_key(phone="79175002040")
+        engine.set_engine(LinearScoringEngine({"phone": 3.0}))
+        try:
+            self.assertNotEqual(score_key(phone="79175002040"), key)
+        finally:
+            engine.set_engine(LinearScoringEngine())
+        self.assertEqual(score_key(phone="79175002040"), key)
+
+    def test_legacy_key(self):
+        self.assertEqual(scoring.get_legacy_score_key("79175002040", BIRTHDAY, "a", "b"),
+                         "uid:" + hashlib.md5("ab7917500204020000101".encode("utf-8")).hexdigest())
+
+
+class ScoreTypeTestCase(unittest.TestCase):
+    def setUp(self):
+        engine.set_engine(LinearScoringEngine({"phone": 2, "email": 1}))
+        self.cache = {}
+        self.store = Mock(cache_get=Mock(side_effect=lambda key: self.cache.get(key)),
+                          cache_set=Mock(side_effect=lambda key, value, expire_ms: self.cache.update({key: value})))
+
+    def tearDown(self):
+        engine.set_engine(LinearScoringEngine())
+
+    def test_integer_weights(self):
+        # computed on a miss, then decoded from the cache
+        for _ in range(2):
+            score = scoring.get_score(self.store, "79175002040", "a@b.ru")
+            self.assertIs(type(score), float)
+            self.assertEqual(score, 3.0)
+        self.assertEqual(len(self.cache), 1)
+
+
+class KeyMigrationTestCase(unittest.TestCase):
+    def setUp(self):
+        scoring.key_migration = True
+        self.legacy = {scoring.get_legacy_score_key("79175002040"): b'5.0'}
+        self.store = Mock(
+            cache_get=Mock(side_effect=lambda key: self.legacy.get(key)),
+            cache_set=Mock(return_value=True),
+            cache_get_many=Mock(side_effect=lambda keys: [self.legacy.get(key) for key in keys]),
+            cache_set_many=Mock(return_value=None),
+        )
+
+    def tearDown(self):
+        scoring.key_migration = False
+
+    def test_get_score(self):
+        self.assertEqual(scoring.get_score(self.store, 79175002040, "a@b.ru"), 5.0)
+        (key, value, expire_ms), _ = self.store.cache_set.call_args
+        self.assertEqual(key, scoring.get_score_key("79175002040"))
+        self.assertEqual(scoring.cache_policy.decode(value.encode('utf-8'))[0], 5.0)
+
+    def test_get_scores(self):
+        records = [{"phone": "79175002040", "email": "a@b.ru"}, {"first_name": "a", "last_name": "b"}]
+        self.assertListEqual(scoring.get_scores(self.store, records), [5.0, 0.5])
+        self.assertEqual(self.store.cache_get_many.call_count, 2)
+        (written, _), _ = self.store.cache_set_many.call_args
+        self.assertSetEqual(set(written), set(scoring._record_keys(records, scoring.get_score_key)))
+
+    def test_disabled(self):
+        scoring.key_migration = False
+        self.assertEqual(scoring.get_score(self.store, "79175002040", "a@b.ru"), 3.0)
+        self.store.cache_get.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
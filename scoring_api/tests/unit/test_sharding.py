@@ -0,0 +1,156 @@
+import os
+import time
+import unittest
+from unittest.mock import Mock, AsyncMock
+from concurrent.futures import ThreadPoolExecutor
+
+from scoring_api.api.exceptions import StoreConnectionError
+from scoring_api.api.sharding import HashRing, ShardedStore, AsyncShardedStore
+from scoring_api.tests.helpers import cases, wait_exit_code
+
+
+def make_shard(name):
+    return Mock(
+        get=Mock(side_effect=lambda key: {name}),
+        get_many=Mock(side_effect=lambda keys: [{name, key} for key in keys]),
+        cache_get=Mock(side_effect=lambda key: name),
+        cache_get_many=Mock(side_effect=lambda keys: [name] * len(keys)),
+        cache_set_many=Mock(return_value=None),
+    )
+
+
+def make_async_shard(name):
+    return Mock(
+        get_many=AsyncMock(side_effect=lambda keys: [{name, key} for key in keys]),
+        cache_get_many=AsyncMock(side_effect=lambda keys: [name] * len(keys)),
+        cache_set_many=AsyncMock(return_value=None),
+    )
+
+
+class HashRingTestCase(unittest.TestCase):
+    keys = [f'i:{i}'.encode('utf-8') for i in range(3000)]
+
+    def test_balance(self):
+        ring = HashRing(['a:6379', 'b:6379', 'c:6379'])
+        counts = [0, 0, 0]
+        for key in self.keys:
+            counts[ring.get_index(key)] += 1
+        for count in counts:
+            self.assertGreater(count, len(self.keys) / 3 * 0.7)
+
+    def test_stable(self):
+        ring = HashRing(['a:6379', 'b:6379', 'c:6379'])
+        grown = HashRing(['a:6379', 'b:6379', 'c:6379', 'd:6379'])
+        moved = [key for key in self.keys if ring.get_index(key) != grown.get_index(key)]
+        # only keys taken by the new node move
+        self.assertTrue(all(grown.get_index(key) == 3 for key in moved))
+        self.assertLess(len(moved), len(self.keys) / 4 * 1.3)
+
+    @cases(['uid:1', b'uid:1'])
+    def test_str_and_bytes(self, key):
+        ring = HashRing(['a', 'b'])
+        self.assertEqual(ring.get_index(key), ring.get_index('uid:1'))
+
+
+class ShardedStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.shards = [make_shard('a'), make_shard('b'), make_shard('c')]
+        self.store = ShardedStore(self.shards, names=['a', 'b', 'c'])
+        self.keys = [f'i:{i}'.encode('utf-8') for i in range(50)]
+
+    def tearDown(self):
+        self.store.executor.shutdown()
+
+    def test_single_key(self):
+        for key in self.keys:
+            name = 'abc'[self.store.ring.get_index(key)]
+            self.assertEqual(self.store.get(key), {name})
+            self.assertEqual(self.store.cache_get(key), name)
+
+    def test_get_many(self):
+        result = self.store.get_many(self.keys)
+        self.assertListEqual(result, [{'abc'[self.store.ring.get_index(key)], key} for key in self.keys])
+        for shard in self.shards:
+            shard.get_many.assert_called_once()
+
+    def test_cache_get_many(self):
+        result = self.store.cache_get_many(self.keys)
+        self.assertListEqual(result, ['abc'[self.store.ring.get_index(key)] for key in self.keys])
+        self.assertListEqual(self.store.cache_get_many([]), [])
+
+    def test_cache_set_many(self):
+        mapping = {key: i for i, key in enumerate(self.keys)}
+        self.store.cache_set_many(mapping, 1000)
+        written = {}
+        for index, shard in enumerate(self.shards):
+            (part, expire_ms), _ = shard.cache_set_many.call_args
+            self.assertEqual(expire_ms, 1000)
+            self.assertTrue(all(self.store.ring.get_index(key) == index for key in part))
+            written.update(part)
+        self.assertDictEqual(written, mapping)
+
+    def test_fork_after_fan_out(self):
+        # idle threads of the parent pool are counted by the inherited one
+        for _ in range(3):
+            self.store.get_many(self.keys)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.store.timeout = 1
+                os._exit(0 if len(self.store.get_many(self.keys)) == len(self.keys) else 1)
+            except BaseException:
+                os._exit(2)
+        self.assertEqual(wait_exit_code(pid), 0)
+
+    def test_stuck_shard(self):
+        self.store.timeout = 0.01
+        self.shards[0].get_many.side_effect = lambda keys: time.sleep(0.1)
+        with self.assertRaises(StoreConnectionError):
+            self.store.get_many(self.keys)
+
+    def test_slow_shard_cache_misses(self):
+        self.store.timeout = 0.01
+        self.shards[0].cache_get_many.side_effect = lambda keys: time.sleep(0.1)
+        self.shards[0].cache_set_many.side_effect = lambda mapping, expire_ms: time.sleep(0.1)
+        indexes = [self.store.ring.get_index(key) for key in self.keys]
+        # keys of the slow shard are missed
+        self.assertListEqual(self.store.cache_get_many(self.keys),
+                             [None if index == 0 else 'abc'[index] for index in indexes])
+        self.assertIsNone(self.store.cache_set_many({key: 1 for key in self.keys}, 1000))
+
+    def test_concurrent_fan_outs(self):
+        threads = 10
+        store = ShardedStore(self.shards, names=['a', 'b', 'c'], threads=threads)
+        store.timeout = 0.15
+        for shard in self.shards:
+            shard.get_many.side_effect = lambda keys: time.sleep(0.1) or [set() for _ in keys]
+        try:
+            with ThreadPoolExecutor(threads) as executor:
+                results = list(executor.map(lambda _: store.get_many(self.keys), range(threads)))
+        finally:
+            store.executor.shutdown()
+        # the calls of other requests waiting in the queue are not counted in the timeout of a shard
+        self.assertEqual(len(results), threads)
+
+    def test_healthy(self):
+        for shard in self.shards:
+            shard.healthy = True
+        self.assertTrue(self.store.healthy)
+        self.shards[1].healthy = False
+        self.assertFalse(self.store.healthy)
+
+
+class AsyncShardedStoreTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_fan_out(self):
+        shards = [make_async_shard('a'), make_async_shard('b')]
+        store = AsyncShardedStore(shards, names=['a', 'b'])
+        keys = [f'uid:{i}' for i in range(20)]
+        self.assertListEqual(await store.get_many(keys), [{'ab'[store.ring.get_index(key)], key} for key in keys])
+        self.assertListEqual(await store.cache_get_many(keys), ['ab'[store.ring.get_index(key)] for key in keys])
+        await store.cache_set_many({key: 1 for key in keys}, 1000)
+        for shard in shards:
+            shard.cache_set_many.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import fcntl
+import unittest
+from unittest.mock import patch
+
+from scoring_api.api import sharedcache
+from scoring_api.api.sharedcache import SharedCache
+from scoring_api.tests.helpers import wait_exit_code
+
+
+def run_in_child(func):
+    """Runs `func` in a forked process, returns its exit code."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            func()
+        finally:
+            os._exit(0)
+    return wait_exit_code(pid)
+
+
+class SharedCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = SharedCache(maxsize=16, ttl=10)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get('uid:a'))
+        self.cache.set('uid:a', b'1.5:100')
+        self.cache.set(b'i:1', {b'books', b'pets'})
+        self.assertEqual(self.cache.get('uid:a'), b'1.5:100')
+        self.assertEqual(self.cache.get(b'i:1'), {b'books', b'pets'})
+        self.cache.set(b'i:1', set())
+        self.assertEqual(self.cache.get(b'i:1'), set())
+        self.assertDictEqual(self.cache.stats(),
+                             {'size': 2, 'hits': 3, 'misses': 1, 'evictions': 0, 'hit_ratio': 0.75})
+
+    def test_group_eviction(self):
+        cache = SharedCache(maxsize=sharedcache.WAYS, ttl=10)
+        for i in range(sharedcache.WAYS):
+            cache.set(f'k{i}', b'v', ttl=i + 1)
+        cache.set('new', b'v')
+        self.assertIsNone(cache.get('k0'))
+        self.assertEqual(cache.get('new'), b'v')
+        self.assertEqual((cache.evictions, len(cache)), (1, sharedcache.WAYS))
+
+    @patch('scoring_api.api.sharedcache.monotonic')
+    def test_expiration(self, monotonic):
+        monotonic.return_value = 100
+        self.cache.set('foo', b'1')
+        self.cache.set('bar', b'2', ttl=1)
+        self.cache.set('baz', b'3', ttl=0)
+        monotonic.return_value = 105
+        self.assertIsNone(self.cache.get('bar'))
+        self.assertIsNone(self.cache.get('baz'))
+        self.assertEqual(self.cache.get('foo'), b'1')
+        monotonic.return_value = 111
+        self.assertIsNone(self.cache.get('foo'))
+
+    def test_too_big_value(self):
+        self.cache.set('foo', b'x' * sharedcache.SLOT_SIZE)
+        self.assertIsNone(self.cache.get('foo'))
+
+    def test_invalidate_and_clear(self):
+        self.cache.set('foo', b'1')
+        self.cache.set('bar', b'2')
+        generation = self.cache.generation
+        self.assertEqual(self.cache.invalidate(['foo']), 1)
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.set('foo', b'1', generation=generation)
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('bar'))
+        self.assertEqual(len(self.cache), 0)
+        self.cache.set('bar', b'3')
+        self.assertEqual(self.cache.get('bar'), b'3')
+
+    def test_shared_by_forked_processes(self):
+        self.cache.set('parent', b'1')
+        code = run_in_child(lambda: self.cache.get('parent') == b'1' and self.cache.set('child', b'2'))
+        self.assertEqual(code, 0)
+        self.assertEqual(self.cache.get('child'), b'2')
+
+    def test_crashed_writer(self):
+        self.cache.set('foo', b'1')
+        index, slots = self.cache._slots(sharedcache.zlib.crc32(b'foo'))
+
+        def crash_in_write():
+            fcntl.lockf(self.cache._lock_file.fileno(), fcntl.LOCK_EX, 1, index + 1)
+            for offset in slots:
+                sharedcache.SEQUENCE.pack_into(self.cache._buf, offset, 1)
+            os._exit(1)
+
+        self.assertEqual(run_in_child(crash_in_write), 1)
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.set('foo', b'2')
+        self.assertEqual(self.cache.get('foo'), b'2')
+
+
+if __name__ == '__main__':
+    unittest.main()
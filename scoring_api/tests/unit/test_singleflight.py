@@ -0,0 +1,93 @@
+import time
+import asyncio
+import threading
+import unittest
+from unittest.mock import Mock
+from concurrent.futures import ThreadPoolExecutor
+
+from scoring_api.api.singleflight import SingleFlight, AsyncSingleFlight
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.counter = Mock()
+        self.flight = SingleFlight(self.counter)
+        self.calls = 0
+        self.started = threading.Event()
+
+    def slow(self, value):
+        self.calls += 1
+        self.started.set()
+        time.sleep(0.1)
+        return value
+
+    def test_concurrent_calls_coalesced(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(self.flight.do, 'key', self.slow, 1)
+            self.started.wait()
+            followers = [executor.submit(self.flight.do, 'key', self.slow, 2) for _ in range(3)]
+            results = [leader.result()] + [f.result() for f in followers]
+        self.assertListEqual(results, [1, 1, 1, 1])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.counter.inc.call_count, 3)
+
+    def test_different_keys(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(lambda k: self.flight.do(k, self.slow, k), ['a', 'b']))
+        self.assertListEqual(results, ['a', 'b'])
+        self.assertEqual(self.calls, 2)
+
+    def test_sequential_calls_not_coalesced(self):
+        self.assertEqual(self.flight.do('key', self.slow, 1), 1)
+        self.assertEqual(self.flight.do('key', self.slow, 2), 2)
+        self.counter.inc.assert_not_called()
+
+    def test_error_shared(self):
+        def fail():
+            self.started.set()
+            time.sleep(0.1)
+            raise ValueError('boom')
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(self.flight.do, 'key', fail)
+            self.started.wait()
+            follower = executor.submit(self.flight.do, 'key', fail)
+            for future in (leader, follower):
+                with self.assertRaises(ValueError):
+                    future.result()
+        self.assertEqual(self.flight.do('key', self.slow, 3), 3)
+
+
+class AsyncSingleFlightTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_coalesced(self):
+        counter = Mock()
+        flight = AsyncSingleFlight(counter)
+        calls = []
+
+        async def slow(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return value
+
+        results = await asyncio.gather(*(flight.do('key', slow, i) for i in range(5)))
+        self.assertListEqual(results, [0] * 5)
+        self.assertListEqual(calls, [0])
+        self.assertEqual(counter.inc.call_count, 4)
+        self.assertEqual(await flight.do('key', slow, 7), 7)
+
+    async def test_cancelled_caller(self):
+        flight = AsyncSingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return 1
+
+        leader = asyncio.ensure_future(flight.do('key', slow))
+        follower = asyncio.ensure_future(flight.do('key', slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        self.assertEqual(await follower, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
+import time
 import unittest
-from scoring_api.api.store import RedisStore
-from unittest.mock import Mock, patch
+from scoring_api.api.store import RedisStore, AsyncRedisStore, CircuitBreaker
+from scoring_api.api.cache import LRUCache
+from unittest.mock import Mock, AsyncMock, patch
 from redis.exceptions import TimeoutError, ConnectionError
 from scoring_api.api.exceptions import StoreConnectionError
 
@@ -28,6 +30,245 @@ class StoreTestCase(unittest.TestCase):
         self.assertIsNone(self.storage.cache_get('key'))
         self.assertIsNone(self.storage.cache_set('key', 'value', expire_ms=0))
 
+    @patch('scoring_api.api.store.RETRY_DELAY', 0)
+    @patch('scoring_api.api.store.RETRY_COUNT', 1)
+    def test_cache_many_connection_error(self):
+        self.storage.conn.mget = Mock(side_effect=ConnectionError)
+        self.assertListEqual(self.storage.cache_get_many(['key1', 'key2']), [None, None])
+
+
+class StoreBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = RedisStore(chunk_size=2)
+        self.pipelines = []
+
+        def pipeline(transaction=True):
+            pipe = Mock()
+            pipe.execute.side_effect = lambda: [{c.args[0]} for c in pipe.smembers.call_args_list]
+            self.pipelines.append(pipe)
+            return pipe
+
+        self.storage.conn = Mock(pipeline=Mock(side_effect=pipeline))
+
+    def test_get_many_chunks(self):
+        keys = [b'i:1', b'i:2', b'i:3', b'i:4', b'i:5']
+        self.assertListEqual(self.storage.get_many(keys), [{key} for key in keys])
+        self.assertEqual(len(self.pipelines), 3)
+
+    def test_get_many_empty(self):
+        self.assertListEqual(self.storage.get_many([]), [])
+        self.assertEqual(len(self.pipelines), 0)
+
+
+class StoreLocalCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = RedisStore(local_cache=LRUCache(maxsize=10, ttl=60))
+        self.pipe = Mock(execute=Mock(return_value=[[b'1.5', None], 5000, -2]))
+        self.storage.conn = Mock(pipeline=Mock(return_value=self.pipe), set=Mock(return_value=True))
+
+    def test_cache_get_fills_local_tier(self):
+        self.assertListEqual(self.storage.cache_get_many(['foo', 'bar']), [b'1.5', None])
+        self.assertEqual(self.storage.cache_get('foo'), b'1.5')
+        self.assertEqual(self.storage.conn.pipeline.call_count, 1)
+        self.assertEqual(self.storage.local_cache.hits, 1)
+
+    @patch('scoring_api.api.cache.monotonic')
+    def test_local_tier_expiry(self, monotonic):
+        monotonic.return_value = 100
+        # foo has no expiration, bar expires between MGET and PTTL
+        self.pipe.execute.return_value = [[b'1.5', b'2.5', b'3.5'], -1, -2, 5000]
+        self.assertListEqual(self.storage.cache_get_many(['foo', 'bar', 'baz']), [b'1.5', b'2.5', b'3.5'])
+        self.assertIsNone(self.storage.local_cache.get('bar'))
+        monotonic.return_value = 106
+        self.assertEqual(self.storage.local_cache.get('foo'), b'1.5')
+        self.assertIsNone(self.storage.local_cache.get('baz'))
+
+    def test_cache_set_respects_expiry(self):
+        self.storage.cache_set('foo', 3.0, expire_ms=0)
+        self.assertIsNone(self.storage.local_cache.get('foo'))
+        self.storage.cache_set('foo', 3.0, expire_ms=1000)
+        self.assertEqual(self.storage.cache_get('foo'), b'3.0')
+        self.storage.conn.pipeline.assert_not_called()
+
+    @patch('scoring_api.api.store.RETRY_DELAY', 0)
+    @patch('scoring_api.api.store.RETRY_COUNT', 1)
+    def test_cache_get_while_store_unavailable(self):
+        self.storage.conn.set = Mock(side_effect=ConnectionError)
+        self.assertIsNone(self.storage.cache_set('foo', 3.0, expire_ms=1000))
+        self.assertEqual(self.storage.cache_get('foo'), b'3.0')
+
+
+class AsyncStoreTestCase(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.storage = AsyncRedisStore()
+        self.storage.conn = Mock(
+            smembers=AsyncMock(side_effect=ConnectionError),
+            get=AsyncMock(side_effect=[TimeoutError, b'1.5']),
+            set=AsyncMock(side_effect=TimeoutError),
+        )
+
+    @patch('scoring_api.api.store.RETRY_DELAY', 0)
+    async def test_storage_connection_error(self):
+        with self.assertRaises(StoreConnectionError):
+            await self.storage.get('key')
+        self.assertEqual(self.storage.conn.smembers.await_count, 3)
+
+    @patch('scoring_api.api.store.RETRY_DELAY', 0)
+    async def test_cache_retry(self):
+        self.assertEqual(await self.storage.cache_get('key'), b'1.5')
+        self.assertIsNone(await self.storage.cache_set('key', 'value', expire_ms=0))
+
+
+class StoreInterestCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = RedisStore(interest_cache=LRUCache(maxsize=10, ttl=10))
+        self.pipelines = []
+
+        def pipeline(transaction=True):
+            pipe = Mock()
+            pipe.execute.side_effect = lambda: [{c.args[0]} for c in pipe.smembers.call_args_list]
+            self.pipelines.append(pipe)
+            return pipe
+
+        self.storage.conn = Mock(pipeline=Mock(side_effect=pipeline))
+
+    def test_get_many_cached(self):
+        self.assertListEqual(self.storage.get_many([b'i:1', b'i:2']), [{b'i:1'}, {b'i:2'}])
+        self.assertListEqual(self.storage.get_many([b'i:2', b'i:3']), [{b'i:2'}, {b'i:3'}])
+        self.assertEqual(self.storage.get(b'i:1'), {b'i:1'})
+        self.assertEqual(len(self.pipelines), 2)
+        self.assertListEqual([c.args[0] for c in self.pipelines[1].smembers.call_args_list], [b'i:3'])
+
+    def test_changed_while_read_not_cached(self):
+        def execute():
+            # the set is changed in Redis while the old value is on the way
+            self.storage.interest_cache.invalidate([b'i:1'])
+            return [{b'old'}]
+
+        self.storage.conn = Mock(pipeline=Mock(return_value=Mock(execute=Mock(side_effect=execute))))
+        self.assertListEqual(self.storage.get_many([b'i:1']), [{b'old'}])
+        self.assertIsNone(self.storage.interest_cache.get(b'i:1'))
+
+    def test_warm_pool(self):
+        connections = [Mock(), Mock()]
+        pool = Mock(get_connection=Mock(side_effect=connections))
+        self.storage.conn = Mock(connection_pool=pool)
+        self.storage.warm_pool(2)
+        self.assertListEqual([c.args[0] for c in pool.release.call_args_list], connections)
+
+
+class StoreReplicasTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = RedisStore(replicas=[{'host': 'replica1'}, {'host': 'replica2'}], socket_connect_timeout=3)
+        self.storage.conn = Mock(get=Mock(return_value=b'primary'), set=Mock(return_value=True))
+        self.storage.replica_conns = [
+            Mock(get=Mock(return_value=b'replica'), smembers=Mock(return_value={b'books'}))
+            for _ in self.storage.replicas
+        ]
+
+    def test_replica_args(self):
+        self.assertListEqual(self.storage.replicas, [{'host': 'replica1', 'socket_connect_timeout': 3},
+                                                     {'host': 'replica2', 'socket_connect_timeout': 3}])
+
+    def test_reads_from_replicas(self):
+        for _ in range(10):
+            self.assertEqual(self.storage.cache_get('key'), b'replica')
+            self.assertEqual(self.storage.get('key'), {b'books'})
+        self.storage.conn.get.assert_not_called()
+
+    def test_changed_interests_read_from_primary(self):
+        self.storage.interest_cache = LRUCache()
+        self.storage.invalidation_listener = Mock(changed_recently=Mock(side_effect=lambda key: key == b'i:2'))
+        pipe = Mock(execute=Mock(return_value=[{b'new'}, {b'new'}]))
+        self.storage.conn.pipeline = Mock(return_value=pipe)
+        self.assertListEqual(self.storage.get_many([b'i:1', b'i:2']), [{b'new'}, {b'new'}])
+        self.assertListEqual([c.args[0] for c in pipe.smembers.call_args_list], [b'i:1', b'i:2'])
+        for conn in self.storage.replica_conns:
+            conn.pipeline.assert_not_called()
+
+    def test_writes_to_primary(self):
+        self.assertTrue(self.storage.cache_set('key', 1, 1000))
+        self.storage.conn.set.assert_called_once_with('key', 1, px=1000)
+        for conn in self.storage.replica_conns:
+            conn.set.assert_not_called()
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=5)
+        self.storage = RedisStore(breaker=self.breaker)
+        self.storage.conn = Mock(
+            smembers=Mock(side_effect=ConnectionError),
+            get=Mock(side_effect=ConnectionError),
+            set=Mock(side_effect=ConnectionError),
+        )
+
+    @patch('scoring_api.api.store.monotonic')
+    def test_states(self, monotonic):
+        monotonic.return_value = 100
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        monotonic.return_value = 105
+        # only one probe is let through
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        monotonic.return_value = 110
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_healthy(self):
+        self.assertTrue(self.storage.healthy)
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertFalse(self.storage.healthy)
+        self.breaker.record_success()
+        self.storage.close()
+        self.assertFalse(self.storage.healthy)
+        self.assertIsNone(self.storage.conn)
+
+    @patch('scoring_api.api.store.RETRY_DELAY', 0)
+    def test_fail_fast(self):
+        with self.assertRaises(StoreConnectionError):
+            self.storage.get('key')
+        # retries stop as soon as the circuit opens
+        self.assertEqual(self.storage.conn.smembers.call_count, 2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(StoreConnectionError):
+            self.storage.get('key')
+        self.assertIsNone(self.storage.cache_get('key'))
+        self.assertIsNone(self.storage.cache_set('key', 'value', expire_ms=1000))
+        self.assertListEqual(self.storage.cache_get_many(['key1', 'key2']), [None, None])
+        self.assertEqual(self.storage.conn.smembers.call_count, 2)
+        self.storage.conn.get.assert_not_called()
+        self.storage.conn.set.assert_not_called()
+
+    @patch('scoring_api.api.store.RETRY_DEADLINE', 0.1)
+    @patch('scoring_api.api.store.RETRY_MAX_DELAY', 0.05)
+    @patch('scoring_api.api.store.RETRY_DELAY', 0.01)
+    @patch('scoring_api.api.store.RETRY_COUNT', 1000)
+    def test_backoff_deadline(self):
+        self.breaker.failure_threshold = 1000
+        started = time.monotonic()
+        self.assertIsNone(self.storage.cache_get('key'))
+        self.assertLess(time.monotonic() - started, 0.15)
+        self.assertLess(self.storage.conn.get.call_count, 1000)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import Mock, MagicMock, patch
+
+from redis.exceptions import WatchError
+
+from scoring_api.api import scoring, vocabulary
+from scoring_api.api.exceptions import StoreConnectionError
+from scoring_api.api.vocabulary import Vocabulary, VOCABULARY_KEY
+
+
+class VocabularyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.vocabulary = Vocabulary(VOCABULARY_KEY)
+        self.store = Mock(get_hash=Mock(return_value={b'1': b'books', b'2': b'hi-tech'}))
+
+    def test_names_interned(self):
+        first, = Vocabulary().decode([bytes(b'pets')])
+        second, = Vocabulary().decode([bytes(b'pets')])
+        self.assertEqual(first, 'pets')
+        self.assertIs(first, second)
+
+    def test_names_only(self):
+        self.assertListEqual(Vocabulary().decode([b'1', b'books']), ['1', 'books'])
+
+    def test_ids_and_names(self):
+        self.assertTrue(self.vocabulary.load(self.store))
+        self.store.get_hash.assert_called_once_with(VOCABULARY_KEY)
+        names = self.vocabulary.decode([b'1', b'books', b'2'])
+        self.assertListEqual(names, ['books', 'books', 'hi-tech'])
+        self.assertIs(names[0], names[1])
+        self.assertFalse(self.vocabulary.unknown)
+
+    def test_unknown_id(self):
+        self.assertListEqual(self.vocabulary.decode([b'3']), ['3'])
+        self.assertTrue(self.vocabulary.unknown)
+        self.vocabulary.update({b'3': b'pets'})
+        self.assertListEqual(self.vocabulary.decode([b'3']), ['pets'])
+        self.assertFalse(self.vocabulary.unknown)
+
+    @patch('scoring_api.api.vocabulary.monotonic')
+    def test_reload_interval(self, monotonic):
+        monotonic.return_value = 100
+        self.assertTrue(self.vocabulary.reload_due())
+        self.vocabulary.load(self.store)
+        self.assertFalse(self.vocabulary.reload_due())
+        monotonic.return_value = 100 + vocabulary.RELOAD_INTERVAL
+        self.assertTrue(self.vocabulary.reload_due())
+        self.assertFalse(Vocabulary().reload_due())
+
+    def test_store_error(self):
+        self.store.get_hash.side_effect = StoreConnectionError
+        self.assertFalse(self.vocabulary.load(self.store))
+        self.assertListEqual(self.vocabulary.decode([b'1']), ['1'])
+
+    @patch('scoring_api.api.vocabulary.MAX_NAMES', 1)
+    def test_max_names(self):
+        self.assertListEqual(self.vocabulary.decode([b'books', b'pets']), ['books', 'pets'])
+        self.assertListEqual(list(self.vocabulary.names), [b'books'])
+
+
+class InterestsDecodingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Mock(get_many=Mock(return_value=[{b'1'}, {b'2', b'pets'}, set()]),
+                          get_hash=Mock(return_value={b'1': b'books', b'2': b'hi-tech'}))
+
+    def tearDown(self):
+        scoring.vocabulary = Vocabulary()
+
+    def test_new_ids_reload_vocabulary(self):
+        scoring.vocabulary = Vocabulary(VOCABULARY_KEY)
+        result = scoring.get_interests_many(self.store, [1, 2, 3])
+        self.assertListEqual([sorted(names) for names in result], [['books'], ['hi-tech', 'pets'], []])
+        scoring.get_interests_many(self.store, [1, 2, 3])
+        self.store.get_hash.assert_called_once()
+
+    def test_ids_kept_without_vocabulary(self):
+        self.assertListEqual(scoring.get_interests_many(self.store, [1])[0], ['1'])
+        self.store.get_hash.assert_not_called()
+
+
+class CompactTestCase(unittest.TestCase):
+    def test_compact(self):
+        sets = {b'i:1': {b'books', b'2'}, b'i:2': {b'2'}, b'i:3': {b'pets', b'books'}}
+        pipe = MagicMock(smembers=Mock(side_effect=lambda key: sets[key]))
+        pipe.__enter__.return_value = pipe
+
+        def execute():
+            if pipe.srem.call_args.args[0] == b'i:3' and b'pets' in sets[b'i:3']:
+                # pets is removed from the set after it is read, the rewrite is retried
+                sets[b'i:3'] = {b'books'}
+                raise WatchError
+            return [1, 1]
+
+        pipe.execute.side_effect = execute
+        conn = Mock(hgetall=Mock(return_value={b'1': b'books', b'2': b'hi-tech'}),
+                    scan_iter=Mock(return_value=list(sets)), incr=Mock(return_value=3),
+                    pipeline=Mock(return_value=pipe))
+        self.assertEqual(vocabulary.compact(conn), 2)
+        conn.scan_iter.assert_called_once_with(match=b'i:*', count=vocabulary.SCAN_COUNT, _type='set')
+        conn.hset.assert_called_once_with(VOCABULARY_KEY, b'3', b'pets')
+        conn.pipeline.assert_called_with(transaction=True)
+        self.assertListEqual([c.args[0] for c in pipe.watch.call_args_list], [b'i:1', b'i:2', b'i:3', b'i:3'])
+        self.assertEqual(pipe.execute.call_count, 3)
+        added = [(c.args[0], set(c.args[1:])) for c in pipe.sadd.call_args_list]
+        self.assertListEqual(added, [(b'i:1', {b'1'}), (b'i:3', {b'1', b'3'}), (b'i:3', {b'1'})])
+        removed = {c.args[0]: set(c.args[1:]) for c in pipe.srem.call_args_list}
+        self.assertDictEqual(removed, {b'i:1': {b'books'}, b'i:3': {b'books'}})
+
+
+if __name__ == '__main__':
+    unittest.main()
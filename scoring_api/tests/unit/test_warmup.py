@@ -0,0 +1,93 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from scoring_api.api import scoring, warmup
+from scoring_api.api.exceptions import StoreConnectionError
+
+
+class HotKeysTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'hot_keys')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        scoring.hot_keys = None
+
+    def test_recent_keys(self):
+        hot_keys = warmup.HotKeys(maxsize=3)
+        hot_keys.add([1, 2, 'uid:a'])
+        hot_keys.add([1, 3])
+        self.assertListEqual(hot_keys.snapshot(), [3, 1, 'uid:a'])
+
+    def test_dump_and_read(self):
+        hot_keys = warmup.HotKeys()
+        hot_keys.add([1, 'uid:a', 2])
+        hot_keys.dump(self.path)
+        with open(self.path, 'a') as f:
+            f.write('garbage\n\n')
+        self.assertEqual(warmup.read_keys(self.path), ([2, 1], ['uid:a']))
+        self.assertListEqual(os.listdir(self.dir), ['hot_keys'])
+
+    def test_binary_score_keys(self):
+        key = scoring.get_score_key("79175002040")
+        hot_keys = warmup.HotKeys()
+        hot_keys.add([key, 'uid:a', 1])
+        hot_keys.dump(self.path)
+        with open(self.path, 'a') as f:
+            f.write('u:not-hex\n')
+        self.assertEqual(warmup.read_keys(self.path), ([1], ['uid:a', key]))
+
+    def test_tracking(self):
+        hot_keys = warmup.track()
+        store = Mock(get_many=Mock(side_effect=lambda keys: [set()] * len(keys)),
+                     cache_get=Mock(return_value=None))
+        scoring.get_interests_many(store, [1, 2])
+        scoring.get_score(store, "79175002040", "a@b.ru")
+        self.assertListEqual(hot_keys.snapshot(), [scoring.get_score_key("79175002040"), 2, 1])
+
+    def test_snapshot_writer(self):
+        hot_keys = warmup.HotKeys()
+        writer = warmup.SnapshotWriter(hot_keys, self.path, 0.01)
+        writer.start()
+        time.sleep(0.05)
+        self.assertFalse(os.path.exists(self.path))
+        hot_keys.add([7])
+        time.sleep(0.05)
+        writer.stop()
+        writer.join()
+        self.assertEqual(warmup.read_keys(self.path), ([7], []))
+
+
+class WarmUpTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('1\n2\nuid:a\n')
+        self.store = Mock(get_many=Mock(side_effect=lambda keys: [set()] * len(keys)),
+                          cache_get_many=Mock(side_effect=lambda keys: [None] * len(keys)))
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_warm_up(self):
+        self.assertEqual(warmup.warm_up(self.store, self.path), (2, 1))
+        self.store.get_many.assert_called_once_with([b'i:1', b'i:2'])
+        self.store.cache_get_many.assert_called_once_with(['uid:a'])
+
+    def test_missing_file(self):
+        self.assertEqual(warmup.warm_up(self.store, self.path + '.missing'), (0, 0))
+        self.store.get_many.assert_not_called()
+
+    def test_store_error(self):
+        self.store.get_many.side_effect = StoreConnectionError
+        self.assertEqual(warmup.warm_up(self.store, self.path), (2, 1))
+        self.store.cache_get_many.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()